@@ -4,15 +4,21 @@ from google.adk import Agent
 from google.genai import types
 from .prompt import SYSTEM_PROMPT
 
+try:
+    from ..tracing import traced_tool, trace_headers
+except ImportError:  # loaded as a top-level package (adk web with agents/ on sys.path)
+    from tracing import traced_tool, trace_headers
+
 
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000/api/v1")
 MODEL_NAME = os.getenv("ADK_RUNTIME_MODEL", "gemini-2.0-flash")
 
 
 def _auth_headers(id_token: str):
-    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json"}
+    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json", **trace_headers()}
 
 
+@traced_tool
 def reserve_items(itinerary_id: str, items: list[dict], id_token: str, hold_ttl_minutes: int | None = None, idempotency_key: str | None = None):
     url = f"{BACKEND_BASE_URL}/trips/{itinerary_id}/reserve"
     payload = {"items": items, "hold_ttl_minutes": hold_ttl_minutes, "idempotency_key": idempotency_key}
@@ -21,6 +27,7 @@ def reserve_items(itinerary_id: str, items: list[dict], id_token: str, hold_ttl_
     return r.json()
 
 
+@traced_tool
 def create_checkout(reservation_id: str, amount: float, currency: str, id_token: str):
     url = f"{BACKEND_BASE_URL}/payments/checkout"
     payload = {"reservation_id": reservation_id, "amount": amount, "currency": currency}
@@ -29,6 +36,7 @@ def create_checkout(reservation_id: str, amount: float, currency: str, id_token:
     return r.json()
 
 
+@traced_tool
 def finalize_booking(itinerary_id: str, reservation_id: str, payment_id: str, id_token: str):
     url = f"{BACKEND_BASE_URL}/trips/{itinerary_id}/book"
     params = {"reservation_id": reservation_id, "payment_id": payment_id}
@@ -1,6 +1,6 @@
 """
 Itinerary Planner Agent (ADK) - no custom business logic.
-Wraps backend endpoints to create and fetch itineraries.
+Wraps backend endpoints to create, track and fetch itineraries.
 """
 import os
 import requests
@@ -8,15 +8,21 @@ from google.adk import Agent
 from google.genai import types
 from .prompt import SYSTEM_PROMPT
 
+try:
+    from ..tracing import traced_tool, trace_headers
+except ImportError:  # loaded as a top-level package (adk web with agents/ on sys.path)
+    from tracing import traced_tool, trace_headers
+
 
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000/api/v1")
 MODEL_NAME = os.getenv("ADK_RUNTIME_MODEL", "gemini-2.0-flash")
 
 
 def _auth_headers(id_token: str):
-    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json"}
+    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json", **trace_headers()}
 
 
+@traced_tool
 def generate_itinerary(
     destination: str,
     id_token: str,
@@ -46,6 +52,15 @@ def generate_itinerary(
     return r.json()
 
 
+@traced_tool
+def get_generation_status(job_id: str, id_token: str):
+    url = f"{BACKEND_BASE_URL}/trips/jobs/{job_id}"
+    r = requests.get(url, headers=_auth_headers(id_token), timeout=20)
+    r.raise_for_status()
+    return r.json()
+
+
+@traced_tool
 def fetch_itinerary(itinerary_id: str, id_token: str):
     url = f"{BACKEND_BASE_URL}/trips/{itinerary_id}"
     r = requests.get(url, headers=_auth_headers(id_token), timeout=20)
@@ -58,7 +73,7 @@ itinerary_planner = Agent(
     model=MODEL_NAME,
     description="Generates initial itineraries and fetches them from backend.",
     instruction=SYSTEM_PROMPT,
-    tools=[generate_itinerary, fetch_itinerary],
+    tools=[generate_itinerary, get_generation_status, fetch_itinerary],
     generate_content_config=types.GenerateContentConfig(
         safety_settings=[
             types.SafetySetting(
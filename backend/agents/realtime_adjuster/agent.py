@@ -4,15 +4,21 @@ from google.adk import Agent
 from google.genai import types
 from .prompt import SYSTEM_PROMPT
 
+try:
+    from ..tracing import traced_tool, trace_headers
+except ImportError:  # loaded as a top-level package (adk web with agents/ on sys.path)
+    from tracing import traced_tool, trace_headers
+
 
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000/api/v1")
 MODEL_NAME = os.getenv("ADK_RUNTIME_MODEL", "gemini-2.0-flash")
 
 
 def _auth_headers(id_token: str):
-    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json"}
+    return {"Authorization": f"Bearer {id_token}", "Content-Type": "application/json", **trace_headers()}
 
 
+@traced_tool
 def get_weather(itinerary_id: str, id_token: str):
     url = f"{BACKEND_BASE_URL}/trips/{itinerary_id}/weather"
     r = requests.get(url, headers=_auth_headers(id_token), timeout=20)
@@ -20,6 +26,7 @@ def get_weather(itinerary_id: str, id_token: str):
     return r.json()
 
 
+@traced_tool
 def apply_customizations(itinerary_id: str, actions: list[dict], id_token: str):
     url = f"{BACKEND_BASE_URL}/trips/{itinerary_id}/customize"
     payload = {"actions": actions}
@@ -0,0 +1,68 @@
+"""
+Agent-side tracing for tool calls.
+
+Each tool call opens a root span and sends its W3C `traceparent` to the backend,
+so API, Firestore and provider spans join the same trace. Spans go through the
+backend's exporter (core.tracing: TRACING_EXPORTER=console|file, TRACING_FILE).
+"""
+import functools
+import os
+import secrets
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+try:
+    from core import tracing
+except ImportError:  # adk web with only agents/ on sys.path: core/ lives next to it
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from core import tracing
+
+SERVICE_NAME = os.getenv("TRACING_AGENT_SERVICE_NAME", "travelai-agents")
+
+_current = ContextVar("agent_tool_span", default=None)
+
+
+def trace_headers():
+    """traceparent header for the tool call in progress (empty outside a traced tool)."""
+    span = _current.get()
+    if span is None:
+        return {}
+    return {"traceparent": f"00-{span['trace_id']}-{span['span_id']}-01"}
+
+
+def traced_tool(fn):
+    """Wrap an agent tool so its backend requests carry a traceparent and its duration is exported."""
+    if not tracing.enabled():
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        parent = _current.get()
+        span = {
+            "service": SERVICE_NAME,
+            "trace_id": parent["trace_id"] if parent else secrets.token_hex(16),
+            "span_id": secrets.token_hex(8),
+            "parent_id": parent["span_id"] if parent else None,
+            "name": f"tool {fn.__name__}",
+            "kind": "client",
+            "start": datetime.now(timezone.utc).isoformat(),
+            "status": "ok",
+            "error": None,
+            "attributes": {"tool": fn.__name__},
+        }
+        token = _current.set(span)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            span["status"] = "error"
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            span["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            tracing.export(span)
+
+    return wrapper
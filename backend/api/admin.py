@@ -0,0 +1,193 @@
+# api/admin.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import time
+
+from api.authentication import require_admin
+from core.profiler import PROFILER
+from core.circuit_breaker import breaker_status
+from core import search, cdc, analytics, pricing
+from api import alert_engine
+from api.hidden_gems import backfill_geohashes
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+class ProfilerSettings(BaseModel):
+    enabled: Optional[bool] = None
+    slow_threshold_ms: Optional[float] = None
+    reset: bool = False
+
+
+# -----------------------------
+# Profiler
+# -----------------------------
+@router.get("/profiler")
+async def profiler_status():
+    """Profiler settings, sample counts and the most recent slow requests / loop stalls."""
+    return PROFILER.status()
+
+
+@router.post("/profiler")
+async def update_profiler(body: ProfilerSettings):
+    """Turn request sampling on or off, change the slow threshold, or clear collected stacks."""
+    if body.slow_threshold_ms is not None:
+        if body.slow_threshold_ms <= 0:
+            raise HTTPException(status_code=400, detail="slow_threshold_ms must be positive")
+        PROFILER.slow_threshold = body.slow_threshold_ms / 1000.0
+    if body.enabled is not None:
+        PROFILER.enabled = body.enabled
+    if body.reset:
+        PROFILER.reset()
+    return PROFILER.status()
+
+
+@router.get("/profiler/stacks", response_class=PlainTextResponse)
+async def profiler_stacks(kind: str = Query("slow", pattern="^(slow|blocked)$")):
+    """
+    Collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl or speedscope.
+    kind=slow: samples from requests over the slow threshold, rooted at the route.
+    kind=blocked: samples taken while the event loop was stalled.
+    """
+    table = PROFILER.slow_stacks if kind == "slow" else PROFILER.blocked_stacks
+    return PlainTextResponse(table.render())
+
+
+# -----------------------------
+# Providers
+# -----------------------------
+@router.get("/providers")
+async def provider_status():
+    """Circuit breaker state per upstream provider."""
+    return {"circuits": breaker_status()}
+
+
+# -----------------------------
+# Weather alerts
+# -----------------------------
+@router.get("/weather_alerts")
+async def weather_alert_status():
+    """Summary of the last alert engine run in this worker (null before the first run)."""
+    return {"interval_minutes": alert_engine.WEATHER_ALERTS_INTERVAL_MINUTES, "last_run": alert_engine.last_run}
+
+
+@router.post("/weather_alerts/run")
+async def run_weather_alerts():
+    """Run the alert engine now over every upcoming/ongoing itinerary and return its summary."""
+    return await alert_engine.run_alert_engine()
+
+
+# -----------------------------
+# Hidden gems
+# -----------------------------
+@router.post("/hidden_gems/reindex")
+async def reindex_hidden_gems():
+    """Add the geohash used by near= queries to gems submitted before it was stored."""
+    return {"updated": await asyncio.to_thread(backfill_geohashes)}
+
+
+# -----------------------------
+# FX rates
+# -----------------------------
+@router.get("/fx")
+async def fx_status():
+    """Source, date and currencies of the FX table used to price reservations."""
+    return await asyncio.to_thread(pricing.status)
+
+
+@router.post("/fx/refresh")
+async def refresh_fx():
+    """Re-fetch the FX table from FX_RATES_URL (or re-read FX_RATES_FILE) now."""
+    if not await pricing.refresh():
+        raise HTTPException(status_code=502, detail="FX rate refresh failed; keeping the current table")
+    return await asyncio.to_thread(pricing.status)
+
+
+# -----------------------------
+# Change-data capture
+# -----------------------------
+@router.get("/cdc")
+async def cdc_status():
+    """CDC sink location and format, events waiting in this worker's journal and the last compaction."""
+    return cdc.status()
+
+
+@router.post("/cdc/flush")
+async def flush_cdc():
+    """Compact every ready CDC journal into columnar segments now."""
+    return await asyncio.to_thread(cdc.flush)
+
+
+# -----------------------------
+# Analytics
+# -----------------------------
+async def _report(metric, **params):
+    """Refresh the snapshots if due, then compute (or reuse) an aggregate off the event loop."""
+    started = time.perf_counter()
+
+    def run():
+        analytics.refresh()
+        return metric(**params)
+
+    result = await asyncio.to_thread(run)
+    return {**params, "result": result, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+@router.get("/analytics")
+async def analytics_status():
+    """Snapshot sizes and freshness of the analytics module."""
+    return await asyncio.to_thread(analytics.status)
+
+
+@router.get("/analytics/bookings_daily")
+async def analytics_bookings_daily(days: int = Query(30, ge=0, le=3660)):
+    """Bookings, cancellations and GMV per day and currency (days=0: all time)."""
+    return await _report(analytics.bookings_daily, days=days)
+
+
+@router.get("/analytics/gmv")
+async def analytics_gmv(days: int = Query(30, ge=0, le=3660), limit: int = Query(50, ge=1, le=500)):
+    """GMV by itinerary destination and currency, largest first."""
+    return await _report(analytics.gmv_by_destination, days=days, limit=limit)
+
+
+@router.get("/analytics/conversion")
+async def analytics_conversion(days: int = Query(30, ge=0, le=3660)):
+    """Reservation-to-booking conversion, overall and per day."""
+    return await _report(analytics.reservation_conversion, days=days)
+
+
+@router.get("/analytics/holds")
+async def analytics_holds(days: int = Query(30, ge=0, le=3660)):
+    """Outcomes of reservation holds and the share that expired unpaid."""
+    return await _report(analytics.hold_expiry, days=days)
+
+
+@router.post("/analytics/refresh")
+async def refresh_analytics():
+    """Compact this worker's CDC journal and read every new segment now."""
+    await asyncio.to_thread(cdc.flush)
+    return {"segments_read": await asyncio.to_thread(analytics.refresh, True)}
+
+
+@router.post("/analytics/backfill")
+async def backfill_analytics():
+    """Load documents written before CDC was enabled (streams the four collections once)."""
+    counts = await asyncio.to_thread(analytics.backfill)
+    await asyncio.to_thread(analytics.refresh, True)
+    return {"captured": counts}
+
+
+# -----------------------------
+# Search
+# -----------------------------
+@router.post("/search/reindex")
+async def reindex_search():
+    """Rebuild the local search index from the itineraries, comments and hidden_gems collections."""
+    try:
+        return {"indexed": await asyncio.to_thread(search.rebuild)}
+    except search.SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Search index unavailable: {e}")
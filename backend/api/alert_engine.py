@@ -0,0 +1,304 @@
+# api/alert_engine.py
+"""
+Scheduled weather-alert engine.
+
+One run loads every upcoming/ongoing itinerary, groups their days by weather
+cell (api.trips.weather_cell, the grid the per-day trip weather uses) and
+fetches each cell's daily forecast once through fetch_weather_for_latlng and
+the shared weather cache, so a single OpenWeather call serves every trip in the
+same area. Rules are evaluated per cell over the forecast columns (pop,
+temp.min, temp.max) - NumPy arrays and comparisons when numpy is installed
+(pip install .[analytics]), plain lists otherwise - and each trip day picks up
+the hits for its date. Alerts
+are written in Firestore batches under deterministic ids
+(auto_<itinerary>_<date>_<rule>), so re-runs and concurrent runs overwrite
+rather than duplicate. The engine's stored alerts for the evaluated trips are
+read back at the start of a run, and one whose condition cleared is deleted.
+
+Itineraries are read with a projection of the summary fields the engine uses,
+not the whole document (booking options, cached weather).
+
+Enable the background loop with WEATHER_ALERTS_INTERVAL_MINUTES > 0; every worker
+runs the loop, but each interval only the worker that creates that interval's
+job_leases/weather_alerts_<slot> document evaluates, so a fleet makes one run per
+interval. POST /api/admin/weather_alerts/run runs immediately without the lease.
+"""
+from datetime import date, datetime, timedelta
+from uuid import uuid4
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from fastapi import HTTPException
+
+from core.firebase import get_db
+from core.metrics import REGISTRY
+from core.queries import query as registered_query
+from api.trips import fetch_weather_for_latlng, itinerary_center, day_locations, weather_cell
+
+try:
+    import numpy
+except ImportError:  # optional: pip install .[analytics]
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+WEATHER_ALERTS_INTERVAL_MINUTES = float(os.getenv("WEATHER_ALERTS_INTERVAL_MINUTES", "0"))  # 0 disables the loop
+ALERT_POP_THRESHOLD = float(os.getenv("ALERT_POP_THRESHOLD", "0.6"))
+ALERT_POP_HIGH = float(os.getenv("ALERT_POP_HIGH", "0.85"))
+ALERT_HEAT_C = float(os.getenv("ALERT_HEAT_C", "35"))
+ALERT_COLD_C = float(os.getenv("ALERT_COLD_C", "-5"))
+ALERT_BATCH_SIZE = 400  # Firestore caps a batch at 500 writes
+IN_QUERY_LIMIT = 30  # Firestore caps an "in" filter at 30 values
+ACTIVE_STATUSES = ["upcoming", "ongoing"]
+# what trip_days_by_cell and build_alerts read from an itinerary
+ITINERARY_FIELDS = ["summary.center", "summary.days", "summary.start_date", "summary.duration_days",
+                    "summary.destination", "destination"]
+LEASE_COLLECTION = "job_leases"
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+# (rule, forecast column, comparison, threshold, severity, message); a rule may have several
+# thresholds, the most severe hit wins
+RULES = [
+    ("rain", "pop", ">=", ALERT_POP_THRESHOLD, "medium", "Rain likely ({value:.0%} chance)"),
+    ("rain", "pop", ">=", ALERT_POP_HIGH, "high", "Heavy rain likely ({value:.0%} chance)"),
+    ("heat", "temp_max", ">=", ALERT_HEAT_C, "high", "Extreme heat, up to {value:.0f}°C"),
+    ("cold", "temp_min", "<=", ALERT_COLD_C, "medium", "Freezing temperatures, down to {value:.0f}°C"),
+]
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+ALERT_TYPE = {"low": "advisory", "medium": "advisory", "high": "warning"}
+
+ALERT_RUNS = REGISTRY.counter("weather_alert_runs_total", "Weather alert engine runs", ("outcome",))
+ALERTS_WRITTEN = REGISTRY.counter("weather_alerts_written_total", "Weather alert documents set or deleted", ("op",))
+ALERT_LEASES = REGISTRY.counter("weather_alert_leases_total", "Scheduled alert runs claimed or skipped", ("outcome",))
+
+last_run = None
+
+
+def trip_days_by_cell(it: dict):
+    """
+    {cell: [ISO date]} for an itinerary. Days come from summary.days at their own
+    locations; a trip without planned days covers start_date + duration_days at its centre.
+    """
+    by_cell = {}
+    for _, day_date, coords in day_locations(it):
+        if day_date and coords:
+            by_cell.setdefault(weather_cell(*coords), []).append(day_date)
+    if by_cell:
+        return by_cell
+    summary = it.get("summary", {})
+    lat, lng = itinerary_center(it)
+    if lat is None or not summary.get("start_date"):
+        return {}
+    try:
+        first = date.fromisoformat(str(summary["start_date"])[:10])
+    except ValueError:
+        return {}
+    days = int(summary.get("duration_days") or 0)
+    return {weather_cell(lat, lng): [(first + timedelta(days=i)).isoformat() for i in range(days)]}
+
+
+def forecast_columns(weather: dict):
+    """
+    Daily forecast as parallel columns keyed by date index: float arrays (NaN when
+    a value is missing) with numpy, lists (None when missing) without.
+    """
+    daily = weather.get("daily", [])
+    temps = [d.get("temp") or {} for d in daily]
+    columns = {
+        "dates": [d.get("dt") for d in daily],
+        "pop": [float(d.get("pop") or 0) for d in daily],
+        "temp_max": [t.get("max") if isinstance(t, dict) else t for t in temps],
+        "temp_min": [t.get("min") if isinstance(t, dict) else t for t in temps],
+    }
+    if numpy is not None:
+        for name in ("pop", "temp_max", "temp_min"):
+            columns[name] = numpy.array([numpy.nan if v is None else v for v in columns[name]], dtype=float)
+    return columns
+
+
+def _rule_mask(values, op: str, threshold: float):
+    """Days meeting one rule; missing values never match."""
+    if numpy is not None:
+        # comparisons with NaN are False
+        return values >= threshold if op == ">=" else values <= threshold
+    if op == ">=":
+        return [v is not None and v >= threshold for v in values]
+    return [v is not None and v <= threshold for v in values]
+
+
+def evaluate_rules(columns: dict):
+    """
+    Apply every rule to whole forecast columns once per cell.
+    Returns {date: {rule: (severity, message)}} for the days with a hit.
+    """
+    hits = {}
+    dates = columns["dates"]
+    for rule, column, op, threshold, severity, message in RULES:
+        values = columns[column]
+        mask = _rule_mask(values, op, threshold)
+        days = numpy.flatnonzero(mask) if numpy is not None else [i for i, hit in enumerate(mask) if hit]
+        for i in days:
+            day, value = dates[i], float(values[i])
+            current = hits.setdefault(day, {}).get(rule)
+            if current is None or SEVERITY_RANK[severity] > SEVERITY_RANK[current[0]]:
+                hits[day][rule] = (severity, message.format(value=value))
+    return hits
+
+
+def alert_id(itinerary_id: str, day: str, rule: str):
+    return f"auto_{itinerary_id}_{day}_{rule}"
+
+
+def build_alerts(itinerary_id: str, it: dict, dates, hits: dict, now: datetime):
+    location = it.get("summary", {}).get("destination") or it.get("destination") or ""
+    alerts = []
+    for day in dates:
+        for rule, (severity, message) in sorted(hits.get(day, {}).items()):
+            aid = alert_id(itinerary_id, day, rule)
+            alerts.append({
+                "id": aid,
+                "itinerary_id": itinerary_id,
+                "location": location,
+                "date": datetime.fromisoformat(day),
+                "type": ALERT_TYPE[severity],
+                "rule": rule,
+                "message": message,
+                "severity": severity,
+                "source": "engine",
+                "created_at": now,
+                "updated_at": now,
+            })
+    return alerts
+
+
+def _load_active_itineraries():
+    docs = registered_query("itineraries_by_status_in", status=ACTIVE_STATUSES).select(ITINERARY_FIELDS).stream()
+    return [(doc.id, doc.to_dict()) for doc in docs]
+
+
+def _load_previous_alerts(itinerary_ids):
+    """{itinerary_id: [alert id]} of the engine alerts stored for these itineraries."""
+    ids, previous = sorted(itinerary_ids), {}
+    for start in range(0, len(ids), IN_QUERY_LIMIT):
+        docs = registered_query("engine_alerts_by_itinerary_in", itinerary_id=ids[start:start + IN_QUERY_LIMIT],
+                                source="engine").select(["itinerary_id"]).stream()
+        for doc in docs:
+            if doc.id.startswith("auto_"):
+                previous.setdefault(doc.get("itinerary_id"), []).append(doc.id)
+    return previous
+
+
+def claim_run(interval_minutes: float = WEATHER_ALERTS_INTERVAL_MINUTES):
+    """
+    Claim the current interval's scheduled run. create() succeeds for exactly one worker,
+    the others get AlreadyExists and skip; the previous interval's lease is then removed.
+    """
+    from google.api_core.exceptions import AlreadyExists
+
+    slot = int(time.time() // (interval_minutes * 60))
+    col = get_db().collection(LEASE_COLLECTION)
+    try:
+        col.document(f"weather_alerts_{slot}").create({"holder": RUNNER_ID, "created_at": datetime.utcnow()})
+    except AlreadyExists:
+        ALERT_LEASES.inc(outcome="skipped")
+        return False
+    col.document(f"weather_alerts_{slot - 1}").delete()
+    ALERT_LEASES.inc(outcome="claimed")
+    return True
+
+
+def _commit_batches(writes):
+    """writes: [(alert_id, doc or None)]; None deletes. Commits in ALERT_BATCH_SIZE chunks."""
+    db = get_db()
+    col = db.collection("weather_alerts")
+    for start in range(0, len(writes), ALERT_BATCH_SIZE):
+        batch = db.batch()
+        for aid, doc in writes[start:start + ALERT_BATCH_SIZE]:
+            if doc is None:
+                batch.delete(col.document(aid))
+            else:
+                batch.set(col.document(aid), doc)
+        batch.commit()
+
+
+async def run_alert_engine():
+    """Evaluate every active itinerary once and persist the resulting alerts. Returns a run summary."""
+    global last_run
+    started = time.perf_counter()
+    itineraries = await asyncio.to_thread(_load_active_itineraries)
+
+    cells = {}
+    skipped = 0
+    for itinerary_id, it in itineraries:
+        by_cell = trip_days_by_cell(it)
+        if not by_cell:
+            skipped += 1
+        for cell, dates in by_cell.items():
+            cells.setdefault(cell, []).append((itinerary_id, it, dates))
+
+    async def forecast(cell):
+        try:
+            return cell, await fetch_weather_for_latlng(*cell)
+        except HTTPException as e:
+            return cell, e
+
+    # provider_slot("openweather") inside the fetch bounds how many of these run at once
+    forecasts = await asyncio.gather(*(forecast(cell) for cell in cells))
+
+    now = datetime.utcnow()
+    stored = await asyncio.to_thread(_load_previous_alerts, [itinerary_id for itinerary_id, _ in itineraries])
+    alerts_by_trip, incomplete, failed_cells = {}, set(), 0
+    for cell, weather in forecasts:
+        if isinstance(weather, HTTPException):
+            failed_cells += 1
+            logger.warning("Weather alerts: forecast for cell %s unavailable (%s)", cell, weather.detail)
+            incomplete.update(itinerary_id for itinerary_id, _, _ in cells[cell])
+            continue
+        hits = evaluate_rules(forecast_columns(weather))
+        for itinerary_id, it, dates in cells[cell]:
+            alerts_by_trip.setdefault(itinerary_id, []).extend(build_alerts(itinerary_id, it, dates, hits, now))
+
+    writes = []
+    for itinerary_id in alerts_by_trip.keys() | incomplete:
+        alerts = alerts_by_trip.get(itinerary_id, [])
+        writes.extend((a["id"], a) for a in alerts)
+        # part of the trip had no forecast this run: keep what was raised before
+        if itinerary_id not in incomplete:
+            current = {a["id"] for a in alerts}
+            writes.extend((aid, None) for aid in stored.get(itinerary_id, []) if aid not in current)
+
+    await asyncio.to_thread(_commit_batches, writes)
+    written = sum(1 for _, doc in writes if doc is not None)
+    ALERTS_WRITTEN.inc(written, op="set")
+    ALERTS_WRITTEN.inc(len(writes) - written, op="delete")
+    ALERT_RUNS.inc(outcome="partial" if failed_cells else "ok")
+
+    last_run = {
+        "finished_at": datetime.utcnow().isoformat(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "itineraries": len(itineraries),
+        "skipped": skipped,
+        "cells": len(cells),
+        "failed_cells": failed_cells,
+        "alerts_written": written,
+        "alerts_cleared": len(writes) - written,
+    }
+    return last_run
+
+
+async def alert_scheduler(interval_minutes: float = WEATHER_ALERTS_INTERVAL_MINUTES):
+    """Background loop started from the app lifespan; a failed run is logged and retried next interval."""
+    while True:
+        try:
+            if await asyncio.to_thread(claim_run, interval_minutes):
+                summary = await run_alert_engine()
+                logger.info("Weather alerts: %s", summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            ALERT_RUNS.inc(outcome="error")
+            logger.exception("Weather alert run failed")
+        await asyncio.sleep(interval_minutes * 60)
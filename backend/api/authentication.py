@@ -1,14 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth
-from core.firebase import get_db
+from core.firebase import get_db, get_auth
+from core.metrics import track_dependency
+from core.rate_limit import configured_limit, check_rate_limit
+from core.cache import Cache
+from core.write_behind import WRITE_BEHIND
 from datetime import datetime
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
+import asyncio
+import hashlib
+import os
+import time
 
 router = APIRouter()
 security = HTTPBearer()
 
+# Comma-separated Firebase uids allowed on admin endpoints (in addition to an `admin: true` custom claim)
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+# Verified ID tokens are reused until they expire (capped), keyed by the token's hash
+TOKEN_CACHE_SECONDS = int(os.getenv("TOKEN_CACHE_SECONDS", "300"))
+_token_cache = Cache("id_tokens", ttl=TOKEN_CACHE_SECONDS)
+
+# users/{uid} documents, read through and dropped around every profile write (shared across workers)
+PROFILE_CACHE_SECONDS = int(os.getenv("PROFILE_CACHE_SECONDS", "600"))
+_profiles = Cache("user_profiles", ttl=PROFILE_CACHE_SECONDS)
+
 # ------------------- Schemas -------------------
 class UserSync(BaseModel):
     full_name: str
@@ -29,11 +47,70 @@ class UserProfileUpdate(BaseModel):
 async def verify_firebase_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        decoded_token = await _token_cache.aget(key)
+        if decoded_token is not None and decoded_token.get("exp", 0) > time.time():
+            return decoded_token
+        with track_dependency("firebase_auth", "verify_id_token"):
+            decoded_token = get_auth().verify_id_token(token)
+        await _token_cache.aset(key, decoded_token, ttl=min(TOKEN_CACHE_SECONDS, decoded_token.get("exp", 0) - time.time()))
         return decoded_token
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid authentication token")
 
+async def require_admin(current_user: dict = Depends(verify_firebase_token)):
+    if current_user.get("admin") is True or current_user.get("uid") in ADMIN_UIDS:
+        return current_user
+    raise HTTPException(status_code=403, detail="Admin access required")
+
+def _read_user(uid: str):
+    with track_dependency("firestore", "get_user"):
+        doc = get_db().collection("users").document(uid).get()
+    return doc.to_dict() if doc.exists else None
+
+async def load_user_profile(uid: str):
+    """users/{uid} as a dict (None if there is none), from the profile cache when possible."""
+    profile = await _profiles.aget(uid)
+    if profile is not None:
+        return profile
+    profile = await asyncio.to_thread(_read_user, uid)
+    if profile is not None:
+        await _profiles.aset(uid, profile)
+    return profile
+
+async def update_user_doc(uid: str, update_data: dict):
+    """
+    Conditional update of users/{uid}: Firestore's update() already fails when the document
+    is missing, so no existence read is needed. Raises 404 in that case.
+    The cached profile is dropped before and after the write, so a read-through that
+    started before the write cannot keep serving the old document.
+    """
+    from google.api_core.exceptions import NotFound
+
+    await _profiles.adelete(uid)
+    try:
+        await asyncio.to_thread(get_db().collection("users").document(uid).update, update_data)
+    except NotFound:
+        raise HTTPException(status_code=404, detail="User profile not found")
+    finally:
+        await _profiles.adelete(uid)
+
+async def record_login(uid: str, profile: dict):
+    """Queue the last_login write (coalesced, flushed in batches) and update the cached profile to match."""
+    now = datetime.utcnow()
+    WRITE_BEHIND.defer("users", uid, {"last_login": now})
+    await _profiles.aset(uid, {**profile, "last_login": now})
+
+def rate_limit(name: str, per_minute: float, burst: float = None):
+    """Dependency allowing each user `per_minute` calls (bursts up to `burst`) to routes sharing `name`"""
+    per_minute, burst = configured_limit(name, per_minute, burst)
+
+    async def dependency(current_user: dict = Depends(verify_firebase_token)):
+        check_rate_limit(current_user["uid"], name, per_minute, burst)
+        return current_user
+
+    return dependency
+
 # ------------------- Authentication Endpoints -------------------
 @router.post("/auth/register")
 async def sync_registered_user(
@@ -65,7 +142,8 @@ async def sync_registered_user(
             "auth_provider": "email"
         }
         
-        get_db().collection("users").document(uid).set(user_doc)
+        await asyncio.to_thread(get_db().collection("users").document(uid).set, user_doc)
+        await _profiles.aset(uid, user_doc)
         
         return {
             "success": True, 
@@ -86,13 +164,11 @@ async def sync_login(current_user: dict = Depends(verify_firebase_token)):
         uid = current_user['uid']
         
         # Update last login in Firestore
-        user_ref = get_db().collection("users").document(uid)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+        profile = await load_user_profile(uid)
+        if profile is None:
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        user_ref.update({"last_login": datetime.utcnow()})
+        await record_login(uid, profile)
         
         return {
             "success": True, 
@@ -100,6 +176,8 @@ async def sync_login(current_user: dict = Depends(verify_firebase_token)):
             "user_id": uid
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login sync failed: {str(e)}")
 
@@ -111,14 +189,14 @@ async def sync_google_auth(auth_request: GoogleAuthRequest):
     """
     try:
         # Verify the Google ID token
-        decoded_token = auth.verify_id_token(auth_request.id_token)
+        decoded_token = get_auth().verify_id_token(auth_request.id_token)
         uid = decoded_token['uid']
         email = decoded_token.get('email')
         name = decoded_token.get('name', '')
 
         user_ref = get_db().collection("users").document(uid)
-        user_doc = user_ref.get()
-        is_new_user = not user_doc.exists
+        profile = await load_user_profile(uid)
+        is_new_user = profile is None
 
         if is_new_user:
             # Create new user document for Google OAuth user
@@ -133,10 +211,10 @@ async def sync_google_auth(auth_request: GoogleAuthRequest):
                 "profile_complete": False,
                 "auth_provider": "google"
             }
-            user_ref.set(user_data)
+            await asyncio.to_thread(user_ref.set, user_data)
+            await _profiles.aset(uid, user_data)
         else:
-            # Update existing user's last login
-            user_ref.update({"last_login": datetime.utcnow()})
+            await record_login(uid, profile)
 
         return {
             "success": True,
@@ -155,17 +233,18 @@ async def get_user_profile(current_user: dict = Depends(verify_firebase_token)):
     """Get user profile data from Firestore."""
     try:
         uid = current_user['uid']
-        user_doc = get_db().collection("users").document(uid).get()
+        profile = await load_user_profile(uid)
         
-        if not user_doc.exists:
+        if profile is None:
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        profile_data = user_doc.to_dict()
         # Remove sensitive data before sending
-        profile_data.pop('uid', None)
+        profile_data = {k: v for k, v in profile.items() if k != 'uid'}
         
         return {"success": True, "profile": profile_data}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch profile: {str(e)}")
 
@@ -177,11 +256,6 @@ async def update_user_profile(
     """Update user profile data in Firestore."""
     try:
         uid = current_user['uid']
-        user_ref = get_db().collection("users").document(uid)
-        
-        # Check if user exists
-        if not user_ref.get().exists:
-            raise HTTPException(status_code=404, detail="User profile not found")
         
         # Prepare update data (only include non-None values)
         update_data = {
@@ -197,10 +271,12 @@ async def update_user_profile(
         if profile_data.profile_complete is not None:
             update_data["profile_complete"] = profile_data.profile_complete
         
-        user_ref.update(update_data)
+        await update_user_doc(uid, update_data)
         
         return {"success": True, "message": "Profile updated successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Profile update failed: {str(e)}")
 
@@ -210,14 +286,16 @@ async def get_travel_preferences(current_user: dict = Depends(verify_firebase_to
     """Get user's travel preferences."""
     try:
         uid = current_user['uid']
-        user_doc = get_db().collection("users").document(uid).get()
+        profile = await load_user_profile(uid)
         
-        if not user_doc.exists:
+        if profile is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        preferences = user_doc.to_dict().get('travel_preferences', [])
+        preferences = profile.get('travel_preferences', [])
         return {"success": True, "preferences": preferences}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch preferences: {str(e)}")
 
@@ -231,18 +309,15 @@ async def update_travel_preferences(
         uid = current_user['uid']
         preferences = preferences_data.get('preferences', [])
         
-        user_ref = get_db().collection("users").document(uid)
-        
-        if not user_ref.get().exists:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        user_ref.update({
+        await update_user_doc(uid, {
             "travel_preferences": preferences, 
             "updated_at": datetime.utcnow()
         })
         
         return {"success": True, "message": "Travel preferences updated successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update preferences: {str(e)}")
 
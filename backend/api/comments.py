@@ -3,15 +3,19 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from uuid import uuid4
+import asyncio
 
-from core.firebase import db
+from core.firebase import get_db
+from core import search
+from core.write_behind import WRITE_BEHIND
+from core.queries import query as registered_query
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Comments"])
 
 # Firestore refs
 def comments_col():
-    return db.collection("comments")
+    return get_db().collection("comments")
 
 # Pydantic models
 class CommentCreateRequest(BaseModel):
@@ -22,6 +26,10 @@ class CommentCreateRequest(BaseModel):
 class CommentUpdateRequest(BaseModel):
     text: str
 
+def list_itinerary_comments(itinerary_id: str):
+    query = registered_query("comments_by_itinerary", itinerary_id=itinerary_id).stream()
+    return [doc.to_dict() for doc in query]
+
 # Endpoints
 @router.post("/comments")
 async def add_comment(body: CommentCreateRequest, current_user: dict = Depends(verify_firebase_token)):
@@ -38,7 +46,8 @@ async def add_comment(body: CommentCreateRequest, current_user: dict = Depends(v
         "updated_at": datetime.utcnow(),
     }
     
-    comments_col().document(comment_id).set(comment_doc)
+    await WRITE_BEHIND.write("comments", comment_id, comment_doc)
+    await asyncio.to_thread(search.index_comment, comment_id, comment_doc)
     return {"success": True, "comment_id": comment_id}
 
 @router.get("/itineraries/{itinerary_id}/comments")
@@ -46,10 +55,7 @@ async def get_itinerary_comments(itinerary_id: str, current_user: dict = Depends
     # For simplicity, assuming any authenticated user can view comments on an itinerary they have access to.
     # In a real app, you'd check if the user is a member of the itinerary.
     
-    comments = []
-    query = comments_col().where("itinerary_id", "==", itinerary_id).order_by("created_at", direction="ASCENDING").stream()
-    for doc in query:
-        comments.append(doc.to_dict())
+    comments = list_itinerary_comments(itinerary_id)
     return {"success": True, "comments": comments}
 
 @router.get("/activities/{activity_id}/comments")
@@ -57,7 +63,7 @@ async def get_activity_comments(activity_id: str, current_user: dict = Depends(v
     # For simplicity, assuming any authenticated user can view comments on an activity they have access to.
     
     comments = []
-    query = comments_col().where("activity_id", "==", activity_id).order_by("created_at", direction="ASCENDING").stream()
+    query = registered_query("comments_by_activity", activity_id=activity_id).stream()
     for doc in query:
         comments.append(doc.to_dict())
     return {"success": True, "comments": comments}
@@ -79,6 +85,7 @@ async def update_comment(comment_id: str, body: CommentUpdateRequest, current_us
     update_data["updated_at"] = datetime.utcnow()
     
     doc_ref.update(update_data)
+    await asyncio.to_thread(search.index_comment, comment_id, {**comment, **update_data})
     return {"success": True, "message": "Comment updated successfully"}
 
 @router.delete("/comments/{comment_id}")
@@ -97,4 +104,5 @@ async def delete_comment(comment_id: str, current_user: dict = Depends(verify_fi
         raise HTTPException(status_code=403, detail="Forbidden")
     
     doc_ref.delete()
+    await asyncio.to_thread(search.remove, "comments", comment_id)
     return {"success": True, "message": "Comment deleted successfully"}
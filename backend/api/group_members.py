@@ -4,14 +4,15 @@ from typing import Optional
 from datetime import datetime
 from uuid import uuid4
 
-from core.firebase import db
+from core.firebase import get_db
+from core.queries import query as registered_query
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Group Collaboration"])
 
 # Firestore refs
 def group_members_col():
-    return db.collection("group_members")
+    return get_db().collection("group_members")
 
 # Pydantic models
 class GroupMemberCreateRequest(BaseModel):
@@ -23,6 +24,10 @@ class GroupMemberUpdateRequest(BaseModel):
     role: Optional[str] = None
     status: Optional[str] = None # e.g., 'pending', 'accepted', 'declined'
 
+def list_itinerary_group_members(itinerary_id: str):
+    query = registered_query("group_members_by_itinerary", itinerary_id=itinerary_id).stream()
+    return [doc.to_dict() for doc in query]
+
 # Endpoints
 @router.post("/group_members")
 async def add_group_member(body: GroupMemberCreateRequest, current_user: dict = Depends(verify_firebase_token)):
@@ -65,13 +70,10 @@ async def get_group_member(group_member_id: str, current_user: dict = Depends(ve
 @router.get("/itineraries/{itinerary_id}/group_members")
 async def get_itinerary_group_members(itinerary_id: str, current_user: dict = Depends(verify_firebase_token)):
     uid = current_user["uid"]
-    members = []
     # Check if current_user has access to this itinerary (e.g., is a member)
     # For simplicity, we'll assume access if they are authenticated.
     
-    query = group_members_col().where("itinerary_id", "==", itinerary_id).stream()
-    for doc in query:
-        members.append(doc.to_dict())
+    members = list_itinerary_group_members(itinerary_id)
     return {"success": True, "group_members": members}
 
 @router.put("/group_members/{group_member_id}")
@@ -1,17 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
+from collections import OrderedDict
 from uuid import uuid4
+import asyncio
+import os
+import threading
+import time
 
-from core.firebase import db
+from core.firebase import get_db
+from core import search
+from core.geo import geohash_encode, geohash_cover, haversine_km, distance_to_cell_km, GEOHASH_BASE32, GEOHASH_PRECISION
+from core.metrics import record_cache
+from core.queries import query as registered_query
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Hidden Gems"])
 
+# Hot-region index: recently queried geohash prefixes keep their gems in memory
+HOT_REGION_SECONDS = float(os.getenv("HOT_REGION_SECONDS", "120"))
+HOT_REGION_CELLS = int(os.getenv("HOT_REGION_CELLS", "512"))
+MAX_NEAR_RADIUS_M = 50000
+NEAR_SCAN_LIMIT = int(os.getenv("NEAR_SCAN_LIMIT", "1000"))  # docs read per prefix scan; bounds cost in dense areas
+
 # Firestore refs
 def hidden_gems_col():
-    return db.collection("hidden_gems")
+    return get_db().collection("hidden_gems")
 
 # Pydantic models
 class Location(BaseModel):
@@ -35,6 +50,144 @@ class HiddenGemUpdateRequest(BaseModel):
     category: Optional[str] = None
     image_url: Optional[str] = None
 
+class RegionIndex:
+    """
+    LRU of geohash prefix -> gems in that cell, each entry kept for HOT_REGION_SECONDS.
+    Only complete cells are kept; a cell too dense to read in one scan is stored as
+    DENSE_CELL so later queries go straight to its children. Writes from this worker
+    drop the cells containing the gem; other workers see them once their entry expires.
+    """
+
+    def __init__(self, max_cells: int = HOT_REGION_CELLS, ttl: float = HOT_REGION_SECONDS):
+        self.max_cells = max_cells
+        self.ttl = ttl
+        self._cells = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, prefix: str):
+        with self._lock:
+            entry = self._cells.get(prefix)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._cells.move_to_end(prefix)
+            return entry[1]
+
+    def put(self, prefix: str, gems: list):
+        with self._lock:
+            self._cells[prefix] = (time.monotonic() + self.ttl, gems)
+            self._cells.move_to_end(prefix)
+            while len(self._cells) > self.max_cells:
+                self._cells.popitem(last=False)
+
+    def invalidate(self, geohash: Optional[str]):
+        if not geohash:
+            return
+        with self._lock:
+            for prefix in [p for p in self._cells if geohash.startswith(p)]:
+                del self._cells[prefix]
+
+
+_regions = RegionIndex()
+DENSE_CELL = object()  # RegionIndex marker: more than NEAR_SCAN_LIMIT gems, read the child cells
+
+
+def gem_geohash(location: dict):
+    return geohash_encode(float(location["latitude"]), float(location["longitude"]))
+
+
+def _scan_prefix(prefix: str):
+    docs = registered_query("hidden_gems_by_geohash", geohash_start=prefix, geohash_end=prefix + "~",
+                            limit=NEAR_SCAN_LIMIT).stream()
+    return [doc.to_dict() for doc in docs]
+
+
+def _gems_in_cell(prefix: str, lat: float, lng: float, radius_m: float):
+    """
+    Gems in one geohash cell, from the hot-region index or a prefix scan. A scan that hits
+    NEAR_SCAN_LIMIT is cut off in geohash order, not by distance, so the cell is read as
+    its child cells that reach the circle instead (down to GEOHASH_PRECISION, where a
+    full scan is returned as is and not cached).
+    """
+    gems = _regions.get(prefix)
+    record_cache("gem_regions", gems is not None)
+    if gems is None:
+        gems = _scan_prefix(prefix)
+        if len(gems) < NEAR_SCAN_LIMIT:
+            _regions.put(prefix, gems)
+            return gems
+        if len(prefix) >= GEOHASH_PRECISION:
+            return gems
+        _regions.put(prefix, DENSE_CELL)
+    elif gems is not DENSE_CELL:
+        return gems
+    found = []
+    for child in (prefix + c for c in GEOHASH_BASE32):
+        if distance_to_cell_km(lat, lng, child) * 1000 <= radius_m:
+            found.extend(_gems_in_cell(child, lat, lng, radius_m))
+    return found
+
+
+async def gems_near(lat: float, lng: float, radius_m: float):
+    """
+    Community gems within radius_m of (lat, lng), nearest first, each with distance_m.
+    The covering geohash cells are read from the hot-region index, and the others are
+    scanned concurrently (see _gems_in_cell); then gems are filtered by exact distance.
+    """
+    cells, missing = [], []
+    for prefix in geohash_cover(lat, lng, radius_m):
+        gems = _regions.get(prefix)
+        if gems is None or gems is DENSE_CELL:
+            missing.append(prefix)
+        else:
+            record_cache("gem_regions", True)
+            cells.append(gems)
+    cells += await asyncio.gather(*(asyncio.to_thread(_gems_in_cell, prefix, lat, lng, radius_m) for prefix in missing))
+    found = {}
+    for gems in cells:
+        for gem in gems:
+            loc = gem.get("location") or {}
+            if loc.get("latitude") is None or loc.get("longitude") is None:
+                continue
+            distance_m = haversine_km(lat, lng, loc["latitude"], loc["longitude"]) * 1000
+            if distance_m <= radius_m:
+                found[gem["id"]] = {**gem, "distance_m": round(distance_m, 1)}
+    return sorted(found.values(), key=lambda g: g["distance_m"])
+
+
+async def community_gems_near(lat: float, lng: float, radius_m: float):
+    """gems_near in the shape of the Overpass gems (id, name, tags, lat, lng, source)."""
+    return [{
+        "id": gem["id"],
+        "name": gem.get("name") or "Unnamed",
+        "tags": {"category": gem.get("category"), "description": gem.get("description")},
+        "lat": gem["location"]["latitude"],
+        "lng": gem["location"]["longitude"],
+        "image_url": gem.get("image_url"),
+        "distance_m": gem["distance_m"],
+        "source": "community",
+    } for gem in await gems_near(lat, lng, radius_m)]
+
+
+def backfill_geohashes():
+    """Set geohash on gems stored before it was indexed. Returns the number updated."""
+    db = get_db()
+    batch, pending, updated = db.batch(), 0, 0
+    for doc in hidden_gems_col().stream():
+        gem = doc.to_dict()
+        loc = gem.get("location") or {}
+        if gem.get("geohash") or loc.get("latitude") is None or loc.get("longitude") is None:
+            continue
+        batch.update(doc.reference, {"geohash": gem_geohash(loc)})
+        pending += 1
+        updated += 1
+        if pending == 400:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    return updated
+
+
 # Endpoints
 @router.post("/hidden_gems")
 async def add_hidden_gem(body: HiddenGemCreateRequest, current_user: dict = Depends(verify_firebase_token)):
@@ -46,6 +199,7 @@ async def add_hidden_gem(body: HiddenGemCreateRequest, current_user: dict = Depe
         "name": body.name,
         "description": body.description,
         "location": body.location.dict(),
+        "geohash": gem_geohash(body.location.dict()),
         "category": body.category,
         "image_url": body.image_url,
         "submitted_by_user_id": uid,
@@ -55,6 +209,8 @@ async def add_hidden_gem(body: HiddenGemCreateRequest, current_user: dict = Depe
     }
     
     hidden_gems_col().document(gem_id).set(gem_doc)
+    _regions.invalidate(gem_doc["geohash"])
+    await asyncio.to_thread(search.index_gem, gem_id, gem_doc)
     return {"success": True, "gem_id": gem_id}
 
 @router.get("/hidden_gems/{gem_id}")
@@ -68,14 +224,26 @@ async def get_hidden_gem(gem_id: str, current_user: dict = Depends(verify_fireba
     return {"success": True, "gem": gem}
 
 @router.get("/hidden_gems")
-async def get_all_hidden_gems(itinerary_id: Optional[str] = None, current_user: dict = Depends(verify_firebase_token)):
+async def get_all_hidden_gems(
+    itinerary_id: Optional[str] = None,
+    near: Optional[str] = Query(None, description="lat,lng"),
+    radius_m: float = Query(2000, gt=0, le=MAX_NEAR_RADIUS_M),
+    current_user: dict = Depends(verify_firebase_token),
+):
+    if near:
+        try:
+            lat, lng = (float(v) for v in near.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="near must be 'lat,lng'")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise HTTPException(status_code=400, detail="near is out of range")
+        return {"success": True, "hidden_gems": await gems_near(lat, lng, radius_m)}
+
     gems = []
-    query = hidden_gems_col()
-    
     if itinerary_id:
-        query = query.where("itinerary_id", "==", itinerary_id)
-        
-    query = query.order_by("created_at", direction="DESCENDING").stream()
+        query = registered_query("hidden_gems_by_itinerary", itinerary_id=itinerary_id).stream()
+    else:
+        query = registered_query("hidden_gems_recent").stream()
     for doc in query:
         gems.append(doc.to_dict())
     return {"success": True, "hidden_gems": gems}
@@ -94,9 +262,14 @@ async def update_hidden_gem(gem_id: str, body: HiddenGemUpdateRequest, current_u
         raise HTTPException(status_code=403, detail="Forbidden") # Only the author can update their gem
     
     update_data = body.dict(exclude_unset=True)
+    if update_data.get("location"):
+        update_data["geohash"] = gem_geohash(update_data["location"])
     update_data["updated_at"] = datetime.utcnow()
     
     doc_ref.update(update_data)
+    _regions.invalidate(gem.get("geohash"))
+    _regions.invalidate(update_data.get("geohash"))
+    await asyncio.to_thread(search.index_gem, gem_id, {**gem, **update_data})
     return {"success": True, "message": "Hidden gem updated successfully"}
 
 @router.delete("/hidden_gems/{gem_id}")
@@ -113,4 +286,6 @@ async def delete_hidden_gem(gem_id: str, current_user: dict = Depends(verify_fir
         raise HTTPException(status_code=403, detail="Forbidden") # Only the author can delete their gem
     
     doc_ref.delete()
+    _regions.invalidate(gem.get("geohash"))
+    await asyncio.to_thread(search.remove, "gems", gem_id)
     return {"success": True, "message": "Hidden gem deleted successfully"}
@@ -1,15 +1,20 @@
 # api/payments.py
-from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks, Query
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 from uuid import uuid4
 import os
+import asyncio
 import logging
-import stripe
 
-from core.firebase import db
-from api.authentication import verify_firebase_token
+from core.firebase import get_db, get_many, get_many_owned, parse_batch_ids
+from api.authentication import verify_firebase_token, rate_limit
+from core.metrics import track_dependency
+from core.rate_limit import provider_slot
+from core.queries import query as registered_query
+from core import cdc, search
+from core.pricing import to_minor
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1", tags=["Payments & Booking"])
@@ -17,18 +22,27 @@ router = APIRouter(prefix="/api/v1", tags=["Payments & Booking"])
 # Stripe setup (test mode keys in .env)
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
-if STRIPE_SECRET_KEY:
-    stripe.api_key = STRIPE_SECRET_KEY
+_stripe = None
+
+def get_stripe():
+    """Import and configure the Stripe SDK on first use (keeps it out of the boot path)"""
+    global _stripe
+    if _stripe is None:
+        import stripe
+        if STRIPE_SECRET_KEY:
+            stripe.api_key = STRIPE_SECRET_KEY
+        _stripe = stripe
+    return _stripe
 
 # Firestore refs
 def reservations_col():
-    return db.collection("reservations")
+    return get_db().collection("reservations")
 
 def payments_col():
-    return db.collection("payments")
+    return get_db().collection("payments")
 
 def bookings_col():
-    return db.collection("bookings")
+    return get_db().collection("bookings")
 
 
 # ------------------------
@@ -59,7 +73,7 @@ class BookingCreateRequest(BaseModel):
 # ------------------------
 
 @router.post("/payments/checkout")
-async def create_checkout(body: CheckoutRequest, current_user: dict = Depends(verify_firebase_token)):
+async def create_checkout(body: CheckoutRequest, current_user: dict = Depends(rate_limit("checkout", 10, 5))):
     """
     Create a Stripe PaymentIntent for a reservation.
     """
@@ -72,13 +86,30 @@ async def create_checkout(body: CheckoutRequest, current_user: dict = Depends(ve
         raise HTTPException(status_code=403, detail="Forbidden")
     if res["status"] not in ["held"]:
         raise HTTPException(status_code=400, detail="Reservation not valid for payment")
+    # the reservation, not the client, decides what is charged
+    currency = res.get("currency") or "INR"
+    amount_minor = res.get("total_amount_minor")
+    if amount_minor is None:
+        amount_minor = to_minor(res.get("total_amount") or res.get("amount") or 0, currency)
+    try:
+        requested_minor = to_minor(body.amount, body.currency)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid amount")
+    if body.currency.upper() != currency.upper():
+        raise HTTPException(status_code=400, detail=f"Checkout currency must be {currency}")
+    if requested_minor != amount_minor:
+        raise HTTPException(status_code=400, detail="Checkout amount does not match the reservation total")
 
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=int(body.amount * 100),  # Stripe expects paise/cents
-            currency=body.currency.lower(),
-            metadata={"reservation_id": body.reservation_id, "user_id": uid},
-        )
+        # the Stripe SDK is blocking; run it off the event loop within the provider's concurrency cap
+        async with provider_slot("stripe"):
+            with track_dependency("stripe", "payment_intent.create"):
+                intent = await asyncio.to_thread(
+                    get_stripe().PaymentIntent.create,
+                    amount=amount_minor,  # Stripe expects paise/cents (whole units for zero-decimal currencies)
+                    currency=currency.lower(),
+                    metadata={"reservation_id": body.reservation_id, "user_id": uid},
+                )
         payment_id = f"pay_{uuid4().hex[:12]}"
         payment_doc = {
             "id": payment_id,
@@ -87,10 +118,12 @@ async def create_checkout(body: CheckoutRequest, current_user: dict = Depends(ve
             "status": "created",
             "stripe_payment_intent_id": intent.id,
             "amount": body.amount,
-            "currency": body.currency,
+            "amount_minor": amount_minor,
+            "currency": currency,
             "created_at": datetime.utcnow(),
         }
         payments_col().document(payment_id).set(payment_doc)
+        cdc.capture("payments", payment_id, "create", payment_doc)
 
         return {
             "success": True,
@@ -98,6 +131,8 @@ async def create_checkout(body: CheckoutRequest, current_user: dict = Depends(ve
             "client_secret": intent.client_secret,
             "reservation_id": body.reservation_id,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Stripe create_payment failed")
         raise HTTPException(status_code=500, detail="Payment creation failed")
@@ -111,6 +146,7 @@ async def stripe_webhook(request: Request, background_tasks: BackgroundTasks):
     if not STRIPE_WEBHOOK_SECRET:
         raise HTTPException(status_code=500, detail="Stripe webhook secret not configured")
 
+    stripe = get_stripe()
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
 
@@ -137,21 +173,26 @@ async def stripe_webhook(request: Request, background_tasks: BackgroundTasks):
 
 def mark_payment_success(intent_id: str):
     try:
-        q = payments_col().where("stripe_payment_intent_id", "==", intent_id).limit(1).get()
+        q = registered_query("payment_by_intent", stripe_payment_intent_id=intent_id).get()
         for doc in q:
             payment = doc.to_dict()
-            payments_col().document(doc.id).update({"status": "succeeded", "updated_at": datetime.utcnow()})
+            update = {"status": "succeeded", "updated_at": datetime.utcnow()}
+            payments_col().document(doc.id).update(update)
+            cdc.capture("payments", doc.id, "update", update)
             # also update reservation
             reservations_col().document(payment["reservation_id"]).update({"status": "paid"})
+            cdc.capture("reservations", payment["reservation_id"], "update", {"status": "paid"})
     except Exception:
         logger.exception("mark_payment_success failed")
 
 
 def mark_payment_failed(intent_id: str):
     try:
-        q = payments_col().where("stripe_payment_intent_id", "==", intent_id).limit(1).get()
+        q = registered_query("payment_by_intent", stripe_payment_intent_id=intent_id).get()
         for doc in q:
-            payments_col().document(doc.id).update({"status": "failed", "updated_at": datetime.utcnow()})
+            update = {"status": "failed", "updated_at": datetime.utcnow()}
+            payments_col().document(doc.id).update(update)
+            cdc.capture("payments", doc.id, "update", update)
     except Exception:
         logger.exception("mark_payment_failed failed")
 
@@ -162,8 +203,12 @@ async def create_booking(body: BookingCreateRequest, current_user: dict = Depend
     Create a booking after successful payment.
     """
     uid = current_user["uid"]
-    res_doc = reservations_col().document(body.reservation_id).get()
-    pay_doc = payments_col().document(body.payment_id).get()
+    res_ref = reservations_col().document(body.reservation_id)
+    pay_ref = payments_col().document(body.payment_id)
+    # one get_all round-trip for both documents
+    snaps = get_many([res_ref, pay_ref])
+    res_doc = snaps[res_ref.path]
+    pay_doc = snaps[pay_ref.path]
 
     if not res_doc.exists or not pay_doc.exists:
         raise HTTPException(status_code=404, detail="Reservation or Payment not found")
@@ -193,13 +238,44 @@ async def create_booking(body: BookingCreateRequest, current_user: dict = Depend
         "updated_at": datetime.utcnow(),
     }
     bookings_col().document(booking_id).set(booking_doc)
+    cdc.capture("bookings", booking_id, "create", booking_doc)
     # update reservation & itinerary
-    reservations_col().document(body.reservation_id).update({"status": "booked", "updated_at": datetime.utcnow()})
-    db.collection("itineraries").document(body.itinerary_id).update({"status": "booked", "updated_at": datetime.utcnow()})
+    booked = {"status": "booked", "updated_at": datetime.utcnow()}
+    reservations_col().document(body.reservation_id).update(booked)
+    cdc.capture("reservations", body.reservation_id, "update", booked)
+    itinerary_ref = get_db().collection("itineraries").document(body.itinerary_id)
+    itinerary_ref.update(booked)
+    cdc.capture("itineraries", body.itinerary_id, "update", booked)
+    # the trip's status facet changed; index_trip needs the whole document
+    itinerary = await asyncio.to_thread(itinerary_ref.get)
+    if itinerary.exists:
+        await asyncio.to_thread(search.index_trip, body.itinerary_id, itinerary.to_dict())
 
     return {"success": True, "booking_id": booking_id, "status": "confirmed"}
 
 
+@router.get("/bookings/batch")
+async def batch_get_bookings(ids: List[str] = Query(...), current_user: dict = Depends(verify_firebase_token)):
+    """Fetch many bookings in one round-trip. ids: repeated or comma-separated."""
+    try:
+        doc_ids = parse_batch_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await asyncio.to_thread(get_many_owned, "bookings", doc_ids, current_user["uid"])
+    return {"success": True, "bookings": result["items"], "missing": result["missing"], "forbidden": result["forbidden"]}
+
+
+@router.get("/payments/batch")
+async def batch_get_payments(ids: List[str] = Query(...), current_user: dict = Depends(verify_firebase_token)):
+    """Fetch many payments in one round-trip. ids: repeated or comma-separated."""
+    try:
+        doc_ids = parse_batch_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await asyncio.to_thread(get_many_owned, "payments", doc_ids, current_user["uid"])
+    return {"success": True, "payments": result["items"], "missing": result["missing"], "forbidden": result["forbidden"]}
+
+
 @router.get("/bookings/{booking_id}")
 async def get_booking(booking_id: str, current_user: dict = Depends(verify_firebase_token)):
     uid = current_user["uid"]
@@ -218,7 +294,7 @@ async def get_all_payments(current_user: dict = Depends(verify_firebase_token)):
     """
     uid = current_user["uid"]
     payments = []
-    query = payments_col().where("user_id", "==", uid).order_by("created_at", direction="DESCENDING").stream()
+    query = registered_query("payments_by_user", user_id=uid).stream()
     for doc in query:
         payments.append(doc.to_dict())
     return {"success": True, "payments": payments}
@@ -235,7 +311,9 @@ async def cancel_booking(booking_id: str, current_user: dict = Depends(verify_fi
         raise HTTPException(status_code=403, detail="Forbidden")
     if b["status"] == "cancelled":
         return {"success": True, "message": "Already cancelled"}
-    bookings_col().document(booking_id).update({"status": "cancelled", "cancelled_at": datetime.utcnow()})
+    update = {"status": "cancelled", "cancelled_at": datetime.utcnow()}
+    bookings_col().document(booking_id).update(update)
+    cdc.capture("bookings", booking_id, "update", update)
     return {"success": True, "message": "Booking cancelled"}
 
 
@@ -247,7 +325,7 @@ async def get_all_bookings(current_user: dict = Depends(verify_firebase_token)):
     uid = current_user["uid"]
     bookings = []
     # Assuming 'created_at' is a field in your booking documents for ordering
-    query = bookings_col().where("user_id", "==", uid).order_by("created_at", direction="DESCENDING").stream()
+    query = registered_query("bookings_by_user", user_id=uid).stream()
     for doc in query:
         bookings.append(doc.to_dict())
     return {"success": True, "bookings": bookings}
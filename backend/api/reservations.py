@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 from uuid import uuid4
+import asyncio
 
-from core.firebase import db
+from core.firebase import get_db, get_many_owned, parse_batch_ids
+from core.queries import query as registered_query
+from core import cdc
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Reservations"])
 
 # Firestore refs
 def reservations_col():
-    return db.collection("reservations")
+    return get_db().collection("reservations")
 
 # Pydantic models
 class ReservationCreateRequest(BaseModel):
@@ -47,8 +50,19 @@ async def create_reservation(body: ReservationCreateRequest, current_user: dict
     }
     
     reservations_col().document(reservation_id).set(reservation_doc)
+    cdc.capture("reservations", reservation_id, "create", reservation_doc)
     return {"success": True, "reservation_id": reservation_id, "status": "pending_payment"}
 
+@router.get("/reservations/batch")
+async def batch_get_reservations(ids: List[str] = Query(...), current_user: dict = Depends(verify_firebase_token)):
+    """Fetch many reservations in one round-trip. ids: repeated or comma-separated."""
+    try:
+        doc_ids = parse_batch_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await asyncio.to_thread(get_many_owned, "reservations", doc_ids, current_user["uid"])
+    return {"success": True, "reservations": result["items"], "missing": result["missing"], "forbidden": result["forbidden"]}
+
 @router.get("/reservations/{reservation_id}")
 async def get_reservation(reservation_id: str, current_user: dict = Depends(verify_firebase_token)):
     uid = current_user["uid"]
@@ -66,7 +80,7 @@ async def get_reservation(reservation_id: str, current_user: dict = Depends(veri
 async def get_all_reservations(current_user: dict = Depends(verify_firebase_token)):
     uid = current_user["uid"]
     reservations = []
-    query = reservations_col().where("user_id", "==", uid).order_by("created_at", direction="DESCENDING").stream()
+    query = registered_query("reservations_by_user", user_id=uid).stream()
     for doc in query:
         reservations.append(doc.to_dict())
     return {"success": True, "reservations": reservations}
@@ -88,6 +102,7 @@ async def update_reservation(reservation_id: str, body: ReservationUpdateRequest
     update_data["updated_at"] = datetime.utcnow()
     
     doc_ref.update(update_data)
+    cdc.capture("reservations", reservation_id, "update", update_data)
     return {"success": True, "message": "Reservation updated successfully"}
 
 @router.delete("/reservations/{reservation_id}")
@@ -104,4 +119,5 @@ async def delete_reservation(reservation_id: str, current_user: dict = Depends(v
         raise HTTPException(status_code=403, detail="Forbidden")
     
     doc_ref.delete()
+    cdc.capture("reservations", reservation_id, "delete")
     return {"success": True, "message": "Reservation deleted successfully"}
@@ -0,0 +1,45 @@
+# api/search.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+import asyncio
+import sqlite3
+
+from core import search as search_index
+from api.authentication import rate_limit
+
+router = APIRouter(prefix="/api/v1", tags=["Search"])
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: str = Query("trips", pattern="^(trips|comments|gems)$"),
+    itinerary_id: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    theme: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: dict = Depends(rate_limit("search", 120, 30)),
+):
+    """
+    Full-text search, answered from the local index (see core.search).
+    kind=trips searches the caller's own trips, kind=comments the thread of itinerary_id,
+    kind=gems every hidden gem. Every term matches as a prefix ("kyo temp" finds
+    "Kyoto temples"); category/status/theme narrow the results and facets count them.
+    """
+    owner = scope = None
+    if kind == "trips":
+        owner = current_user["uid"]
+    elif kind == "comments":
+        if not itinerary_id:
+            raise HTTPException(status_code=400, detail="itinerary_id is required to search comments")
+        scope = itinerary_id
+    filters = {"category": category, "status": status, "theme": theme}
+    try:
+        result = await asyncio.to_thread(
+            search_index.search, kind, q, owner=owner, scope=scope, filters=filters, limit=limit, offset=offset,
+        )
+    except (search_index.SearchUnavailable, sqlite3.Error):
+        raise HTTPException(status_code=503, detail="Search is temporarily unavailable")
+    return {"success": True, "kind": kind, "query": q, **result}
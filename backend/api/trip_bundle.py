@@ -0,0 +1,123 @@
+# api/trip_bundle.py
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import logging
+
+from core.responses import dumps
+from api.authentication import rate_limit
+from api.trips import load_owned_itinerary, resolve_trip_weather, resolve_hidden_gems
+from api.comments import list_itinerary_comments
+from api.votes import list_itinerary_votes
+from api.group_members import list_itinerary_group_members
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/v1", tags=["Trips"])
+
+BUNDLE_PARTS = ("itinerary", "weather", "hidden_gems", "comments", "votes", "group_members")
+
+
+# -----------------------------
+# Part resolvers
+# -----------------------------
+def _part_resolvers(doc_ref, it: dict, itinerary_id: str, filter: Optional[str], radius_m: Optional[int]):
+    """
+    Map each bundle part to a coroutine factory. All parts share the itinerary that was
+    loaded (and ownership-checked) once by the endpoint.
+    """
+    async def itinerary():
+        return it
+
+    async def weather():
+        return await resolve_trip_weather(doc_ref, it)
+
+    async def hidden_gems():
+        return await resolve_hidden_gems(it, filter=filter, radius_m=radius_m)
+
+    async def comments():
+        return await asyncio.to_thread(list_itinerary_comments, itinerary_id)
+
+    async def votes():
+        return await asyncio.to_thread(list_itinerary_votes, itinerary_id)
+
+    async def group_members():
+        return await asyncio.to_thread(list_itinerary_group_members, itinerary_id)
+
+    return {
+        "itinerary": itinerary,
+        "weather": weather,
+        "hidden_gems": hidden_gems,
+        "comments": comments,
+        "votes": votes,
+        "group_members": group_members,
+    }
+
+
+async def _run_part(name: str, factory):
+    """Resolve one part; failures are reported per part instead of failing the bundle."""
+    try:
+        return {"part": name, "success": True, "data": await factory()}
+    except HTTPException as e:
+        return {"part": name, "success": False, "status_code": e.status_code, "error": e.detail}
+    except Exception:
+        logger.exception("bundle part %s failed", name)
+        return {"part": name, "success": False, "status_code": 500, "error": f"Failed to resolve {name}"}
+
+
+def _parse_include(include: Optional[str]):
+    if not include:
+        return list(BUNDLE_PARTS)
+    parts = []
+    for token in include.split(","):
+        token = token.strip().lower()
+        if not token:
+            continue
+        if token not in BUNDLE_PARTS:
+            raise HTTPException(status_code=400, detail=f"Unknown bundle part {token}")
+        if token not in parts:
+            parts.append(token)
+    return parts
+
+
+# -----------------------------
+# Endpoint
+# -----------------------------
+@router.get("/trips/{itinerary_id}/bundle")
+async def get_trip_bundle(
+    itinerary_id: str,
+    include: Optional[str] = None,
+    stream: bool = True,
+    filter: Optional[str] = None,
+    radius_m: Optional[int] = 5000,
+    current_user: dict = Depends(rate_limit("bundle", 60)),
+):
+    """
+    Resolve several trip sub-resources in one call.
+    include: comma-separated parts (itinerary, weather, hidden_gems, comments, votes, group_members); default all.
+    With stream=true (default) the response is NDJSON, one line per part in completion order.
+    With stream=false a single JSON object keyed by part is returned once everything resolved.
+    filter / radius_m are forwarded to hidden_gems.
+    """
+    parts = _parse_include(include)
+    # one auth check (dependency) and one itinerary read shared by every part
+    doc_ref, it = await asyncio.to_thread(load_owned_itinerary, itinerary_id, current_user["uid"])
+    resolvers = _part_resolvers(doc_ref, it, itinerary_id, filter, radius_m)
+    tasks = [asyncio.create_task(_run_part(name, resolvers[name])) for name in parts]
+
+    if not stream:
+        results = await asyncio.gather(*tasks)
+        return {"success": True, "itinerary_id": itinerary_id, "parts": {r.pop("part"): r for r in results}}
+
+    async def ndjson():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield dumps(result) + b"\n"
+        finally:
+            # client went away: don't leave provider calls running
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,507 @@
+# api/trip_generation.py
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta, date, timezone
+from uuid import uuid4
+import os
+import json
+import asyncio
+import logging
+
+from core.firebase import get_db, run_transaction
+from core.cache import Cache
+from core import search, cdc
+from core.queries import query as registered_query
+from core.day_planner import plan_days, ACTIVITY_BUDGET_SHARE
+from core.alternatives import precompute_top_k
+from api.authentication import verify_firebase_token, rate_limit
+from api.trips import http_get_json, fetch_weather_for_latlng, fetch_gems_near, itinerary_doc_ref
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/v1", tags=["Trips"])
+
+# Config
+GEOCODER_URL = os.getenv("GEOCODER_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODER_USER_AGENT = os.getenv("GEOCODER_USER_AGENT", "TravelAI-Pro/1.0")
+DEFAULT_TRIP_DAYS = 3
+MAX_TRIP_DAYS = 30
+HOTEL_BUDGET_SHARE = 0.4
+JOB_RETENTION_MIN = 60
+JOB_POLL_SECONDS = 0.5  # SSE poll interval for jobs running on another worker
+# itineraries still "generating" this long after their last update were orphaned by a dead worker
+GENERATION_STALE_MINUTES = float(os.getenv("GENERATION_STALE_MINUTES", "30"))
+INTERRUPTED_ERROR = "Itinerary generation was interrupted; please try again"
+
+# Rough per-person activity cost (INR) by OSM tag, used until a real provider quotes it
+ACTIVITY_COST_INR = {
+    "museum": 300,
+    "attraction": 500,
+    "viewpoint": 0,
+    "peak": 0,
+    "waterfall": 100,
+    "cafe": 400,
+    "place_of_worship": 0,
+}
+DEFAULT_ACTIVITY_COST_INR = 250
+ACTIVITY_DURATION_MIN = {"museum": 120, "attraction": 90, "cafe": 60, "peak": 180, "waterfall": 90}
+DEFAULT_ACTIVITY_DURATION_MIN = 60
+
+# Stages in pipeline order; weather and pois run concurrently once the destination is geocoded
+PIPELINE_STAGES = ("geocode", "weather", "pois", "booking_options", "summary", "save")
+
+
+# -----------------------------
+# Pydantic models (inputs)
+# -----------------------------
+class TripCreateRequest(BaseModel):
+    destination: str
+    origin: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    duration_days: Optional[int] = Field(None, ge=1, le=MAX_TRIP_DAYS)
+    budget_in_inr: Optional[float] = Field(None, ge=0)
+    themes: List[str] = []
+    travelers: int = Field(1, ge=1, le=50)
+    preferences: Dict[str, Any] = {}
+
+
+# -----------------------------
+# Job registry (in-process)
+# -----------------------------
+class GenerationJob:
+    """
+    Progress of one itinerary generation. Events are appended as stages change state;
+    stream readers wait on `changed` for new events. The latest state is mirrored to
+    the itinerary document (field `generation`) and to the shared cache tier so any
+    worker can answer polls and follow the job.
+    """
+
+    def __init__(self, job_id: str, itinerary_id: str, user_id: str):
+        self.job_id = job_id
+        self.itinerary_id = itinerary_id
+        self.user_id = user_id
+        self.state = "queued"  # queued | running | succeeded | failed
+        self.stages = {name: "pending" for name in PIPELINE_STAGES}
+        self.error = None
+        self.events = []
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    def snapshot(self):
+        return {
+            "job_id": self.job_id,
+            "itinerary_id": self.itinerary_id,
+            "state": self.state,
+            "stages": dict(self.stages),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def emit(self, stage: Optional[str] = None, stage_state: Optional[str] = None, **extra):
+        if stage:
+            self.stages[stage] = stage_state
+        event = {"seq": len(self.events), "state": self.state, "stage": stage, "stage_state": stage_state, "ts": datetime.utcnow()}
+        event.update(extra)
+        self.events.append(event)
+        await _shared_jobs.aset(self.job_id, {**self.snapshot(), "user_id": self.user_id})
+        async with self.changed:
+            self.changed.notify_all()
+
+    @property
+    def done(self):
+        return self.state in ("succeeded", "failed")
+
+
+_jobs: Dict[str, GenerationJob] = {}
+_shared_jobs = Cache("generation_jobs", ttl=JOB_RETENTION_MIN * 60)
+
+
+def _prune_jobs():
+    cutoff = datetime.utcnow() - timedelta(minutes=JOB_RETENTION_MIN)
+    for job_id in [j.job_id for j in _jobs.values() if j.done and j.finished_at and j.finished_at < cutoff]:
+        _jobs.pop(job_id, None)
+
+
+def _utc_naive(ts):
+    """Firestore returns aware UTC datetimes; the rest of this module uses naive utcnow()."""
+    if isinstance(ts, datetime) and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+async def _fail_interrupted(itinerary_id: str, generation: dict):
+    """
+    Mark an itinerary whose generation will never finish as failed, in a transaction that
+    only touches it while it is still "generating". Returns True when it was marked.
+    """
+    doc_ref = itinerary_doc_ref(itinerary_id)
+    now = datetime.utcnow()
+    generation = {**generation, "state": "failed", "error": INTERRUPTED_ERROR, "finished_at": now}
+
+    def txn_fail(tx):
+        snapshot = doc_ref.get(transaction=tx)
+        if not snapshot.exists or snapshot.to_dict().get("status") != "generating":
+            return None
+        failed = {"status": "failed", "generation": generation, "updated_at": now}
+        tx.update(doc_ref, failed)
+        return {**snapshot.to_dict(), **failed}
+
+    try:
+        doc = await asyncio.to_thread(run_transaction, txn_fail)
+        if doc is None:
+            return False
+        cdc.capture("itineraries", itinerary_id, "update", {"status": "failed", "generation": generation, "updated_at": now})
+        if generation.get("job_id"):
+            await _shared_jobs.aset(generation["job_id"], {**generation, "user_id": doc.get("user_id")})
+        await asyncio.to_thread(search.index_trip, itinerary_id, doc)
+        return True
+    except Exception:
+        logger.exception("failed to mark interrupted generation of %s", itinerary_id)
+        return False
+
+
+async def shutdown_jobs():
+    """Cancel this worker's unfinished generations (app shutdown) and mark their itineraries failed."""
+    running = [job for job in _jobs.values() if not job.done]
+    for job in running:
+        if job.task is not None:
+            job.task.cancel()
+    await asyncio.gather(*(job.task for job in running if job.task is not None), return_exceptions=True)
+    for job in running:
+        if job.done:
+            continue
+        job.state = "failed"
+        job.error = INTERRUPTED_ERROR
+        job.finished_at = datetime.utcnow()
+        await _fail_interrupted(job.itinerary_id, job.snapshot())
+        await job.emit()
+
+
+async def sweep_stale_generations(max_age_minutes: float = GENERATION_STALE_MINUTES):
+    """
+    Fail itineraries left "generating" for longer than max_age_minutes, e.g. by a worker that
+    was killed mid-job. Jobs still running on this worker are skipped. Returns how many were failed.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
+    docs = await asyncio.to_thread(registered_query("itineraries_by_status_in", status=["generating"]).get)
+    running = {job.itinerary_id for job in _jobs.values() if not job.done}
+    failed = 0
+    for doc in docs:
+        data = doc.to_dict()
+        last_update = _utc_naive(data.get("updated_at") or data.get("created_at"))
+        if doc.id in running or not isinstance(last_update, datetime) or last_update > cutoff:
+            continue
+        if await _fail_interrupted(doc.id, data.get("generation") or {}):
+            failed += 1
+    if failed:
+        logger.warning("marked %d stale generating itineraries as failed", failed)
+    return failed
+
+
+async def generation_sweeper(interval_minutes: float = GENERATION_STALE_MINUTES):
+    """Background loop started from the app lifespan; every worker sweeps, the transaction makes it idempotent."""
+    while True:
+        try:
+            await sweep_stale_generations()
+        except Exception:
+            logger.exception("stale generation sweep failed")
+        await asyncio.sleep(interval_minutes * 60)
+
+
+# -----------------------------
+# Stage implementations
+# -----------------------------
+async def geocode(query: str):
+    """Resolve a place name to {lat, lng, display_name} via Nominatim. Returns None if not found."""
+    params = {"q": query, "format": "json", "limit": 1}
+    results = await http_get_json(GEOCODER_URL, params=params, headers={"User-Agent": GEOCODER_USER_AGENT}, dependency="nominatim")
+    if not results:
+        return None
+    top = results[0]
+    return {"lat": float(top["lat"]), "lng": float(top["lon"]), "display_name": top.get("display_name")}
+
+
+async def geocode_optional(query: Optional[str]):
+    """Geocode a non-essential place (e.g. origin); failures yield None."""
+    if not query:
+        return None
+    try:
+        return await geocode(query)
+    except Exception:
+        logger.warning("geocoding %r failed", query, exc_info=True)
+        return None
+
+
+def trip_dates(body: TripCreateRequest):
+    """Return (start_date, duration_days). Explicit dates win over duration_days."""
+    start = body.start_date
+    if start and body.end_date:
+        if body.end_date < start:
+            raise HTTPException(status_code=400, detail="end_date is before start_date")
+        days = (body.end_date - start).days + 1
+    else:
+        days = body.duration_days or DEFAULT_TRIP_DAYS
+    if days > MAX_TRIP_DAYS:
+        raise HTTPException(status_code=400, detail=f"Trips are limited to {MAX_TRIP_DAYS} days")
+    return start, days
+
+
+def _poi_kind(tags: dict):
+    for key in ("tourism", "natural", "amenity", "historic"):
+        if tags.get(key):
+            return tags[key]
+    return None
+
+
+def activity_from_gem(gem: dict, travelers: int):
+    kind = _poi_kind(gem.get("tags", {}))
+    per_person = ACTIVITY_COST_INR.get(kind, DEFAULT_ACTIVITY_COST_INR)
+    return {
+        "id": f"act_{gem['id']}",
+        "quote_id": f"q_{gem['id']}",
+        "type": "activity",
+        "name": gem.get("name"),
+        "category": kind,
+        "lat": gem.get("lat"),
+        "lng": gem.get("lng"),
+        "duration_min": ACTIVITY_DURATION_MIN.get(kind, DEFAULT_ACTIVITY_DURATION_MIN),
+        "estimated_cost": per_person * travelers,
+        "currency": "INR",
+        "source": gem.get("source", "osm"),
+    }
+
+
+def build_booking_options(body: TripCreateRequest, days: int, gems: List[dict]):
+    """
+    Budget-bounded booking options: activity quotes derived from POIs and hotel tiers
+    sized to the nightly hotel budget. Without a budget every candidate is kept.
+    """
+    nights = max(days - 1, 1)
+    budget = body.budget_in_inr
+    activities = [activity_from_gem(g, body.travelers) for g in gems if g.get("lat") and g.get("lng")]
+    if budget:
+        cap = budget * ACTIVITY_BUDGET_SHARE
+        activities.sort(key=lambda a: a["estimated_cost"])
+        kept, spent = [], 0.0
+        for act in activities:
+            if spent + act["estimated_cost"] > cap:
+                continue
+            kept.append(act)
+            spent += act["estimated_cost"]
+        activities = kept
+
+    hotels = []
+    if budget:
+        per_night = budget * HOTEL_BUDGET_SHARE / nights
+        for stars, share in ((3, 0.5), (4, 0.75), (5, 1.0)):
+            nightly = round(per_night * share, -1)
+            hotels.append({
+                "id": f"ht_{uuid4().hex[:8]}",
+                "quote_id": f"q_ht_{uuid4().hex[:8]}",
+                "type": "hotel",
+                "name": f"{stars}-star stay in {body.destination}",
+                "stars": stars,
+                "nights": nights,
+                "price_per_night": nightly,
+                "price_total": nightly * nights,
+                "currency": "INR",
+                "source": "estimate",
+            })
+    return {"hotels": hotels, "activities": activities}
+
+
+async def _run_stage(job: GenerationJob, stage: str, coro, required: bool = True):
+    """Run one stage, recording progress. Optional stages log and return None on failure."""
+    await job.emit(stage, "running")
+    try:
+        result = await coro
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await job.emit(stage, "failed", error=detail)
+        if required:
+            raise
+        logger.warning("trip generation %s: optional stage %s failed: %s", job.job_id, stage, detail)
+        return None
+    await job.emit(stage, "done")
+    return result
+
+
+async def run_generation(job: GenerationJob, body: TripCreateRequest):
+    doc_ref = itinerary_doc_ref(job.itinerary_id)
+    job.state = "running"
+    await job.emit()
+    try:
+        start, days = trip_dates(body)
+        dest, origin = await asyncio.gather(
+            _run_stage(job, "geocode", geocode(body.destination)),
+            geocode_optional(body.origin),
+        )
+        if not dest:
+            raise HTTPException(status_code=400, detail=f"Could not geocode destination {body.destination}")
+        center = {"lat": dest["lat"], "lng": dest["lng"]}
+
+        # independent provider fetches share the geocoded center
+        weather, gems = await asyncio.gather(
+            _run_stage(job, "weather", fetch_weather_for_latlng(center["lat"], center["lng"]), required=False),
+            _run_stage(job, "pois", fetch_gems_near(center["lat"], center["lng"], filter=",".join(body.themes) or None), required=False),
+        )
+
+        await job.emit("booking_options", "running")
+        booking_options = build_booking_options(body, days, gems or [])
+        await job.emit("booking_options", "done")
+
+        await job.emit("summary", "running")
+        plan = plan_days(booking_options["activities"], days, start_date=start, anchor=center)
+        summary = {
+            "destination": body.destination,
+            "display_name": dest.get("display_name"),
+            "center": center,
+            "origin": origin,
+            "start_date": start.isoformat() if start else None,
+            "duration_days": days,
+            "days": plan["days"],
+        }
+        await job.emit("summary", "done")
+
+        update = {
+            "summary": summary,
+            "booking_options": booking_options,
+            "alternatives_topk": precompute_top_k(summary, booking_options),
+            "status": "upcoming",
+            "updated_at": datetime.utcnow(),
+        }
+        if weather:
+            update["weather"] = weather
+        await _run_stage(job, "save", asyncio.to_thread(doc_ref.update, update))
+
+        # only a saved itinerary is reported as succeeded
+        job.state = "succeeded"
+        job.finished_at = datetime.utcnow()
+        update["generation"] = job.snapshot()
+        await asyncio.to_thread(doc_ref.update, {"generation": update["generation"]})
+        cdc.capture("itineraries", job.itinerary_id, "update", update)
+        await asyncio.to_thread(search.index_trip, job.itinerary_id,
+                                {"user_id": job.user_id, "request": jsonable_encoder(body), **update})
+    except Exception as e:
+        job.state = "failed"
+        job.finished_at = datetime.utcnow()
+        job.error = e.detail if isinstance(e, HTTPException) else "Itinerary generation failed"
+        if not isinstance(e, HTTPException):
+            logger.exception("trip generation %s failed", job.job_id)
+        try:
+            failed = {"status": "failed", "generation": job.snapshot(), "updated_at": datetime.utcnow()}
+            await asyncio.to_thread(doc_ref.update, failed)
+            cdc.capture("itineraries", job.itinerary_id, "update", failed)
+            await asyncio.to_thread(search.index_trip, job.itinerary_id,
+                                    {"user_id": job.user_id, "request": jsonable_encoder(body), "status": "failed"})
+        except Exception:
+            logger.exception("failed to record generation failure for %s", job.itinerary_id)
+    await job.emit()
+
+
+# -----------------------------
+# Endpoints
+# -----------------------------
+@router.post("/trips/create", status_code=202)
+async def create_trip(body: TripCreateRequest, current_user: dict = Depends(rate_limit("trip_create", 5, 3))):
+    """
+    Start itinerary generation and return immediately with a job id.
+    Poll GET /trips/jobs/{job_id} or stream GET /trips/jobs/{job_id}/events for progress.
+    """
+    uid = current_user["uid"]
+    start, days = trip_dates(body)
+    _prune_jobs()
+
+    itinerary_id = f"it_{uuid4().hex[:12]}"
+    job = GenerationJob(f"job_{uuid4().hex[:12]}", itinerary_id, uid)
+    itinerary_doc = {
+        "id": itinerary_id,
+        "user_id": uid,
+        "status": "generating",
+        "request": jsonable_encoder(body),
+        "summary": {"destination": body.destination, "start_date": start.isoformat() if start else None, "duration_days": days},
+        "booking_options": {},
+        "generation": job.snapshot(),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+    await asyncio.to_thread(itinerary_doc_ref(itinerary_id).set, itinerary_doc)
+    cdc.capture("itineraries", itinerary_id, "create", itinerary_doc)
+    await asyncio.to_thread(search.index_trip, itinerary_id, itinerary_doc)
+
+    _jobs[job.job_id] = job
+    job.task = asyncio.create_task(run_generation(job, body))
+    return {"success": True, "job_id": job.job_id, "itinerary_id": itinerary_id, "status": job.state}
+
+
+async def _load_job_state(job_id: str, uid: str):
+    """Job state from this worker's registry, else the shared cache, else the itinerary document."""
+    job = _jobs.get(job_id)
+    if job:
+        if job.user_id != uid:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return job, job.snapshot()
+    shared = await _shared_jobs.aget(job_id)
+    if shared:
+        if shared.pop("user_id", None) != uid:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return None, shared
+    q = await asyncio.to_thread(registered_query("itinerary_by_generation_job", generation_job_id=job_id).get)
+    for doc in q:
+        data = doc.to_dict()
+        if data.get("user_id") != uid:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return None, data.get("generation")
+    raise HTTPException(status_code=404, detail="Job not found")
+
+
+@router.get("/trips/jobs/{job_id}")
+async def get_generation_job(job_id: str, current_user: dict = Depends(verify_firebase_token)):
+    """Poll an itinerary generation job."""
+    _, state = await _load_job_state(job_id, current_user["uid"])
+    return {"success": True, "job": state}
+
+
+@router.get("/trips/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str, current_user: dict = Depends(verify_firebase_token)):
+    """
+    Server-sent events for a generation job: one event per stage change, ending when the
+    job finishes. Jobs running on another worker are followed through the shared cache,
+    one event per observed state change.
+    """
+    job, state = await _load_job_state(job_id, current_user["uid"])
+
+    async def sse():
+        if job is None:
+            last = None
+            current = state
+            while current is not None:
+                if current != last:
+                    yield f"data: {json.dumps(jsonable_encoder(current))}\n\n"
+                    last = current
+                if current.get("state") in ("succeeded", "failed"):
+                    return
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                current = await _shared_jobs.aget(job_id)
+                if current is not None:
+                    current.pop("user_id", None)
+            return
+        sent = 0
+        while True:
+            async with job.changed:
+                if sent >= len(job.events):
+                    await job.changed.wait()
+            for event in job.events[sent:]:
+                yield f"data: {json.dumps(jsonable_encoder(event))}\n\n"
+            sent = len(job.events)
+            # the job is marked done before its result is saved; its last event follows that
+            if sent and job.events[sent - 1]["state"] in ("succeeded", "failed"):
+                return
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
@@ -1,29 +1,52 @@
 # api/trips.py
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, AliasChoices
+from typing import Optional, List
 from datetime import datetime, timedelta, date
 from uuid import uuid4
 import os
 import logging
 import math
-import httpx
 import asyncio
-from google.cloud.firestore_v1.base_query import FieldFilter # Added import for FieldFilter
+# httpx and google.cloud.firestore are imported inside the functions that use them to keep boot fast
 
 # import your firebase db and verify_firebase_token dependency
-from core.firebase import get_db  # Firestore client from your project
-from api.authentication import verify_firebase_token  # your existing dependency
+from core.firebase import get_db, run_transaction  # Firestore client from your project
+from core.metrics import track_dependency, record_cache
+from core.responses import FastJSONResponse
+from core.cache import Cache
+from core import search, cdc
+from core.queries import query as registered_query
+from core.rate_limit import provider_slot
+from core.circuit_breaker import breaker_for, http_failure, CircuitOpenError
+from core.http_client import http_client
+from core.day_planner import plan_days, insert_activity, DAY_MINUTES, ACTIVITY_BUDGET_SHARE
+from core.alternatives import index_for as alternatives_index_for, precompute_top_k
+from core.pricing import price_items, to_minor, FXRateUnavailable, PRICING_CURRENCY
+from api.authentication import verify_firebase_token, rate_limit  # your existing dependency
+from api.hidden_gems import community_gems_near
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1", tags=["Trips"])
 
 # Config
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/onecall")
 OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
 WEATHER_CACHE_TTL_HOURS = int(os.getenv("WEATHER_CACHE_TTL_HOURS", "6"))
+WEATHER_CELL_DEG = float(os.getenv("WEATHER_CELL_DEG", "0.1"))  # ~11 km; one forecast per cell
+WEATHER_FETCH_CONCURRENCY = int(os.getenv("WEATHER_FETCH_CONCURRENCY", "4"))  # cells fetched at once per trip
 DEFAULT_HOLD_TTL_MIN = 30
 HTTPX_TIMEOUT = 10.0  # seconds
+GEMS_CACHE_SECONDS = int(os.getenv("GEMS_CACHE_SECONDS", "3600"))
+GEMS_FALLBACK_SECONDS = 7 * 24 * 3600  # last good Overpass answers kept for outages
+ACL_CACHE_SECONDS = 3600
+
+# shared cache tier (see core.cache): reused across itineraries and workers
+_weather_cache = Cache("weather", ttl=WEATHER_CACHE_TTL_HOURS * 3600)
+_gems_cache = Cache("gems", ttl=GEMS_CACHE_SECONDS)
+_gems_fallback = Cache("gems_last_good", ttl=GEMS_FALLBACK_SECONDS)
+_itinerary_owners = Cache("itinerary_acl", ttl=ACL_CACHE_SECONDS)  # owner uid never changes
 
 
 # -----------------------------
@@ -45,21 +68,40 @@ class CustomizeRequest(BaseModel):
     actions: List[CustomizeAction]
 
 
+class AlternativeConstraints(BaseModel):
+    max_price: Optional[float] = Field(None, ge=0)
+    min_price: Optional[float] = Field(None, ge=0)
+    distance_km: Optional[float] = Field(None, gt=0)  # from lat/lng, else the current item, else the itinerary center
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lng: Optional[float] = Field(None, ge=-180, le=180)
+    min_stars: Optional[float] = Field(None, ge=0, validation_alias=AliasChoices("min_stars", "stars"))
+    theme: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=100)
+
+
 class AlternativesRequest(BaseModel):
     item_type: str
     current_id: str
-    constraints: Optional[Dict[str, Any]] = None  # e.g., max_price, distance_km
+    constraints: Optional[AlternativeConstraints] = None
+
+
+class ReplanRequest(BaseModel):
+    budget_in_inr: Optional[float] = Field(None, ge=0)  # cap on activity spend; omitted = the itinerary's stored budget
+    duration_days: Optional[int] = Field(None, ge=1, le=30)
+    start_date: Optional[date] = None
+    day_minutes: Optional[int] = Field(None, ge=60, le=24 * 60)
 
 
 class ReservationItem(BaseModel):
     type: str  # hotel|flight|activity
-    provider_quote_id: str
-    amount: Optional[float] = None
-    currency: Optional[str] = "INR"
+    provider_quote_id: str  # must match a quote in the itinerary's booking_options, which sets the price
+    amount: Optional[float] = Field(None, ge=0)  # optional check: rejected when it differs from the quote
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
 
 
 class ReserveRequest(BaseModel):
     items: List[ReservationItem]
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)  # total currency; default: the items' common one
     hold_ttl_minutes: Optional[int] = Field(DEFAULT_HOLD_TTL_MIN, ge=1, le=720)
     idempotency_key: Optional[str] = None
 
@@ -79,11 +121,58 @@ def bookings_col():
     return get_db().collection("bookings")
 
 
-async def http_get_json(url: str, params: dict = None, timeout: float = HTTPX_TIMEOUT):
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.get(url, params=params)
-        r.raise_for_status()
-        return r.json()
+def load_owned_itinerary(itinerary_id: str, uid: str):
+    """
+    Read an itinerary and check ownership. Returns (doc_ref, data).
+    Raises 404 if missing and 403 if it belongs to another user.
+    """
+    owner = _itinerary_owners.get(itinerary_id)
+    if owner is not None and owner != uid:
+        # known to belong to someone else: refuse without reading the document
+        raise HTTPException(status_code=403, detail="Forbidden")
+    doc_ref = itinerary_doc_ref(itinerary_id)
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
+        raise HTTPException(status_code=404, detail="Itinerary not found")
+    data = snapshot.to_dict()
+    if data.get("user_id"):
+        _itinerary_owners.set(itinerary_id, data["user_id"])
+    if data.get("user_id") != uid:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    data["id"] = snapshot.id
+    return doc_ref, data
+
+
+def itinerary_center(it: dict):
+    """
+    Return (lat, lng) for an itinerary: summary.center, else the first activity with coordinates.
+    Returns (None, None) when no coordinates are available.
+    """
+    summary = it.get("summary", {})
+    center = summary.get("center")
+    if center and center.get("lat") and center.get("lng"):
+        return float(center["lat"]), float(center["lng"])
+    for d in summary.get("days", []):
+        for act in d.get("activities", []):
+            if act.get("lat") and act.get("lng"):
+                return float(act["lat"]), float(act["lng"])
+    return None, None
+
+
+async def http_get_json(url: str, params: dict = None, timeout: float = HTTPX_TIMEOUT, headers: dict = None, dependency: str = "http"):
+    import httpx
+    # breaker outside the slot so an open circuit fails fast without queueing
+    async with breaker_for(dependency).guard(httpx.HTTPError, is_failure=http_failure):
+        async with provider_slot(dependency):
+            with track_dependency(dependency, "GET"):
+                r = await http_client().get(url, params=params, headers=headers, timeout=timeout)
+                r.raise_for_status()
+                return r.json()
+
+
+def provider_unavailable(e: CircuitOpenError):
+    return HTTPException(status_code=503, detail=f"{e.name} is temporarily unavailable",
+                         headers={"Retry-After": str(int(math.ceil(e.retry_after)))})
 
 
 def bbox_from_latlng(lat: float, lng: float, radius_m: int):
@@ -113,17 +202,18 @@ async def list_trips(status: Optional[str] = None, current_user: dict = Depends(
     """
     uid = current_user["uid"]
     try:
-        q = get_db().collection("itineraries").where(filter=FieldFilter("user_id", "==", uid))
         if status:
-            q = q.where(filter=FieldFilter("status", "==", status))
-        q = q.order_by("created_at", direction="DESCENDING").limit(100)
+            q = registered_query("itineraries_by_user_status", user_id=uid, status=status)
+        else:
+            q = registered_query("itineraries_by_user", user_id=uid)
         docs = q.stream()
         results = []
         for d in docs: # Changed from async for to for
             data = d.to_dict()
             data["id"] = d.id
             results.append(data)
-        return {"success": True, "trips": results}
+        # returned directly: skips the jsonable_encoder pass over every nested itinerary
+        return FastJSONResponse({"success": True, "trips": results})
     except Exception as e:
         logger.exception("list_trips failed")
         raise HTTPException(status_code=500, detail="Failed to list trips")
@@ -136,14 +226,8 @@ async def get_trip(itinerary_id: str, current_user: dict = Depends(verify_fireba
     """
     uid = current_user["uid"]
     try:
-        doc = itinerary_doc_ref(itinerary_id).get()
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="Itinerary not found")
-        data = doc.to_dict()
-        if data.get("user_id") != uid:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        data["id"] = doc.id
-        return {"success": True, "itinerary": data}
+        _, data = load_owned_itinerary(itinerary_id, uid)
+        return FastJSONResponse({"success": True, "itinerary": data})
     except HTTPException:
         raise
     except Exception:
@@ -226,13 +310,16 @@ async def customize_trip(itinerary_id: str, body: CustomizeRequest, current_user
                     # If alternative not found, fail
                     raise HTTPException(status_code=400, detail="alternative_id not available in booking options")
             elif action.op == "add":
-                # add new item to summary; we append to day 0 by default
-                new_item = {"id": action.alternative_id, "type": action.item_type}
+                # add new item to summary; prefer the full quote from booking_options so it
+                # carries lat/lng and can be slotted into the day/position that adds least travel
+                alts = booking_options.get(action.item_type + "s", [])
+                found = next((x for x in alts if x.get("id") == action.alternative_id or x.get("quote_id") == action.alternative_id), None)
+                new_item = dict(found) if found else {"id": action.alternative_id, "type": action.item_type}
                 days = summary.setdefault("days", [])
                 if not days:
                     summary["days"] = [{"date": str(datetime.utcnow().date()), "activities": [new_item]}]
                 else:
-                    days[0].setdefault("activities", []).append(new_item)
+                    insert_activity(days, new_item, anchor=summary.get("center"))
             elif action.op == "remove":
                 # remove item from summary and booking_options (best effort)
                 removed = False
@@ -253,13 +340,16 @@ async def customize_trip(itinerary_id: str, body: CustomizeRequest, current_user
             "booking_options": booking_options,
             "summary": summary,
             "edits": edits,
+            "alternatives_topk": precompute_top_k(summary, booking_options),
             "updated_at": datetime.utcnow()
         }
         tx.update(doc_ref, update_data)
-        return update_data
+        return {**doc, **update_data}
 
     try:
-        db.run_transaction(txn_update)
+        updated = await asyncio.to_thread(run_transaction, txn_update)
+        cdc.capture("itineraries", itinerary_id, "update", updated)
+        await asyncio.to_thread(search.index_trip, itinerary_id, updated)
         return {"success": True, "message": "Customize applied"}
     except HTTPException:
         raise
@@ -268,50 +358,124 @@ async def customize_trip(itinerary_id: str, body: CustomizeRequest, current_user
         raise HTTPException(status_code=500, detail="Failed to apply customize")
 
 
+@router.post("/trips/{itinerary_id}/replan")
+async def replan_trip(itinerary_id: str, body: ReplanRequest, current_user: dict = Depends(rate_limit("replan", 20))):
+    """
+    Rebuild summary.days from the itinerary's activities and booking_options["activities"].
+    Candidates are selected under the budget/time limits and each day is route-ordered.
+    Without budget_in_inr the last replan's activity budget is reused, else the activity
+    share of the budget the trip was generated with.
+    Returns the new days and the candidates that did not fit.
+    The read, plan and write run in one transaction, like customize_trip.
+    """
+    uid = current_user["uid"]
+    doc_ref = itinerary_doc_ref(itinerary_id)
+
+    def txn_replan(tx):
+        snapshot = doc_ref.get(transaction=tx)
+        if not snapshot.exists:
+            raise HTTPException(status_code=404, detail="Itinerary not found")
+        it = snapshot.to_dict()
+        if it.get("user_id") != uid:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        summary = it.get("summary", {})
+        days = summary.get("days", [])
+
+        # custom activities may have no id: the same place is the same name at the same coordinates
+        candidates = {}
+        for act in [a for d in days for a in d.get("activities", [])] + it.get("booking_options", {}).get("activities", []):
+            candidates.setdefault((act.get("id") or act.get("name"), act.get("lat"), act.get("lng")), act)
+
+        budget = body.budget_in_inr
+        if budget is None:
+            budget = summary.get("activity_budget_in_inr")
+        if budget is None and (it.get("request") or {}).get("budget_in_inr"):
+            budget = float(it["request"]["budget_in_inr"]) * ACTIVITY_BUDGET_SHARE
+
+        duration_days = body.duration_days or summary.get("duration_days") or len(days) or 1
+        start = body.start_date
+        if start is None and summary.get("start_date"):
+            try:
+                start = date.fromisoformat(summary["start_date"])
+            except ValueError:
+                start = None
+
+        plan = plan_days(
+            list(candidates.values()),
+            duration_days,
+            budget_in_inr=budget,
+            start_date=start,
+            anchor=summary.get("center"),
+            day_minutes=body.day_minutes or DAY_MINUTES,
+        )
+        summary["days"] = plan["days"]
+        summary["duration_days"] = duration_days
+        if body.budget_in_inr is not None:
+            summary["activity_budget_in_inr"] = body.budget_in_inr
+        if start:
+            summary["start_date"] = start.isoformat()
+        update = {
+            "summary": summary,
+            "alternatives_topk": precompute_top_k(summary, it.get("booking_options", {})),
+            "updated_at": datetime.utcnow()
+        }
+        tx.update(doc_ref, update)
+        return {**it, **update}, update, plan
+
+    try:
+        updated, update, plan = await asyncio.to_thread(run_transaction, txn_replan)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("replan_trip error")
+        raise HTTPException(status_code=500, detail="Failed to replan trip")
+    cdc.capture("itineraries", itinerary_id, "update", update)
+    await asyncio.to_thread(search.index_trip, itinerary_id, updated)
+    return {"success": True, "days": plan["days"], "unscheduled": plan["unscheduled"], "total_cost": plan["total_cost"]}
+
+
 @router.post("/trips/{itinerary_id}/alternatives")
 async def get_alternatives(itinerary_id: str, body: AlternativesRequest, current_user: dict = Depends(verify_firebase_token)):
     """
-    Return alternatives for a given item. First check booking_options in Firestore (precomputed alternates).
-    If none, return a lightweight mock set (or optionally invoke real agent).
+    Return alternatives for a given item from the itinerary's booking_options.
+    Without constraints the precomputed top-k (alternatives_topk) is served; otherwise the
+    alternatives index is queried (max_price, min_price, distance_km, min_stars, theme, limit).
     """
-    uid = current_user["uid"]
-    doc = itinerary_doc_ref(itinerary_id).get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Itinerary not found")
-    data = doc.to_dict()
-    if data.get("user_id") != uid:
-        raise HTTPException(status_code=403, detail="Forbidden")
+    _, data = load_owned_itinerary(itinerary_id, current_user["uid"])
+    index = alternatives_index_for(itinerary_id, data)
+    constraints = body.constraints.model_dump(exclude_none=True) if body.constraints else {}
+
+    precomputed = (data.get("alternatives_topk") or {}).get(body.current_id)
+    if precomputed and not constraints:
+        alternatives = [a for a in (index.get(body.item_type, alt_id) for alt_id in precomputed) if a]
+        if alternatives:
+            return {"success": True, "alternatives": alternatives}
+
+    # distance is measured from the current item, falling back to the itinerary center
+    current = index.get(body.item_type, body.current_id)
+    if current and current.get("lat") is not None and current.get("lng") is not None:
+        origin = (float(current["lat"]), float(current["lng"]))
+    else:
+        lat, lng = itinerary_center(data)
+        origin = (lat, lng) if lat is not None else None
+    alternatives = index.query(body.item_type, constraints, origin=origin, exclude={body.current_id})
+    return {"success": True, "alternatives": alternatives}
+
+
+def find_quote(booking_options: dict, quote_id: str):
+    """The booking option whose quote_id (or id) is quote_id, or None."""
+    for arr in booking_options.values():
+        if isinstance(arr, list):
+            for option in arr:
+                if option.get("quote_id") == quote_id or option.get("id") == quote_id:
+                    return option
+    return None
 
-    # check booking_options for alternatives
-    booking_options = data.get("booking_options", {})
-    candidates = booking_options.get(body.item_type + "s", []) or booking_options.get("alternatives", [])
-    # filter by constraints (simple)
-    max_price = None
-    if body.constraints:
-        max_price = body.constraints.get("max_price")
-    filtered = []
-    for c in candidates:
-        price = c.get("price_total") or c.get("total_price") or c.get("amount")
-        if max_price is not None and price is not None:
-            if float(price) > float(max_price):
-                continue
-        filtered.append(c)
-
-    # if none found, return simple mocked alternatives (so frontend can show options)
-    if not filtered:
-        # Minimal mock for hotels/activity
-        if body.item_type == "hotel":
-            filtered = [
-                {"id": f"mock_ht_{uuid4().hex[:6]}", "name": "Mock Hotel A", "price_total": 2500, "stars": 3},
-                {"id": f"mock_ht_{uuid4().hex[:6]}", "name": "Mock Hotel B", "price_total": 3200, "stars": 4}
-            ]
-        else:
-            filtered = [
-                {"id": f"mock_act_{uuid4().hex[:6]}", "name": "Mock Activity A", "estimated_cost": 300},
-                {"id": f"mock_act_{uuid4().hex[:6]}", "name": "Mock Activity B", "estimated_cost": 450}
-            ]
 
-    return {"success": True, "alternatives": filtered}
+def quote_price(quote: dict):
+    """(amount, currency) of a booking option; a quote without a currency is in PRICING_CURRENCY."""
+    amount = quote.get("total_price") or quote.get("price_total") or quote.get("amount") or quote.get("estimated_cost") or 0.0
+    return amount, (quote.get("currency") or PRICING_CURRENCY).upper()
 
 
 @router.post("/trips/{itinerary_id}/reserve")
@@ -332,42 +496,43 @@ async def reserve_items(itinerary_id: str, body: ReserveRequest, current_user: d
 
     # idempotency check: if provided, attempt to find existing reservation
     if body.idempotency_key:
-        q = reservations_col().where("idempotency_key", "==", body.idempotency_key).limit(1).get()
+        q = registered_query("reservation_by_idempotency_key", idempotency_key=body.idempotency_key).get()
         for r in q:
             return {"success": True, "reservation_id": r.id, "status": r.to_dict().get("status")}
 
-    # compute total amount (use provided amounts if present, otherwise try to match provider_quote_id in itinerary booking_options)
-    total_amount = 0.0
-    currency = "INR"
-    resolved_items = []
+    # prices come from the itinerary's quotes; a client amount/currency is only checked against them
+    quoted = []
     booking_options = it_data.get("booking_options", {})
 
     for item in body.items:
-        resolved_amount = None
-        if item.amount:
-            resolved_amount = float(item.amount)
-        else:
-            # try to find quote by provider_quote_id in booking_options
-            found = None
-            for key, arr in booking_options.items():
-                if isinstance(arr, list):
-                    for it in arr:
-                        if it.get("quote_id") == item.provider_quote_id or it.get("id") == item.provider_quote_id:
-                            found = it
-                            break
-                    if found:
-                        break
-            if found:
-                resolved_amount = float(found.get("total_price") or found.get("price_total") or found.get("amount") or 0.0)
-        if resolved_amount is None:
-            # fallback: assume 0 and keep item
-            resolved_amount = 0.0
-        total_amount += resolved_amount
+        quote = find_quote(booking_options, item.provider_quote_id)
+        if quote is None:
+            raise HTTPException(status_code=400, detail=f"Unknown quote {item.provider_quote_id} for this itinerary")
+        amount, currency = quote_price(quote)
+        if item.currency and item.currency.upper() != currency:
+            raise HTTPException(status_code=400, detail=f"Quote {item.provider_quote_id} is priced in {currency}")
+        if item.amount is not None and to_minor(item.amount, currency) != to_minor(amount, currency):
+            raise HTTPException(status_code=400, detail=f"Amount for quote {item.provider_quote_id} does not match the quote")
+        quoted.append((amount, currency))
+
+    # normalise to one currency with the FX table and total in Decimal
+    try:
+        priced = price_items(quoted, body.currency)
+    except FXRateUnavailable as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    currency = priced["currency"]
+    total_amount = float(priced["total"])
+    resolved_items = []
+    for item, line in zip(body.items, priced["lines"]):
         resolved_items.append({
             "type": item.type,
             "provider_quote_id": item.provider_quote_id,
-            "amount": resolved_amount,
-            "currency": item.currency or currency,
+            "amount": float(line["amount"]),
+            "currency": line["currency"],
+            "converted_amount": float(line["converted"]),
+            "fx_rate": float(line["fx_rate"]),
             "mock_hold_id": f"hold_{uuid4().hex[:8]}"
         })
 
@@ -379,7 +544,9 @@ async def reserve_items(itinerary_id: str, body: ReserveRequest, current_user: d
         "user_id": uid,
         "items": resolved_items,
         "total_amount": total_amount,
+        "total_amount_minor": priced["total_minor"],
         "currency": currency,
+        "fx": priced["fx"],
         "status": "held",
         "expires_at": expires_at,
         "created_at": datetime.utcnow(),
@@ -388,11 +555,15 @@ async def reserve_items(itinerary_id: str, body: ReserveRequest, current_user: d
 
     # save reservation
     reservations_col().document(reservation_id).set(reservation_doc)
+    cdc.capture("reservations", reservation_id, "create", reservation_doc)
     # update itinerary to reference this reservation id
-    itinerary_doc_ref(itinerary_id).update({
-        "reservations": get_db().ArrayUnion([reservation_id]),
+    from google.cloud import firestore
+    itinerary_update = {
+        "reservations": firestore.ArrayUnion([reservation_id]),
         "updated_at": datetime.utcnow()
-    })
+    }
+    itinerary_doc_ref(itinerary_id).update(itinerary_update)
+    cdc.capture("itineraries", itinerary_id, "update", itinerary_update)
 
     return {
         "success": True,
@@ -421,13 +592,18 @@ async def cancel_reservation(reservation_id: str, current_user: dict = Depends(v
     status = data.get("status")
     if status in ("cancelled", "released"):
         return {"success": True, "message": "Reservation already cancelled/released"}
-    doc_ref.update({
+    cancelled = {
         "status": "cancelled",
         "cancelled_at": datetime.utcnow()
-    })
+    }
+    doc_ref.update(cancelled)
+    cdc.capture("reservations", reservation_id, "update", cancelled)
     # remove reservation from itinerary reservations array
     itinerary_ref = itinerary_doc_ref(data.get("itinerary_id"))
-    itinerary_ref.update({"reservations": get_db().ArrayRemove([reservation_id]), "updated_at": datetime.utcnow()})
+    from google.cloud import firestore
+    itinerary_update = {"reservations": firestore.ArrayRemove([reservation_id]), "updated_at": datetime.utcnow()}
+    itinerary_ref.update(itinerary_update)
+    cdc.capture("itineraries", itinerary_ref.id, "update", itinerary_update)
     return {"success": True, "message": "Reservation cancelled"}
 
 
@@ -437,21 +613,30 @@ async def cancel_reservation(reservation_id: str, current_user: dict = Depends(v
 async def fetch_weather_for_latlng(lat: float, lng: float):
     """
     Use OpenWeatherMap One Call API (free) to fetch daily forecasts.
-    Requires OPENWEATHER_API_KEY in env.
+    Requires OPENWEATHER_API_KEY in env. Forecasts are fetched for the centre of the
+    weather_cell grid cell (WEATHER_CELL_DEG, 0.1° by default, ~11 km) containing the
+    point and shared by every caller in that cell for WEATHER_CACHE_TTL_HOURS.
     """
     if not OPENWEATHER_API_KEY:
         raise HTTPException(status_code=500, detail="OpenWeatherMap API key not configured")
+    import httpx
 
-    url = "https://api.openweathermap.org/data/2.5/onecall"
+    cell_lat, cell_lng = weather_cell(lat, lng)
+    cell = f"{cell_lat},{cell_lng}"
+    cached = await _weather_cache.aget(cell)
+    if cached is not None:
+        return cached
+
+    url = OPENWEATHER_URL
     params = {
-        "lat": lat,
-        "lon": lng,
+        "lat": cell_lat,
+        "lon": cell_lng,
         "exclude": "minutely,hourly,alerts",
         "units": "metric",
         "appid": OPENWEATHER_API_KEY
     }
     try:
-        data = await http_get_json(url, params=params, timeout=HTTPX_TIMEOUT)
+        data = await http_get_json(url, params=params, timeout=HTTPX_TIMEOUT, dependency="openweather")
         # keep only daily forecast
         daily = data.get("daily", [])
         simplified = []
@@ -462,64 +647,141 @@ async def fetch_weather_for_latlng(lat: float, lng: float):
                 "weather": d.get("weather", []),
                 "pop": d.get("pop", 0)  # precipitation probability
             })
-        return {"fetched_at": datetime.utcnow(), "daily": simplified}
+        weather = {"fetched_at": datetime.utcnow(), "daily": simplified}
+        await _weather_cache.aset(cell, weather)
+        return weather
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
     except httpx.HTTPError as e:
         logger.exception("OpenWeather fetch failed")
         raise HTTPException(status_code=502, detail="Weather provider error")
 
 
-@router.get("/trips/{itinerary_id}/weather")
-async def get_trip_weather(itinerary_id: str, current_user: dict = Depends(verify_firebase_token)):
+def weather_cell(lat: float, lng: float):
+    """Centre of the WEATHER_CELL_DEG grid cell containing (lat, lng); forecasts are fetched and cached per cell."""
+    step = WEATHER_CELL_DEG
+    return (round((lat // step) * step + step / 2, 4), round((lng // step) * step + step / 2, 4))
+
+
+def day_locations(it: dict):
     """
-    Return weather for itinerary. Requires itinerary.summary.center {lat, lng} or list of days with lat/lng per day.
-    Caches result in itinerary.weather (with fetched_at) for WEATHER_CACHE_TTL_HOURS.
+    [(day number, ISO date or None, (lat, lng) or None)] for summary.days. A day is located at
+    its first activity with coordinates, else the itinerary centre; dates missing on a day are
+    derived from summary.start_date.
     """
-    uid = current_user["uid"]
-    doc_ref = itinerary_doc_ref(itinerary_id)
-    snapshot = doc_ref.get()
-    if not snapshot.exists:
-        raise HTTPException(status_code=404, detail="Itinerary not found")
-    it = snapshot.to_dict()
-    if it.get("user_id") != uid:
-        raise HTTPException(status_code=403, detail="Forbidden")
+    summary = it.get("summary", {})
+    center = itinerary_center(it)
+    start = None
+    if summary.get("start_date"):
+        try:
+            start = date.fromisoformat(str(summary["start_date"])[:10])
+        except ValueError:
+            start = None
+    located = []
+    for i, d in enumerate(summary.get("days", [])):
+        day_date = str(d["date"])[:10] if d.get("date") else (start + timedelta(days=i)).isoformat() if start else None
+        coords = next(((float(a["lat"]), float(a["lng"])) for a in d.get("activities", []) if a.get("lat") and a.get("lng")), None)
+        if coords is None and center[0] is not None:
+            coords = center
+        located.append((d.get("day", i + 1), day_date, coords))
+    return located
+
+
+async def fetch_weather_by_day(it: dict):
+    """
+    Forecast for each itinerary day at that day's own location. Coordinates are deduped by
+    weather cell and the distinct cells fetched concurrently (WEATHER_FETCH_CONCURRENCY at a
+    time); each day is then joined to its cell's forecast entry for that date. "daily" keeps
+    the full forecast at the itinerary centre for existing clients.
+    Raises the first provider error only when no cell could be fetched.
+    """
+    lat, lng = itinerary_center(it)
+    if lat is None or lng is None:
+        raise HTTPException(status_code=400, detail="Itinerary missing coordinates for weather lookup")
+    center_cell = weather_cell(lat, lng)
+    days = day_locations(it)
+    cells = list(dict.fromkeys([center_cell] + [weather_cell(*coords) for _, _, coords in days if coords]))
 
+    slots = asyncio.Semaphore(WEATHER_FETCH_CONCURRENCY)
+
+    async def fetch(cell):
+        async with slots:
+            try:
+                return await fetch_weather_for_latlng(*cell)
+            except HTTPException as e:
+                return e
+
+    results = dict(zip(cells, await asyncio.gather(*(fetch(cell) for cell in cells))))
+    errors = [r for r in results.values() if isinstance(r, HTTPException)]
+    if len(errors) == len(results):
+        raise errors[0]
+
+    by_date = {
+        cell: {entry["dt"]: entry for entry in forecast.get("daily", [])}
+        for cell, forecast in results.items() if not isinstance(forecast, HTTPException)
+    }
+    per_day = []
+    for day, day_date, coords in days:
+        cell = weather_cell(*coords) if coords else None
+        forecasts = by_date.get(cell)
+        per_day.append({
+            "day": day,
+            "date": day_date,
+            "cell": {"lat": cell[0], "lng": cell[1]} if cell else None,
+            "forecast": forecasts.get(day_date) if forecasts and day_date else None,
+            "unavailable": cell is not None and forecasts is None,
+        })
+
+    center = results[center_cell]
+    if isinstance(center, HTTPException):
+        center = next(r for r in results.values() if not isinstance(r, HTTPException))
+    fetched = [r["fetched_at"] for r in results.values() if not isinstance(r, HTTPException)]
+    return {"fetched_at": min(fetched), "daily": center.get("daily", []), "days": per_day, "cells": len(cells)}
+
+
+async def resolve_trip_weather(doc_ref, it: dict):
+    """
+    Weather for an already-loaded itinerary. Serves itinerary.weather while it is younger
+    than WEATHER_CACHE_TTL_HOURS, otherwise resolves fresh per-day forecasts and stores them on the doc.
+    If the provider is down (circuit open, 5xx, timeout) an expired itinerary.weather is
+    returned with stale=True instead of failing.
+    """
     # check cached weather
     weather = it.get("weather")
     if weather and weather.get("fetched_at"):
         fetched_at = weather.get("fetched_at")
         if isinstance(fetched_at, datetime):
-            fetched_dt = fetched_at
+            fetched_dt = fetched_at.replace(tzinfo=None)
         else:
             try:
                 fetched_dt = datetime.fromisoformat(fetched_at)
             except Exception:
                 fetched_dt = None
         if fetched_dt and (datetime.utcnow() - fetched_dt) < timedelta(hours=WEATHER_CACHE_TTL_HOURS):
-            return {"success": True, "weather": weather}
+            record_cache("itinerary_weather", True)
+            return weather
+    record_cache("itinerary_weather", False)
 
-    # need coordinates: prefer itinerary.summary.center or first POI lat/lng
-    summary = it.get("summary", {})
-    center = summary.get("center")
-    lat = None; lng = None
-    if center and center.get("lat") and center.get("lng"):
-        lat = float(center["lat"]); lng = float(center["lng"])
-    else:
-        # attempt to find first POI with lat/lng
-        days = summary.get("days", [])
-        for d in days:
-            for act in d.get("activities", []):
-                if act.get("lat") and act.get("lng"):
-                    lat = float(act["lat"]); lng = float(act["lng"])
-                    break
-            if lat:
-                break
+    try:
+        weather_data = await fetch_weather_by_day(it)
+    except HTTPException as e:
+        if e.status_code in (502, 503) and weather and weather.get("daily"):
+            return {**weather, "stale": True}
+        raise
+    # save to itinerary doc
+    await asyncio.to_thread(doc_ref.update, {"weather": weather_data, "updated_at": datetime.utcnow()})
+    return weather_data
 
-    if lat is None or lng is None:
-        raise HTTPException(status_code=400, detail="Itinerary missing coordinates for weather lookup")
 
-    weather_data = await fetch_weather_for_latlng(lat, lng)
-    # save to itinerary doc
-    doc_ref.update({"weather": weather_data, "updated_at": datetime.utcnow()})
+@router.get("/trips/{itinerary_id}/weather")
+async def get_trip_weather(itinerary_id: str, current_user: dict = Depends(rate_limit("weather", 60))):
+    """
+    Return weather for itinerary. Requires itinerary.summary.center {lat, lng} or list of days with lat/lng per day.
+    "days" holds each day's forecast at that day's location; "daily" the forecast at the centre.
+    Caches result in itinerary.weather (with fetched_at) for WEATHER_CACHE_TTL_HOURS.
+    """
+    doc_ref, it = load_owned_itinerary(itinerary_id, current_user["uid"])
+    weather_data = await resolve_trip_weather(doc_ref, it)
     return {"success": True, "weather": weather_data}
 
 
@@ -531,9 +793,7 @@ def build_overpass_query(south, west, north, east, filters: List[str]):
     Build a basic OverpassQL query that searches multiple tags.
     `filters` is a list like ['amenity=cafe', 'natural=waterfall'].
     """
-    # search nodes and ways
-    filters_q = "".join([f'node["{k}"="{v}"]({south},{west},{north},{east});way["{k}"="{v}"]({south},{west},{north},{east});' if "=" in f else "" for f in filters])
-    # For convenience allow filters provided as 'amenity=cafe' strings
+    # search nodes and ways; filters are provided as 'amenity=cafe' strings
     parts = []
     for f in filters:
         if "=" in f:
@@ -548,42 +808,57 @@ def build_overpass_query(south, west, north, east, filters: List[str]):
     return q
 
 
-@router.get("/trips/{itinerary_id}/hidden_gems")
-async def hidden_gems(itinerary_id: str, filter: Optional[str] = None, radius_m: Optional[int] = 5000, current_user: dict = Depends(verify_firebase_token)):
+async def resolve_hidden_gems(it: dict, filter: Optional[str] = None, radius_m: Optional[int] = 5000):
     """
-    Return 'hidden gems' using OSM Overpass.
-    filter param: comma-separated topics (heritage, cafe, waterfall, viewpoint, temple, museum, etc.)
-    Requires itinerary summary center lat/lng.
+    Hidden gems around an already-loaded itinerary's center: community-submitted gems
+    (nearest first, from the geohash index) followed by OSM gems (see fetch_gems_near).
+    Returns {"count", "gems"}; while Overpass is unavailable the last good answer for the
+    same query is served with stale=True and its fetched_at.
     """
-    uid = current_user["uid"]
-    doc_ref = itinerary_doc_ref(itinerary_id)
-    snapshot = doc_ref.get()
-    if not snapshot.exists:
-        raise HTTPException(status_code=404, detail="Itinerary not found")
-    it = snapshot.to_dict()
-    if it.get("user_id") != uid:
-        raise HTTPException(status_code=403, detail="Forbidden")
-
-    summary = it.get("summary", {})
-    center = summary.get("center")
-    lat = None; lng = None
-    if center and center.get("lat") and center.get("lng"):
-        lat = float(center["lat"]); lng = float(center["lng"])
-    else:
-        # fallback: attempt to pick first activity coordinates
-        days = summary.get("days", [])
-        for d in days:
-            for act in d.get("activities", []):
-                if act.get("lat") and act.get("lng"):
-                    lat = float(act["lat"]); lng = float(act["lng"])
-                    break
-            if lat:
-                break
-
+    lat, lng = itinerary_center(it)
     if lat is None or lng is None:
         raise HTTPException(status_code=400, detail="Itinerary missing coordinates for hidden_gems lookup")
-
-    south, west, north, east = bbox_from_latlng(lat, lng, radius_m)
+    osm, community = await asyncio.gather(
+        fetch_gems_near(lat, lng, filter=filter, radius_m=radius_m),
+        community_gems_near(lat, lng, radius_m or 5000),
+        return_exceptions=True,
+    )
+    if isinstance(community, Exception):
+        logger.warning("Community gems lookup failed: %s", community)
+        community = []
+    topics = {t.strip().lower() for t in (filter or "").split(",") if t.strip()}
+    if topics:
+        community = [g for g in community if str(g["tags"].get("category") or "").lower() in topics]
+    if isinstance(osm, HTTPException):
+        cached = await _gems_fallback.aget(gems_cache_key(lat, lng, filter, radius_m)) if osm.status_code in (502, 503) else None
+        if cached is None:
+            raise osm
+        gems = community + cached["gems"]
+        return {"count": len(gems), "gems": gems, "stale": True, "fetched_at": cached["fetched_at"]}
+    if isinstance(osm, BaseException):
+        raise osm
+    gems = community + osm
+    return {"count": len(gems), "gems": gems}
+
+
+def gems_cache_key(lat: float, lng: float, filter: Optional[str], radius_m: Optional[int]):
+    topics = ",".join(sorted(t.strip().lower() for t in (filter or "").split(",") if t.strip()))
+    return f"{lat:.3f},{lng:.3f}|{topics}|{radius_m or 5000}"
+
+
+async def fetch_gems_near(lat: float, lng: float, filter: Optional[str] = None, radius_m: Optional[int] = 5000):
+    """
+    Query Overpass for gems within radius_m of (lat, lng).
+    filter: comma-separated topics, same vocabulary as the hidden_gems endpoint.
+    Returns the gems list (max 50), richest named places first. Answers are cached per
+    query for GEMS_CACHE_SECONDS.
+    """
+    import httpx
+    cache_key = gems_cache_key(lat, lng, filter, radius_m)
+    cached = await _gems_cache.aget(cache_key)
+    if cached is not None:
+        return cached
+    south, west, north, east = bbox_from_latlng(lat, lng, radius_m or 5000)
     filters = []
     if filter:
         for token in filter.split(","):
@@ -600,10 +875,14 @@ async def hidden_gems(itinerary_id: str, filter: Optional[str] = None, radius_m:
 
     overpass_query = build_overpass_query(south, west, north, east, filters)
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(OVERPASS_URL, data=overpass_query.encode("utf-8"))
-            r.raise_for_status()
-            payload = r.json()
+        async with breaker_for("overpass").guard(httpx.HTTPError, is_failure=http_failure):
+            async with provider_slot("overpass"):
+                with track_dependency("overpass", "POST"):
+                    r = await http_client().post(OVERPASS_URL, content=overpass_query.encode("utf-8"), timeout=30.0)
+                    r.raise_for_status()
+                    payload = r.json()
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
     except httpx.HTTPError:
         logger.exception("Overpass request failed")
         raise HTTPException(status_code=502, detail="Failed to fetch hidden gems from Overpass")
@@ -624,5 +903,19 @@ async def hidden_gems(itinerary_id: str, filter: Optional[str] = None, radius_m:
             "source": "osm"
         })
     # De-dup & sort by presence of name & tag richness
-    gems_sorted = sorted(gems, key=lambda x: (0 if x.get("name") != "Unnamed" else 1, -len(x.get("tags", {}))))[:50]
-    return {"success": True, "count": len(gems_sorted), "gems": gems_sorted}
+    gems = sorted(gems, key=lambda x: (0 if x.get("name") != "Unnamed" else 1, -len(x.get("tags", {}))))[:50]
+    await _gems_cache.aset(cache_key, gems)
+    await _gems_fallback.aset(cache_key, {"gems": gems, "fetched_at": datetime.utcnow()})
+    return gems
+
+
+@router.get("/trips/{itinerary_id}/hidden_gems")
+async def hidden_gems(itinerary_id: str, filter: Optional[str] = None, radius_m: Optional[int] = 5000, current_user: dict = Depends(rate_limit("hidden_gems", 30, 10))):
+    """
+    Return 'hidden gems': community submissions within radius_m, then OSM Overpass results.
+    filter param: comma-separated topics (heritage, cafe, waterfall, viewpoint, temple, museum, etc.)
+    Requires itinerary summary center lat/lng.
+    """
+    _, it = load_owned_itinerary(itinerary_id, current_user["uid"])
+    result = await resolve_hidden_gems(it, filter=filter, radius_m=radius_m)
+    return FastJSONResponse({"success": True, **result})
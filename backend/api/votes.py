@@ -4,14 +4,16 @@ from typing import Optional
 from datetime import datetime
 from uuid import uuid4
 
-from core.firebase import db
+from core.firebase import get_db
+from core.write_behind import WRITE_BEHIND
+from core.queries import query as registered_query
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Votes"])
 
 # Firestore refs
 def votes_col():
-    return db.collection("votes")
+    return get_db().collection("votes")
 
 # Pydantic models
 class VoteCreateRequest(BaseModel):
@@ -19,6 +21,10 @@ class VoteCreateRequest(BaseModel):
     activity_id: Optional[str] = None
     option_id: str # The ID of the option being voted for
 
+def list_itinerary_votes(itinerary_id: str):
+    query = registered_query("votes_by_itinerary", itinerary_id=itinerary_id).stream()
+    return [doc.to_dict() for doc in query]
+
 # Endpoints
 @router.post("/votes")
 async def add_vote(body: VoteCreateRequest, current_user: dict = Depends(verify_firebase_token)):
@@ -34,17 +40,14 @@ async def add_vote(body: VoteCreateRequest, current_user: dict = Depends(verify_
         "created_at": datetime.utcnow(),
     }
     
-    votes_col().document(vote_id).set(vote_doc)
+    await WRITE_BEHIND.write("votes", vote_id, vote_doc)
     return {"success": True, "vote_id": vote_id}
 
 @router.get("/itineraries/{itinerary_id}/votes")
 async def get_itinerary_votes(itinerary_id: str, current_user: dict = Depends(verify_firebase_token)):
     # For simplicity, assuming any authenticated user can view votes on an itinerary they have access to.
     
-    votes = []
-    query = votes_col().where("itinerary_id", "==", itinerary_id).stream()
-    for doc in query:
-        votes.append(doc.to_dict())
+    votes = list_itinerary_votes(itinerary_id)
     return {"success": True, "votes": votes}
 
 @router.get("/activities/{activity_id}/votes")
@@ -52,7 +55,7 @@ async def get_activity_votes(activity_id: str, current_user: dict = Depends(veri
     # For simplicity, assuming any authenticated user can view votes on an activity they have access to.
     
     votes = []
-    query = votes_col().where("activity_id", "==", activity_id).stream()
+    query = registered_query("votes_by_activity", activity_id=activity_id).stream()
     for doc in query:
         votes.append(doc.to_dict())
     return {"success": True, "votes": votes}
@@ -4,14 +4,15 @@ from typing import Optional
 from datetime import datetime
 from uuid import uuid4
 
-from core.firebase import db
+from core.firebase import get_db
+from core.queries import query as registered_query
 from api.authentication import verify_firebase_token
 
 router = APIRouter(prefix="/api/v1", tags=["Weather Alerts"])
 
 # Firestore refs
 def weather_alerts_col():
-    return db.collection("weather_alerts")
+    return get_db().collection("weather_alerts")
 
 # Pydantic models
 class WeatherAlertCreateRequest(BaseModel):
@@ -63,7 +64,7 @@ async def get_weather_alert(alert_id: str, current_user: dict = Depends(verify_f
 @router.get("/itineraries/{itinerary_id}/weather_alerts")
 async def get_itinerary_weather_alerts(itinerary_id: str, current_user: dict = Depends(verify_firebase_token)):
     alerts = []
-    query = weather_alerts_col().where("itinerary_id", "==", itinerary_id).order_by("date", direction="ASCENDING").stream()
+    query = registered_query("weather_alerts_by_itinerary", itinerary_id=itinerary_id).stream()
     for doc in query:
         alerts.append(doc.to_dict())
     return {"success": True, "weather_alerts": alerts}
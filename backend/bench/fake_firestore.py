@@ -0,0 +1,317 @@
+"""
+In-memory stand-in for the subset of the Firestore client the routers use.
+
+Supports collection/document refs, get/set/update/delete, where (positional or
+filter=FieldFilter), order_by, limit, select, stream, get_all, batches and the
+ArrayUnion / ArrayRemove / Increment / SERVER_TIMESTAMP transforms. An optional
+per-call latency simulates the network round-trip to Firestore, and when given
+the composite indexes from firestore.indexes.json, queries that would need a
+missing index fail the way Firestore does (FAILED_PRECONDITION).
+"""
+import copy
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+
+_MISSING = object()
+SERVER_TIMESTAMP = object()
+
+
+def _get_path(data: dict, path: str):
+    cur = data
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+def _set_path(data: dict, path: str, value):
+    parts = path.split(".")
+    cur = data
+    for part in parts[:-1]:
+        nxt = cur.get(part)
+        if not isinstance(nxt, dict):
+            nxt = cur[part] = {}
+        cur = nxt
+    cur[parts[-1]] = value
+
+
+def _apply_transform(current, value):
+    """Resolve Firestore sentinels (matched by class name so either SDK's objects work)."""
+    kind = type(value).__name__
+    if kind == "ArrayUnion":
+        out = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            if v not in out:
+                out.append(v)
+        return out
+    if kind == "ArrayRemove":
+        return [v for v in (current if isinstance(current, list) else []) if v not in value.values]
+    if kind == "Increment":
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if kind == "Sentinel" or value is SERVER_TIMESTAMP:
+        return datetime.utcnow()
+    return copy.deepcopy(value)
+
+
+def _matches(value, op: str, target):
+    if value is _MISSING:
+        return False
+    try:
+        if op == "==":
+            return value == target
+        if op == "!=":
+            return value != target
+        if op == "<":
+            return value < target
+        if op == "<=":
+            return value <= target
+        if op == ">":
+            return value > target
+        if op == ">=":
+            return value >= target
+        if op == "in":
+            return value in target
+        if op == "not-in":
+            return value not in target
+        if op == "array-contains":
+            return isinstance(value, list) and target in value
+        if op == "array-contains-any":
+            return isinstance(value, list) and any(t in value for t in target)
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator {op}")
+
+
+def _sort_key(value):
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.replace(tzinfo=None))
+    return (4, str(value))
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        value = _get_path(self._data or {}, field)
+        return None if value is _MISSING else copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection: str, doc_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    def get(self, transaction=None, **kwargs):
+        self._client._latency()
+        with self._client._lock:
+            data = self._client._docs(self._collection).get(self.id)
+            return FakeSnapshot(self, copy.deepcopy(data))
+
+    def _write_set(self, data: dict, merge: bool = False):
+        docs = self._client._docs(self._collection)
+        base = copy.deepcopy(docs.get(self.id) or {}) if merge else {}
+        for key, value in data.items():
+            base[key] = _apply_transform(base.get(key), value)
+        docs[self.id] = base
+
+    def _write_update(self, data: dict):
+        docs = self._client._docs(self._collection)
+        if self.id not in docs:
+            raise KeyError(f"No document to update: {self.path}")
+        doc = docs[self.id]
+        for path, value in data.items():
+            current = _get_path(doc, path)
+            _set_path(doc, path, _apply_transform(None if current is _MISSING else current, value))
+
+    def set(self, data: dict, merge: bool = False):
+        self._client._latency()
+        with self._client._lock:
+            self._write_set(data, merge)
+
+    def create(self, data: dict):
+        self._client._latency()
+        with self._client._lock:
+            if self.id in self._client._docs(self._collection):
+                from google.api_core.exceptions import AlreadyExists
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            self._write_set(data)
+
+    def update(self, data: dict):
+        self._client._latency()
+        with self._client._lock:
+            self._write_update(data)
+
+    def delete(self):
+        self._client._latency()
+        with self._client._lock:
+            self._client._docs(self._collection).pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, client, collection: str, filters=(), orders=(), limit_n=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_n
+        self._fields = fields
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return FakeQuery(self._client, self._collection, self._filters + ((field_path, op_string, value),), self._orders, self._limit,
+                         self._fields)
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return FakeQuery(self._client, self._collection, self._filters, self._orders + ((field_path, str(direction).upper()),), self._limit,
+                         self._fields)
+
+    def limit(self, count: int):
+        return FakeQuery(self._client, self._collection, self._filters, self._orders, count, self._fields)
+
+    def select(self, field_paths):
+        return FakeQuery(self._client, self._collection, self._filters, self._orders, self._limit, list(field_paths))
+
+    def _check_index(self):
+        if self._client.indexes is None:
+            return
+        from core.queries import QuerySpec, index_key
+
+        spec = QuerySpec("adhoc", self._collection, [(f, op) for f, op, _ in self._filters], self._orders)
+        if spec.needs_composite_index() and index_key(spec.index()) not in self._client.indexes:
+            raise MissingIndexError(f"400 The query requires an index: {spec.index()}")
+
+    def stream(self, transaction=None):
+        self._check_index()
+        self._client._latency()
+        with self._client._lock:
+            rows = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._client._docs(self._collection).items()
+                    if all(_matches(_get_path(data, f), op, v) for f, op, v in self._filters)]
+        for field, direction in reversed(self._orders):
+            rows = [r for r in rows if _get_path(r[1], field) is not _MISSING]
+            rows.sort(key=lambda r: _sort_key(_get_path(r[1], field)), reverse=direction == "DESCENDING")
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            if self._fields is not None:
+                projected = {}
+                for path in self._fields:
+                    value = _get_path(data, path)
+                    if value is not _MISSING:
+                        _set_path(projected, path, value)
+                data = projected
+            yield FakeSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, name: str):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id: str = None):
+        return FakeDocumentReference(self._client, self._collection, doc_id or uuid4().hex[:20])
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return datetime.utcnow(), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(("set", ref, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(("update", ref, data, None))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None, None))
+
+    def commit(self):
+        self._client._latency()
+        with self._client._lock:
+            # all-or-nothing like Firestore: reject the batch before applying anything
+            for op, ref, data, merge in self._ops:
+                if op == "update" and ref.id not in self._client._docs(ref._collection):
+                    raise KeyError(f"No document to update: {ref.path}")
+            for op, ref, data, merge in self._ops:
+                if op == "set":
+                    ref._write_set(data, merge)
+                elif op == "update":
+                    ref._write_update(data)
+                else:
+                    self._client._docs(ref._collection).pop(ref.id, None)
+        self._ops = []
+
+
+class MissingIndexError(Exception):
+    pass
+
+
+class FakeFirestore:
+    def __init__(self, latency_ms: float = 0.0, indexes=None):
+        """indexes: composite index definitions (manifest["indexes"]); None disables the check."""
+        from core.queries import index_key
+
+        self.latency_ms = latency_ms
+        self.indexes = None if indexes is None else {index_key(index) for index in indexes}
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def _latency(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def _docs(self, collection: str):
+        return self._data.setdefault(collection, {})
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self, name)
+
+    def get_all(self, references, transaction=None, **kwargs):
+        self._latency()
+        with self._lock:
+            snaps = [FakeSnapshot(ref, copy.deepcopy(self._docs(ref._collection).get(ref.id))) for ref in references]
+        yield from snaps
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def peek(self, collection: str, doc_id: str):
+        """Read a document without simulated latency (for the load driver's own bookkeeping)."""
+        with self._lock:
+            return copy.deepcopy(self._docs(collection).get(doc_id))
+
+    def count(self, collection: str):
+        return len(self._docs(collection))
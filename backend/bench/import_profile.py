@@ -0,0 +1,70 @@
+"""
+Import-time profile of the API module.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and reports
+the slowest imports by cumulative and self time. Fails (exit 1) when the total
+exceeds --budget-ms or when any module listed in --forbid is loaded at boot;
+the default list is the SDKs that should only load on first use.
+
+    cd backend && python -m bench.import_profile --top 20 --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ["stripe", "httpx", "firebase_admin", "google.cloud.firestore_v1"]
+
+
+def profile_imports(module: str = "main"):
+    """Return [(name, self_us, cumulative_us, depth)] in import order."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time profile of the API module")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the total import time exceeds this")
+    parser.add_argument("--forbid", nargs="*", default=LAZY_MODULES, help="modules that must not load at import")
+    args = parser.parse_args(argv)
+
+    rows = profile_imports(args.module)
+    total_ms = next((cum for name, _, cum, _ in rows if name == args.module), 0) / 1000.0
+    loaded = {name for name, _, _, _ in rows}
+
+    print(f"import {args.module}: {total_ms:.1f} ms, {len(rows)} modules")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    print(f"\n{'self ms':>14}  module")
+    for name, self_us, _, _ in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:14.1f}  {name}")
+
+    failed = False
+    eager = [m for m in args.forbid if m in loaded]
+    if eager:
+        print(f"\nFAIL loaded at import: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nFAIL import took {total_ms:.1f} ms > budget {args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Load-test / benchmark driver.
+
+Starts the API against the in-memory Firestore fake and local provider stubs,
+seeds users and itineraries, then drives a weighted mix of realistic flows at a
+fixed concurrency and reports throughput plus p50/p95/p99 per endpoint.
+
+Run from backend/:
+
+    python -m bench.run --concurrency 32 --duration 30
+    python -m bench.run --json bench.json                          # save results
+    python -m bench.run --baseline bench.json --max-regression 0.2 # fail on p95 regressions
+
+Mix weights: --mix trip_list=20,weather=10,booking_flow=5 (see SCENARIOS).
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "trip_list=20,trip_get=15,weather=15,hidden_gems=10,bundle=10,booking_flow=10,comments=10,votes=10"
+WEBHOOK_SECRET = "whsec_bench"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+# -----------------------------
+# Stats
+# -----------------------------
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.flows = {}
+        self.recording = False
+        self.started_at = None
+        self.stopped_at = None
+
+    def record(self, label: str, seconds: float, ok: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(label, []).append(seconds)
+        if not ok:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def flow_done(self, name: str):
+        if self.recording:
+            self.flows[name] = self.flows.get(name, 0) + 1
+
+    def summary(self):
+        elapsed = max((self.stopped_at or time.perf_counter()) - self.started_at, 1e-9)
+        out = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            out[label] = {
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {"elapsed_s": elapsed, "total_requests": total, "total_rps": total / elapsed, "flows": dict(self.flows), "endpoints": out}
+
+
+# -----------------------------
+# Environment setup
+# -----------------------------
+def start_stubs(args):
+    from bench import stubs
+
+    latency = stubs.Latency(args.provider_latency_ms, args.provider_jitter_ms)
+    servers = {
+        "openweather": stubs.ServerThread(stubs.openweather_app(latency), free_port()).start(),
+        "overpass": stubs.ServerThread(stubs.overpass_app(latency), free_port()).start(),
+        "nominatim": stubs.ServerThread(stubs.nominatim_app(latency), free_port()).start(),
+        "stripe": stubs.ServerThread(stubs.stripe_app(latency), free_port()).start(),
+    }
+    os.environ.update({
+        "OPENWEATHER_API_KEY": "bench",
+        "OPENWEATHER_URL": servers["openweather"].url + "/data/2.5/onecall",
+        "OVERPASS_URL": servers["overpass"].url + "/api/interpreter",
+        "GEOCODER_URL": servers["nominatim"].url + "/search",
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEATHER_CACHE_TTL_HOURS": str(args.weather_cache_hours),
+        "RATE_LIMITS_ENABLED": "1" if args.rate_limits else "0",
+        "SEARCH_INDEX_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-search-"), "search.sqlite3"),
+        "CDC_DIR": tempfile.mkdtemp(prefix="bench-cdc-"),
+    })
+    return servers
+
+
+def load_app(fake_db, stripe_url: str):
+    """Import the API with the fake database and stub Stripe endpoint wired in."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from fastapi import Request
+    import stripe
+    import core.firebase
+    import main
+    from api.authentication import verify_firebase_token
+
+    core.firebase.db = fake_db
+    # routers that bound `db` at import time
+    for name, module in list(sys.modules.items()):
+        if name.startswith("api.") and hasattr(module, "db"):
+            module.db = fake_db
+    stripe.api_base = stripe_url
+
+    async def bench_user(request: Request):
+        uid = request.headers.get("authorization", "").removeprefix("Bearer ").strip() or "anonymous"
+        return {"uid": uid, "email": f"{uid}@bench.local"}
+
+    main.app.dependency_overrides[verify_firebase_token] = bench_user
+    return main.app
+
+
+def peek(fake_db, collection: str, doc_id: str):
+    """Read a document for the driver's bookkeeping (without simulated latency on the fake store)."""
+    if hasattr(fake_db, "peek"):
+        return fake_db.peek(collection, doc_id)
+    return fake_db.collection(collection).document(doc_id).get().to_dict()
+
+
+def seed(fake_db, users: int, trips_per_user: int):
+    """Users, itineraries with coordinates and booking options. Returns {uid: [itinerary ids]}."""
+    rnd = random.Random(7)
+    owned = {}
+    now = datetime.utcnow()
+    for u in range(users):
+        uid = f"bench_user_{u}"
+        fake_db.collection("users").document(uid).set({"uid": uid, "full_name": f"Bench {u}", "email": f"{uid}@bench.local",
+                                                       "travel_preferences": ["beach"], "created_at": now, "last_login": now})
+        owned[uid] = []
+        for t in range(trips_per_user):
+            itinerary_id = f"it_bench_{u}_{t}"
+            activities = [{
+                "id": f"act_{u}_{t}_{i}", "quote_id": f"q_act_{u}_{t}_{i}", "type": "activity", "name": f"Activity {i}",
+                "lat": 15.45 + rnd.random() * 0.1, "lng": 73.8 + rnd.random() * 0.1,
+                "duration_min": rnd.choice([60, 90, 120]), "estimated_cost": rnd.choice([0, 200, 500]),
+            } for i in range(12)]
+            hotels = [{"id": f"ht_{u}_{t}_{i}", "quote_id": f"q_ht_{u}_{t}_{i}", "type": "hotel", "name": f"Hotel {i}",
+                       "stars": 3 + i % 3, "price_total": 4000 + 1500 * i, "currency": "INR",
+                       "lat": 15.49, "lng": 73.83} for i in range(4)]
+            fake_db.collection("itineraries").document(itinerary_id).set({
+                "id": itinerary_id,
+                "user_id": uid,
+                "status": "upcoming",
+                "summary": {
+                    "destination": "Goa",
+                    "center": {"lat": 15.4909, "lng": 73.8278},
+                    "start_date": (now + timedelta(days=10)).date().isoformat(),
+                    "duration_days": 3,
+                    "days": [{"day": d + 1, "activities": activities[d * 4:(d + 1) * 4]} for d in range(3)],
+                },
+                "booking_options": {"hotels": hotels, "activities": activities},
+                "created_at": now - timedelta(minutes=t),
+                "updated_at": now - timedelta(minutes=t),
+            })
+            owned[uid].append(itinerary_id)
+    return owned
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+class Driver:
+    def __init__(self, client, stats: Stats, fake_db, owned: dict):
+        self.client = client
+        self.stats = stats
+        self.fake_db = fake_db
+        self.owned = owned
+        self.users = list(owned)
+
+    async def call(self, label: str, method: str, url: str, uid: str, **kwargs):
+        headers = kwargs.pop("headers", {})
+        headers["Authorization"] = f"Bearer {uid}"
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, headers=headers, **kwargs)
+            ok = r.status_code < 400
+        except Exception:
+            r = None
+            ok = False
+        self.stats.record(label, time.perf_counter() - start, ok)
+        return r if ok else None
+
+    def pick(self):
+        uid = random.choice(self.users)
+        return uid, random.choice(self.owned[uid])
+
+    async def trip_list(self):
+        uid, _ = self.pick()
+        await self.call("GET /trips", "GET", "/api/v1/trips", uid)
+
+    async def trip_get(self):
+        uid, it = self.pick()
+        await self.call("GET /trips/{id}", "GET", f"/api/v1/trips/{it}", uid)
+
+    async def weather(self):
+        uid, it = self.pick()
+        await self.call("GET /trips/{id}/weather", "GET", f"/api/v1/trips/{it}/weather", uid)
+
+    async def hidden_gems(self):
+        uid, it = self.pick()
+        await self.call("GET /trips/{id}/hidden_gems", "GET", f"/api/v1/trips/{it}/hidden_gems", uid, params={"filter": "museum,viewpoint"})
+
+    async def bundle(self):
+        uid, it = self.pick()
+        await self.call("GET /trips/{id}/bundle", "GET", f"/api/v1/trips/{it}/bundle", uid, params={"stream": "false"})
+
+    async def booking_flow(self):
+        uid, it = self.pick()
+        quote_id = peek(self.fake_db, "itineraries", it)["booking_options"]["hotels"][0]["quote_id"]
+        r = await self.call("POST /trips/{id}/reserve", "POST", f"/api/v1/trips/{it}/reserve", uid,
+                            json={"items": [{"type": "hotel", "provider_quote_id": quote_id}]})
+        if r is None:
+            return
+        reservation = r.json()
+        r = await self.call("POST /payments/checkout", "POST", "/api/v1/payments/checkout", uid,
+                            json={"reservation_id": reservation["reservation_id"], "amount": reservation["total_amount"], "currency": reservation["currency"]})
+        if r is None:
+            return
+        payment_id = r.json()["payment_id"]
+        intent_id = peek(self.fake_db, "payments", payment_id)["stripe_payment_intent_id"]
+        payload = json.dumps({"id": f"evt_{payment_id}", "object": "event", "type": "payment_intent.succeeded",
+                              "data": {"object": {"id": intent_id, "object": "payment_intent"}}})
+        ts = int(time.time())
+        sig = hmac.new(WEBHOOK_SECRET.encode(), f"{ts}.{payload}".encode(), hashlib.sha256).hexdigest()
+        r = await self.call("POST /payments/webhook", "POST", "/api/v1/payments/webhook", uid, content=payload,
+                            headers={"stripe-signature": f"t={ts},v1={sig}", "Content-Type": "application/json"})
+        if r is None:
+            return
+        booking = {"itinerary_id": it, "reservation_id": reservation["reservation_id"], "payment_id": payment_id,
+                   "service_type": "hotel", "service_details": {"source": "bench"}}
+        # the webhook marks the payment in a background task; give it a moment once
+        for attempt in range(2):
+            r = await self.call("POST /bookings", "POST", "/api/v1/bookings", uid, json=booking)
+            if r is not None:
+                self.stats.flow_done("booking_flow")
+                return
+            await asyncio.sleep(0.05)
+
+    async def comments(self):
+        uid, it = self.pick()
+        for i in range(5):
+            await self.call("POST /comments", "POST", "/api/v1/comments", uid, json={"itinerary_id": it, "text": f"bench comment {i}"})
+        await self.call("GET /itineraries/{id}/comments", "GET", f"/api/v1/itineraries/{it}/comments", uid)
+
+    async def votes(self):
+        uid, it = self.pick()
+        for i in range(5):
+            await self.call("POST /votes", "POST", "/api/v1/votes", uid, json={"itinerary_id": it, "option_id": f"opt_{i % 3}"})
+        await self.call("GET /itineraries/{id}/votes", "GET", f"/api/v1/itineraries/{it}/votes", uid)
+
+
+SCENARIOS = ("trip_list", "trip_get", "weather", "hidden_gems", "bundle", "booking_flow", "comments", "votes")
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def drive(base_url: str, args, stats: Stats, fake_db, owned: dict):
+    import httpx
+
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    cum = list(weights.values())
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        driver = Driver(client, stats, fake_db, owned)
+        stop_at = time.perf_counter() + args.warmup + args.duration
+
+        async def worker():
+            while time.perf_counter() < stop_at:
+                name = random.choices(names, weights=cum)[0]
+                await getattr(driver, name)()
+                if name != "booking_flow":
+                    stats.flow_done(name)
+
+        async def clock():
+            await asyncio.sleep(args.warmup)
+            stats.recording = True
+            stats.started_at = time.perf_counter()
+            await asyncio.sleep(args.duration)
+            stats.recording = False
+            stats.stopped_at = time.perf_counter()
+
+        await asyncio.gather(clock(), *[worker() for _ in range(args.concurrency)])
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def print_report(summary: dict, args):
+    print(f"\nconcurrency={args.concurrency} duration={summary['elapsed_s']:.1f}s "
+          f"requests={summary['total_requests']} throughput={summary['total_rps']:.1f} req/s")
+    print(f"{'endpoint':34} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, s in summary["endpoints"].items():
+        print(f"{label:34} {s['count']:7d} {s['errors']:5d} {s['rps']:8.1f} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} {s['p99_ms']:8.1f} {s['max_ms']:8.1f}")
+    print("flows completed: " + ", ".join(f"{k}={v}" for k, v in sorted(summary["flows"].items())))
+
+
+def compare_baseline(summary: dict, baseline_path: str, max_regression: float):
+    """Return the endpoints whose p95 grew by more than max_regression versus the baseline."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["endpoints"]
+    regressions = []
+    for label, s in summary["endpoints"].items():
+        base = baseline.get(label)
+        if not base or base["p95_ms"] <= 0:
+            continue
+        change = s["p95_ms"] / base["p95_ms"] - 1
+        if change > max_regression:
+            regressions.append((label, base["p95_ms"], s["p95_ms"], change))
+    return regressions
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark the API against local stand-ins")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    p.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before recording")
+    p.add_argument("--mix", default=DEFAULT_MIX)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--trips-per-user", type=int, default=5)
+    p.add_argument("--provider-latency-ms", type=float, default=80.0)
+    p.add_argument("--provider-jitter-ms", type=float, default=40.0)
+    p.add_argument("--firestore-latency-ms", type=float, default=2.0)
+    p.add_argument("--store", choices=("fake", "local"), default="fake",
+                   help="fake: in-memory Firestore with simulated latency; local: the SQLite local store (core.local_store)")
+    p.add_argument("--weather-cache-hours", type=int, default=6)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--rate-limits", action="store_true", help="keep per-user rate limits on (off by default so the run measures capacity)")
+    p.add_argument("--json", help="write the summary to this file")
+    p.add_argument("--baseline", help="compare p95 per endpoint against a previous --json file")
+    p.add_argument("--max-regression", type=float, default=0.25, help="allowed relative p95 growth vs baseline")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    os.chdir(BACKEND_DIR)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from bench.fake_firestore import FakeFirestore
+    from bench.stubs import ServerThread
+
+    servers = start_stubs(args)
+    from core.queries import load_manifest
+
+    if args.store == "local":
+        from core.local_store import temporary_store
+        fake_db = temporary_store()
+    else:
+        # enforce the committed index manifest so a query without an index fails here, not in production
+        fake_db = FakeFirestore(latency_ms=args.firestore_latency_ms, indexes=load_manifest()["indexes"])
+    app = load_app(fake_db, servers["stripe"].url)
+    owned = seed(fake_db, args.users, args.trips_per_user)
+    api = ServerThread(app, free_port()).start()
+    servers["api"] = api
+
+    stats = Stats()
+    try:
+        asyncio.run(drive(api.url, args, stats, fake_db, owned))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    summary = stats.summary()
+    print_report(summary, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        regressions = compare_baseline(summary, args.baseline, args.max_regression)
+        for label, before, after, change in regressions:
+            print(f"REGRESSION {label}: p95 {before:.1f} ms -> {after:.1f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
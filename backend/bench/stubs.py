@@ -0,0 +1,122 @@
+"""
+Local stand-ins for OpenWeather, Overpass, Nominatim and Stripe.
+
+Each stub is a tiny Starlette app returning canned but realistically shaped
+payloads after a configurable latency (base + uniform jitter), served by
+uvicorn on a background thread.
+"""
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class Latency:
+    def __init__(self, base_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+
+    async def wait(self):
+        delay = self.base_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+
+
+def openweather_app(latency: Latency):
+    async def onecall(request):
+        await latency.wait()
+        start = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+        daily = []
+        for i in range(8):
+            day = start + timedelta(days=i)
+            daily.append({
+                "dt": int(day.timestamp()),
+                "temp": {"min": 18 + random.random() * 4, "max": 28 + random.random() * 6, "day": 26.0},
+                "weather": [{"id": 500, "main": "Rain", "description": "light rain"} if random.random() < 0.3
+                            else {"id": 800, "main": "Clear", "description": "clear sky"}],
+                "pop": round(random.random(), 2),
+            })
+        return JSONResponse({"lat": float(request.query_params.get("lat", 0)), "lon": float(request.query_params.get("lon", 0)), "daily": daily})
+
+    return Starlette(routes=[Route("/data/2.5/onecall", onecall)])
+
+
+def overpass_app(latency: Latency, elements: int = 80):
+    async def interpreter(request):
+        await request.body()
+        await latency.wait()
+        out = []
+        for i in range(elements):
+            kind = random.choice(["attraction", "museum", "viewpoint", "cafe"])
+            out.append({
+                "type": "node",
+                "id": 1000 + i,
+                "lat": 15.5 + random.random() * 0.1,
+                "lon": 73.8 + random.random() * 0.1,
+                "tags": {"name": f"Place {i}", "tourism" if kind != "cafe" else "amenity": kind, "opening_hours": "09:00-18:00"},
+            })
+        return JSONResponse({"version": 0.6, "elements": out})
+
+    return Starlette(routes=[Route("/api/interpreter", interpreter, methods=["POST"])])
+
+
+def nominatim_app(latency: Latency):
+    async def search(request):
+        await latency.wait()
+        q = request.query_params.get("q", "")
+        return JSONResponse([{"lat": "15.4909", "lon": "73.8278", "display_name": f"{q}, India"}])
+
+    return Starlette(routes=[Route("/search", search)])
+
+
+def stripe_app(latency: Latency):
+    async def payment_intents(request):
+        form = await request.form()
+        await latency.wait()
+        intent_id = f"pi_{uuid4().hex[:24]}"
+        return JSONResponse({
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(form.get("amount", 0)),
+            "currency": form.get("currency", "inr"),
+            "status": "requires_payment_method",
+            "client_secret": f"{intent_id}_secret_{uuid4().hex[:16]}",
+            "created": int(time.time()),
+            "livemode": False,
+        })
+
+    return Starlette(routes=[Route("/v1/payment_intents", payment_intents, methods=["POST"])])
+
+
+class ServerThread:
+    """Run an ASGI app with uvicorn on a daemon thread."""
+
+    def __init__(self, app, port: int, host: str = "127.0.0.1", **config):
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on", **config))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 10.0):
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"server on port {self.port} failed to start")
+            time.sleep(0.02)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
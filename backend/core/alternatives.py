@@ -0,0 +1,218 @@
+"""
+Per-itinerary alternatives index.
+
+Candidates of each item type are kept sorted by price (bisect for price caps) and
+bucketed into lat/lng grid cells (radius queries touch only nearby cells). Star
+rating and theme have their own posting sets. A query starts from the most
+selective index and verifies the remaining constraints on that subset only.
+"""
+from bisect import bisect_right
+from collections import OrderedDict
+import math
+import threading
+from typing import Optional, List, Dict
+
+from core.day_planner import item_cost
+from core.geo import haversine_km
+from core.metrics import record_cache
+
+GRID_DEG = 0.05  # ~5.5 km cells
+TOP_K = 5
+INDEX_CACHE_SIZE = 256
+
+
+def _cell(lat: float, lng: float):
+    return (math.floor(lat / GRID_DEG), math.floor(lng / GRID_DEG))
+
+
+def _has_coords(c: dict):
+    return c.get("lat") is not None and c.get("lng") is not None
+
+
+def _themes(c: dict):
+    themes = {t.lower() for t in (c.get("themes") or [])}
+    if c.get("category"):
+        themes.add(str(c["category"]).lower())
+    return themes
+
+
+def item_key(c: dict):
+    return c.get("id") or c.get("quote_id")
+
+
+class _TypeIndex:
+    def __init__(self, candidates: List[dict]):
+        self.items = sorted(candidates, key=item_cost)
+        self.prices = [item_cost(c) for c in self.items]
+        self.by_id = {}
+        self.cells: Dict[tuple, List[int]] = {}
+        self.stars: Dict[float, set] = {}
+        self.themes: Dict[str, set] = {}
+        for pos, c in enumerate(self.items):
+            for key in (c.get("id"), c.get("quote_id")):
+                if key:
+                    self.by_id[key] = pos
+            if _has_coords(c):
+                self.cells.setdefault(_cell(float(c["lat"]), float(c["lng"])), []).append(pos)
+            if c.get("stars") is not None:
+                self.stars.setdefault(float(c["stars"]), set()).add(pos)
+            for theme in _themes(c):
+                self.themes.setdefault(theme, set()).add(pos)
+
+    def _near(self, lat: float, lng: float, km: float):
+        span_lat = int(math.ceil(km / 111.32 / GRID_DEG))
+        span_lng = int(math.ceil(km / (111.32 * max(math.cos(math.radians(lat)), 1e-6)) / GRID_DEG))
+        clat, clng = _cell(lat, lng)
+        found = set()
+        for i in range(clat - span_lat, clat + span_lat + 1):
+            for j in range(clng - span_lng, clng + span_lng + 1):
+                found.update(self.cells.get((i, j), ()))
+        return found
+
+    def query(self, max_price=None, min_price=None, origin=None, distance_km=None, min_stars=None, theme=None,
+              exclude=None, limit=20):
+        lo = 0 if min_price is None else bisect_right(self.prices, float(min_price) - 1e-9)
+        hi = len(self.items) if max_price is None else bisect_right(self.prices, float(max_price))
+        if lo >= hi:
+            return []
+        subsets = []
+        if origin is not None and distance_km is not None:
+            subsets.append(self._near(origin[0], origin[1], float(distance_km)))
+        if min_stars is not None:
+            subsets.append(set().union(*[p for s, p in self.stars.items() if s >= float(min_stars)]))
+        if theme:
+            subsets.append(self.themes.get(str(theme).lower(), set()))
+
+        if subsets:
+            positions = sorted(p for p in min(subsets, key=len) if lo <= p < hi)
+        else:
+            positions = range(lo, hi)
+
+        out = []
+        for pos in positions:
+            c = self.items[pos]
+            if exclude and item_key(c) in exclude:
+                continue
+            if min_stars is not None and (c.get("stars") is None or float(c["stars"]) < float(min_stars)):
+                continue
+            if theme and str(theme).lower() not in _themes(c):
+                continue
+            if distance_km is not None and origin is not None:
+                if not _has_coords(c):
+                    continue
+                if haversine_km(origin[0], origin[1], float(c["lat"]), float(c["lng"])) > float(distance_km):
+                    continue
+            out.append(c)
+            if len(out) >= limit:
+                break
+        return out
+
+
+class AlternativesIndex:
+    """Alternatives for one itinerary, built from booking_options."""
+
+    def __init__(self, booking_options: dict):
+        by_type: Dict[str, List[dict]] = {}
+        for key, arr in (booking_options or {}).items():
+            if not isinstance(arr, list):
+                continue
+            for c in arr:
+                if not isinstance(c, dict):
+                    continue
+                item_type = c.get("type") or (key[:-1] if key.endswith("s") and key != "alternatives" else None)
+                if item_type:
+                    by_type.setdefault(item_type, []).append(c)
+        self.types = {t: _TypeIndex(cands) for t, cands in by_type.items()}
+
+    def get(self, item_type: str, item_id: str):
+        idx = self.types.get(item_type)
+        if not idx or item_id not in idx.by_id:
+            return None
+        return idx.items[idx.by_id[item_id]]
+
+    def query(self, item_type: str, constraints: Optional[dict] = None, origin=None, exclude=None, limit: int = 20):
+        idx = self.types.get(item_type)
+        if not idx:
+            return []
+        constraints = constraints or {}
+        if constraints.get("lat") is not None and constraints.get("lng") is not None:
+            origin = (float(constraints["lat"]), float(constraints["lng"]))
+        return idx.query(
+            max_price=constraints.get("max_price"),
+            min_price=constraints.get("min_price"),
+            origin=origin,
+            distance_km=constraints.get("distance_km"),
+            min_stars=constraints.get("min_stars", constraints.get("stars")),
+            theme=constraints.get("theme"),
+            exclude=exclude,
+            limit=int(constraints.get("limit") or limit),
+        )
+
+    def top_k_for(self, item: dict, k: int = TOP_K):
+        """Closest substitutes for an item: similar price first, then distance."""
+        item_type = item.get("type")
+        idx = self.types.get(item_type)
+        if not idx:
+            return []
+        price = item_cost(item)
+        origin = (float(item["lat"]), float(item["lng"])) if _has_coords(item) else None
+        own = item_key(item)
+
+        def score(c):
+            s = abs(item_cost(c) - price) / (price or 1.0)
+            if origin and _has_coords(c):
+                s += haversine_km(origin[0], origin[1], float(c["lat"]), float(c["lng"])) / 10.0
+            return s
+
+        # price band around the item keeps this sub-linear on large candidate lists
+        lo = bisect_right(idx.prices, price * 0.5 - 1e-9)
+        hi = bisect_right(idx.prices, price * 1.5 if price else 0.0)
+        pool = [c for c in idx.items[lo:hi] if item_key(c) != own]
+        if len(pool) < k:
+            pool = [c for c in idx.items if item_key(c) != own]
+        return [item_key(c) for c in sorted(pool, key=score)[:k]]
+
+
+def itinerary_items(it: dict):
+    """Items that make up the itinerary: scheduled activities plus booking_options entries."""
+    seen = {}
+    for d in (it.get("summary") or {}).get("days", []):
+        for act in d.get("activities", []):
+            if item_key(act):
+                seen.setdefault(item_key(act), dict(act, type=act.get("type") or "activity"))
+    for key, arr in (it.get("booking_options") or {}).items():
+        if key == "alternatives" or not isinstance(arr, list):
+            continue
+        for c in arr:
+            if isinstance(c, dict) and item_key(c):
+                seen.setdefault(item_key(c), dict(c, type=c.get("type") or key[:-1]))
+    return list(seen.values())
+
+
+def precompute_top_k(summary: dict, booking_options: dict, k: int = TOP_K):
+    """{item_id: [alternative ids]} for every itinerary item; stored on the itinerary as alternatives_topk."""
+    index = AlternativesIndex(booking_options)
+    return {item_key(item): index.top_k_for(item, k) for item in itinerary_items({"summary": summary, "booking_options": booking_options})}
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def index_for(itinerary_id: str, it: dict):
+    """AlternativesIndex for an itinerary, reused until its updated_at changes."""
+    version = str(it.get("updated_at"))
+    with _cache_lock:
+        hit = _cache.get(itinerary_id)
+        if hit and hit[0] == version:
+            _cache.move_to_end(itinerary_id)
+            record_cache("alternatives_index", True)
+            return hit[1]
+    record_cache("alternatives_index", False)
+    index = AlternativesIndex(it.get("booking_options", {}))
+    with _cache_lock:
+        _cache[itinerary_id] = (version, index)
+        _cache.move_to_end(itinerary_id)
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
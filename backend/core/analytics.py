@@ -0,0 +1,395 @@
+"""
+Booking and revenue analytics over the CDC segments (core.cdc), never the serving database.
+
+Each captured collection is materialised as a snapshot: the change rows of every
+segment are folded, per document and per column, into current state (a column
+keeps the value from its latest event, so segments may be read in any order and
+re-reading one is harmless). refresh() only reads segments it has not seen
+yet, and after a refresh the snapshot is rebuilt as columns ({column: [values]})
+that the aggregates evaluate as whole-column expressions.
+
+With numpy installed (pip install .[analytics]) the columns are arrays -
+datetime64 with NaT, float with NaN, and str with "" for missing values - so
+filters are boolean masks, joins are searchsorted lookups and group-bys
+factorise each key column with numpy.unique and reduce with numpy.bincount.
+Without numpy the same column helpers run over plain lists.
+Results are cached until a refresh changes an input (or the refresh interval
+passes, since day windows move), so repeated admin calls are answered from memory.
+
+Data freshness follows the CDC flush interval; POST /api/admin/analytics/refresh
+flushes this worker's journal first. Documents written before CDC was enabled
+are loaded once with backfill().
+"""
+from datetime import datetime, timedelta
+import os
+import threading
+import time
+
+from core import cdc
+from core.firebase import get_db
+
+try:
+    import numpy
+except ImportError:  # optional: pip install .[analytics]
+    numpy = None
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+SNAPSHOT_COLLECTIONS = ("reservations", "payments", "bookings", "itineraries")
+HELD_STATUSES = ("held", "pending_payment", "expired")
+_EPOCH = datetime(1970, 1, 1)
+CONVERTED_STATUSES = ("paid", "booked")
+
+
+# -----------------------------
+# Snapshots
+# -----------------------------
+def _value_columns(collection: str):
+    return [column for column, _, _ in cdc.TABLES[collection]]
+
+
+def _column(values, kind: str):
+    if numpy is None:
+        return [v if v is not None else "" for v in values] if kind == "string" else values
+    if kind == "timestamp":
+        # via float seconds: several times faster than numpy parsing datetime objects
+        micros = numpy.array([(v - _EPOCH).total_seconds() if v is not None else numpy.nan for v in values]) * 1e6
+        column = numpy.full(len(values), numpy.datetime64("NaT", "us"))
+        present = ~numpy.isnan(micros)
+        column[present] = micros[present].round().astype(numpy.int64).astype("datetime64[us]")
+        return column
+    if kind in ("float", "int"):
+        return numpy.array(values, dtype=float)
+    return numpy.array([str(v) if v is not None else "" for v in values], dtype=str)
+
+
+class Snapshot:
+    """Current state of one collection, folded from its CDC segments."""
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.docs = {}  # doc_id -> {column: value}
+        self._stamps = {}  # doc_id -> {column: event_ts}, "_deleted" for deletes
+        self._seen = set()
+        self._columns = None
+        self.version = 0
+        self.rows = 0
+        self.as_of = None
+
+    def refresh(self):
+        """Fold segments not read yet; returns how many were read."""
+        new = [path for path in cdc.segments(self.collection) if path not in self._seen]
+        names = _value_columns(self.collection)
+        for path in new:
+            cols = cdc.read_segment(path)
+            for i, (ts, op, doc_id, fields) in enumerate(zip(cols["event_ts"], cols["op"], cols["doc_id"], cols["fields"])):
+                self._apply(ts, op, doc_id, fields.split(",") if fields else [], {n: cols[n][i] for n in names})
+                self.rows += 1
+                if self.as_of is None or ts > self.as_of:
+                    self.as_of = ts
+            self._seen.add(path)
+        if new:
+            self._columns = None
+            self.version += 1
+        return len(new)
+
+    def _apply(self, ts, op, doc_id, fields, values):
+        stamps = self._stamps.setdefault(doc_id, {})
+        if op == "delete":
+            if ts >= stamps.get("_deleted", ts):
+                stamps["_deleted"] = ts
+            return
+        doc = self.docs.setdefault(doc_id, {})
+        for name in fields:
+            if name in values and ts >= stamps.get(name, ts):
+                stamps[name] = ts
+                doc[name] = values[name]
+        stamps["_written"] = max(ts, stamps.get("_written", ts))
+
+    def _live(self, doc_id):
+        stamps = self._stamps.get(doc_id, {})
+        return "_deleted" not in stamps or stamps.get("_written", stamps["_deleted"]) > stamps["_deleted"]
+
+    def columns(self):
+        """{"doc_id": column, name: column} of the live documents; rebuilt only after a refresh changed something."""
+        if self._columns is None:
+            self._columns = _Columns(self, [doc_id for doc_id in self.docs if self._live(doc_id)])
+        return self._columns
+
+
+class _Columns(dict):
+    """A snapshot's columns, each converted on first use (aggregates read only a few)."""
+
+    def __init__(self, snapshot: Snapshot, ids):
+        super().__init__(doc_id=_column(ids, "string"))
+        self._docs = [snapshot.docs[doc_id] for doc_id in ids]
+        self._kinds = {name: kind for name, _, kind in cdc.TABLES[snapshot.collection]}
+
+    def __missing__(self, name):
+        column = self[name] = _column([doc.get(name) for doc in self._docs], self._kinds[name])
+        return column
+
+
+_snapshots = {name: Snapshot(name) for name in SNAPSHOT_COLLECTIONS}
+_results = {}  # (metric, params) -> (snapshot versions, result)
+_lock = threading.RLock()
+MAX_CACHED_RESULTS = 256
+_refreshed_at = 0.0
+
+
+def refresh(force: bool = False):
+    """Read new segments into the snapshots, at most every ANALYTICS_REFRESH_SECONDS unless forced."""
+    global _refreshed_at
+    with _lock:
+        if not force and time.monotonic() - _refreshed_at < ANALYTICS_REFRESH_SECONDS:
+            return {}
+        read = {name: snap.refresh() for name, snap in _snapshots.items()}
+        _refreshed_at = time.monotonic()
+        return read
+
+
+def status():
+    return {
+        "refresh_seconds": ANALYTICS_REFRESH_SECONDS,
+        "vectorized": numpy is not None,
+        "snapshots": {
+            name: {"documents": len(snap.columns()["doc_id"]), "change_rows": snap.rows, "segments": len(snap._seen),
+                   "as_of": snap.as_of.isoformat() if snap.as_of else None}
+            for name, snap in _snapshots.items()
+        },
+    }
+
+
+def backfill():
+    """Capture every existing document of the snapshot collections once, then compact. Returns counts."""
+    counts = {}
+    for name in SNAPSHOT_COLLECTIONS:
+        counts[name] = 0
+        for doc in get_db().collection(name).stream():
+            cdc.capture(name, doc.id, "create", doc.to_dict())
+            counts[name] += 1
+    cdc.flush()
+    return counts
+
+
+def _cached(metric: str, params: tuple, inputs, compute):
+    # day windows and hold expiry move with the clock: results also age out every refresh interval
+    params += (int(time.time() // max(ANALYTICS_REFRESH_SECONDS, 1)),)
+    with _lock:
+        versions = tuple(_snapshots[name].version for name in inputs)
+        hit = _results.get((metric, params))
+        if hit is not None and hit[0] == versions:
+            return hit[1]
+        result = compute(*(_snapshots[name].columns() for name in inputs))
+        if len(_results) >= MAX_CACHED_RESULTS:
+            _results.clear()
+        _results[(metric, params)] = (versions, result)
+        return result
+
+
+# -----------------------------
+# Column helpers (numpy arrays, or lists without numpy)
+# -----------------------------
+def _time_mask(column, since=None, until=None):
+    """Rows with a timestamp, at or after since and at or before until when given."""
+    if numpy is not None:
+        mask = ~numpy.isnat(column)
+        if since is not None:
+            mask &= column >= numpy.datetime64(since, "us")
+        if until is not None:
+            mask &= column <= numpy.datetime64(until, "us")
+        return mask
+    return [v is not None and (since is None or v >= since) and (until is None or v <= until) for v in column]
+
+
+def _isin(column, values, invert: bool = False):
+    if numpy is not None:
+        return numpy.isin(column, numpy.asarray(values), invert=invert)
+    values = set(values)
+    return [(v in values) != invert for v in column]
+
+
+def _and(a, b):
+    return a & b if numpy is not None else [x and y for x, y in zip(a, b)]
+
+
+def _or(a, b):
+    return a | b if numpy is not None else [x or y for x, y in zip(a, b)]
+
+
+def _not(mask):
+    return ~mask if numpy is not None else [not m for m in mask]
+
+
+def _count(mask) -> int:
+    return int(numpy.count_nonzero(mask)) if numpy is not None else sum(1 for m in mask if m)
+
+
+def _where(mask, column):
+    """The rows of column selected by mask."""
+    return column[mask] if numpy is not None else [v for v, m in zip(column, mask) if m]
+
+
+def _values_where(mask, column):
+    """column where mask holds, 0 elsewhere (missing values count as 0)."""
+    if numpy is not None:
+        return numpy.where(mask, numpy.nan_to_num(column), 0.0)
+    return [float(v or 0) if m else 0.0 for v, m in zip(column, mask)]
+
+
+def _coalesce(column, fallback):
+    """Timestamps of column, fallback's where column has none."""
+    if numpy is not None:
+        return numpy.where(numpy.isnat(column), fallback, column)
+    return [v if v is not None else f for v, f in zip(column, fallback)]
+
+
+def _days(column):
+    """Timestamps truncated to dates (datetime.date once turned back into keys)."""
+    return column.astype("datetime64[D]") if numpy is not None else [v.date() for v in column]
+
+
+def _lookup(keys, ids, values, default: str):
+    """values[ids.index(key)] for each key (a join on a unique id column); default when absent or empty."""
+    if numpy is not None:
+        if not len(ids):
+            return numpy.full(len(keys), default)
+        order = numpy.argsort(ids)
+        sorted_ids, sorted_values = ids[order], values[order]
+        pos = numpy.minimum(numpy.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+        found = (sorted_ids[pos] == keys) & (sorted_values[pos] != "")
+        return numpy.where(found, sorted_values[pos], default)
+    table = dict(zip(ids, values))
+    return [table.get(key) or default for key in keys]
+
+
+def group_sums(keys, *weights):
+    """
+    {key: (count, sum of each weight)}. keys is one column or a tuple of columns
+    (then keys are tuples). With numpy each key column is factorised with
+    numpy.unique, the codes are combined into one and reduced with bincount.
+    """
+    columns = keys if isinstance(keys, tuple) else (keys,)
+    if numpy is not None:
+        if not len(columns[0]):
+            return {}
+        code, uniques = numpy.zeros(len(columns[0]), dtype=numpy.int64), []
+        for column in columns:
+            values, inverse = numpy.unique(column, return_inverse=True)
+            code = code * len(values) + inverse.ravel()
+            uniques.append(values)
+        groups, inverse = numpy.unique(code, return_inverse=True)
+        inverse = inverse.ravel()
+        totals = [numpy.bincount(inverse, minlength=len(groups))]
+        totals += [numpy.bincount(inverse, weights=numpy.nan_to_num(numpy.asarray(w, dtype=float)), minlength=len(groups))
+                   for w in weights]
+        # decode the combined codes into each column's values
+        parts, remainder = [], groups
+        for values in reversed(uniques):
+            parts.append(values[remainder % len(values)].tolist())
+            remainder = remainder // len(values)
+        group_keys = list(zip(*reversed(parts)))
+        totals = [t.tolist() for t in totals]
+        return {
+            (key if isinstance(keys, tuple) else key[0]): (int(totals[0][i]), *(float(t[i]) for t in totals[1:]))
+            for i, key in enumerate(group_keys)
+        }
+    result = {}
+    for i, key in enumerate(zip(*columns)):
+        acc = result.get(key)
+        if acc is None:
+            acc = result[key] = [0] + [0.0] * len(weights)
+        acc[0] += 1
+        for j, w in enumerate(weights):
+            acc[j + 1] += float(w[i] or 0)
+    return {(key if isinstance(keys, tuple) else key[0]): tuple(acc) for key, acc in result.items()}
+
+
+def _since(days: int):
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+# -----------------------------
+# Aggregates
+# -----------------------------
+def bookings_daily(days: int = 30):
+    """Bookings, cancellations and GMV per creation day and currency."""
+    def compute(b):
+        rows = _time_mask(b["created_at"], since=_since(days))
+        status = _where(rows, b["status"])
+        cancelled = _isin(status, ("cancelled",))
+        groups = group_sums((_days(_where(rows, b["created_at"])), _where(rows, b["currency"])),
+                            cancelled, _values_where(_not(cancelled), _where(rows, b["amount"])))
+        return [
+            {"date": day.isoformat(), "currency": currency, "bookings": count, "cancelled": int(cancels), "gmv": round(gmv, 2)}
+            for (day, currency), (count, cancels, gmv) in sorted(groups.items())
+        ]
+    return _cached("bookings_daily", (days,), ("bookings",), compute)
+
+
+def gmv_by_destination(days: int = 30, limit: int = 50):
+    """Non-cancelled booking value per itinerary destination and currency, largest first."""
+    def compute(b, it):
+        rows = _and(_time_mask(b["created_at"], since=_since(days)), _isin(b["status"], ("cancelled",), invert=True))
+        destination = _lookup(_where(rows, b["itinerary_id"]), it["doc_id"], it["destination"], "unknown")
+        groups = group_sums((destination, _where(rows, b["currency"])), _where(rows, b["amount"]))
+        ranked = sorted(groups.items(), key=lambda kv: kv[1][1], reverse=True)[:limit]
+        return [{"destination": dest, "currency": currency, "bookings": count, "gmv": round(total, 2)}
+                for (dest, currency), (count, total) in ranked]
+    return _cached("gmv_by_destination", (days, limit), ("bookings", "itineraries"), compute)
+
+
+def _booked_reservations(b, include_cancelled: bool):
+    rows = _isin(b["reservation_id"], ("",), invert=True)
+    if not include_cancelled:
+        rows = _and(rows, _isin(b["status"], ("cancelled",), invert=True))
+    return _where(rows, b["reservation_id"])
+
+
+def reservation_conversion(days: int = 30):
+    """Reservations created per day and how many were paid and booked."""
+    def compute(r, b):
+        rows = _time_mask(r["created_at"], since=_since(days))
+        status = _where(rows, r["status"])
+        booked = _or(_isin(_where(rows, r["doc_id"]), _booked_reservations(b, include_cancelled=False)), _isin(status, ("booked",)))
+        paid = _or(booked, _isin(status, CONVERTED_STATUSES))
+        groups = group_sums(_days(_where(rows, r["created_at"])), paid, booked)
+        daily = [
+            {"date": day.isoformat(), "reservations": count, "paid": int(paid_n), "booked": int(booked_n),
+             "conversion_rate": _rate(booked_n, count)}
+            for day, (count, paid_n, booked_n) in sorted(groups.items())
+        ]
+        total, total_booked = _count(rows), _count(booked)
+        return {"reservations": total, "paid": _count(paid), "booked": total_booked,
+                "conversion_rate": _rate(total_booked, total), "daily": daily}
+    return _cached("reservation_conversion", (days,), ("reservations", "bookings"), compute)
+
+
+def hold_expiry(days: int = 30):
+    """
+    Outcome of holds (reservations with expires_at) whose hold window has ended or that were resolved:
+    converted (paid/booked), cancelled, or expired (still held past expires_at).
+    """
+    def compute(r, b):
+        since, now = _since(days), datetime.utcnow()
+        expires = r["expires_at"]
+        rows = _and(_time_mask(expires), _time_mask(_coalesce(r["created_at"], expires), since=since))
+        status, expires = _where(rows, r["status"]), _where(rows, expires)
+        converted = _or(_isin(_where(rows, r["doc_id"]), _booked_reservations(b, include_cancelled=True)),
+                        _isin(status, CONVERTED_STATUSES))
+        rest = _not(converted)
+        cancelled = _and(rest, _isin(status, ("cancelled", "released")))
+        rest = _and(rest, _not(cancelled))
+        held = _and(rest, _isin(status, HELD_STATUSES))
+        expired = _and(held, _time_mask(expires, until=now))
+        outcomes = {"converted": converted, "cancelled": cancelled, "expired": expired,
+                    "active": _and(held, _not(expired)), "other": _and(rest, _not(held))}
+        counts = {key: n for key, n in ((key, _count(mask)) for key, mask in outcomes.items()) if n}
+        resolved = sum(count for key, count in counts.items() if key != "active")
+        return {"holds": _count(rows), "resolved": resolved, "outcomes": counts,
+                "expiry_rate": _rate(counts.get("expired", 0), resolved),
+                "conversion_rate": _rate(counts.get("converted", 0), resolved)}
+    return _cached("hold_expiry", (days,), ("reservations", "bookings"), compute)
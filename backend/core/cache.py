@@ -0,0 +1,254 @@
+"""
+Pluggable cache tier shared by workers.
+
+CACHE_BACKEND selects where entries live:
+  memory  in-process LRU (default; per worker)
+  sqlite  one SQLite file in shared memory (CACHE_SQLITE_PATH, default under
+          /dev/shm) used by every worker on the host
+  redis   a Redis-compatible server at REDIS_URL (needs the `redis` package)
+
+Callers use a namespaced Cache: Cache("weather", ttl=6 * 3600).get(key) /
+.set(key, value), or aget / aset / adelete from async code, which run shared
+backend calls in a thread so a slow Redis or a locked SQLite file cannot stall
+the event loop. Values are stored as JSON with datetimes and dates tagged so
+they round-trip (never pickle: anything that can write to the shared store
+could otherwise run code in every worker); tuples and sets come back as
+lists. If the shared backend errors, the call falls back to the in-process LRU
+and the error is logged once, so a missing Redis degrades hit rates but never
+fails requests. Hits and misses are recorded per namespace in cache_requests_total.
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+from core.metrics import record_cache, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_MEMORY_ITEMS = int(os.getenv("CACHE_MEMORY_ITEMS", "10000"))
+CACHE_SQLITE_PATH = os.getenv(
+    "CACHE_SQLITE_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "travelai-cache.sqlite3"),
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+CACHE_ERRORS = REGISTRY.counter("cache_backend_errors_total", "Shared cache operations that fell back to memory", ("backend",))
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_items: int = CACHE_MEMORY_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires, blob = entry
+            if expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return blob
+
+    def set(self, key: str, blob: bytes, ttl: float):
+        with self._lock:
+            self._items[key] = (time.time() + ttl, blob)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class SQLiteBackend:
+    """Host-wide cache in a WAL-mode SQLite file; one connection per thread."""
+
+    name = "sqlite"
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute("SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, blob: bytes, ttl: float):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", (key, blob, now + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis  # optional: pip install .[server]
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+    def get(self, key: str):
+        return self._client.get(key)
+
+    def set(self, key: str, blob: bytes, ttl: float):
+        self._client.set(key, blob, px=max(int(ttl * 1000), 1))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+
+_BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend, "redis": RedisBackend}
+_backend = None
+_fallback = MemoryBackend()
+_backend_lock = threading.Lock()
+_warned = set()
+
+
+def get_backend():
+    """The configured shared backend, created on first use (memory if it cannot be created)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = _BACKENDS[CACHE_BACKEND]()
+                except Exception as e:
+                    logger.warning("Cache backend %r unavailable (%s); using in-process cache", CACHE_BACKEND, e)
+                    _backend = _fallback
+    return _backend
+
+
+def _on_error(backend, op: str, e: Exception):
+    CACHE_ERRORS.inc(backend=backend.name)
+    if backend.name not in _warned:
+        _warned.add(backend.name)
+        logger.warning("Cache backend %s failed on %s (%s); falling back to in-process cache", backend.name, op, e)
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return {"$dt": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"$date": obj.isoformat()}
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"{type(obj).__name__} is not cacheable")
+
+
+def _object_hook(obj: dict):
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        if "$date" in obj:
+            return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def loads(blob: bytes):
+    return json.loads(blob, object_hook=_object_hook)
+
+
+class Cache:
+    """A namespace in the shared cache tier with a default TTL."""
+
+    def __init__(self, namespace: str, ttl: float):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, key) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key, default: Any = None):
+        backend, full_key = get_backend(), self._key(key)
+        try:
+            blob = backend.get(full_key)
+        except Exception as e:
+            _on_error(backend, "get", e)
+            blob = _fallback.get(full_key)
+        record_cache(self.namespace, blob is not None)
+        if blob is None:
+            return default
+        try:
+            return loads(blob)
+        except ValueError:
+            # written by an older build (or not by us): treat as a miss
+            return default
+
+    def set(self, key, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        backend, full_key = get_backend(), self._key(key)
+        try:
+            blob = dumps(value)
+        except TypeError as e:
+            logger.warning("Not caching %s:%s: %s", self.namespace, key, e)
+            return
+        try:
+            backend.set(full_key, blob, ttl)
+        except Exception as e:
+            _on_error(backend, "set", e)
+            _fallback.set(full_key, blob, ttl)
+
+    def delete(self, key):
+        backend, full_key = get_backend(), self._key(key)
+        try:
+            backend.delete(full_key)
+        except Exception as e:
+            _on_error(backend, "delete", e)
+        _fallback.delete(full_key)
+
+    # async variants: the in-process backend answers inline, shared backends in a worker thread
+    async def aget(self, key, default: Any = None):
+        if isinstance(get_backend(), MemoryBackend):
+            return self.get(key, default)
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key, value: Any, ttl: Optional[float] = None):
+        if isinstance(get_backend(), MemoryBackend):
+            return self.set(key, value, ttl)
+        return await asyncio.to_thread(self.set, key, value, ttl)
+
+    async def adelete(self, key):
+        if isinstance(get_backend(), MemoryBackend):
+            return self.delete(key)
+        return await asyncio.to_thread(self.delete, key)
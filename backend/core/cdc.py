@@ -0,0 +1,364 @@
+"""
+Change-data capture from the serving collections to local columnar files.
+
+Routers call capture(collection, doc_id, op, data) right after each write to
+bookings, payments, reservations and itineraries (the outbox). The event keeps
+the projected analytics columns of TABLES found in the written data, and is
+appended to this process's journal under CDC_DIR/_outbox, so a crash loses
+nothing that was captured.
+
+flush() (every CDC_FLUSH_SECONDS from the app lifespan, and on shutdown) seals
+the journal and compacts it into one segment per collection and event date:
+
+    CDC_DIR/<collection>/date=<YYYY-MM-DD>/part-<journal>.parquet
+
+Segments are Parquet when pyarrow is installed (pip install .[analytics]) and
+gzipped column JSON (.json.gz) otherwise; read_segment() returns either as
+{column: [values]}. A segment is named after its journal and written by
+rename, so re-compacting a journal after a crash replaces it instead of
+duplicating rows. Journals left behind by a dead worker (sealed, or untouched
+for CDC_ORPHAN_SECONDS) are claimed and compacted by whichever worker flushes
+next.
+
+Each row is one change: event_ts, op (create | update | delete), doc_id, the
+projected columns, and fields (the comma-separated columns the write actually
+set), so partial updates can be told apart from explicit nulls when folding
+events into current state (see core.analytics).
+"""
+from datetime import datetime, timezone
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from uuid import uuid4
+
+from core.metrics import REGISTRY
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: pip install .[analytics]
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+CDC_ENABLED = os.getenv("CDC_ENABLED", "1").lower() in ("1", "true", "yes")
+CDC_DIR = os.getenv(
+    "CDC_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analytics_data"),
+)
+CDC_FLUSH_SECONDS = float(os.getenv("CDC_FLUSH_SECONDS", "30"))
+CDC_ORPHAN_SECONDS = float(os.getenv("CDC_ORPHAN_SECONDS", str(max(3 * CDC_FLUSH_SECONDS, 60))))
+
+# collection -> [(column, field path in the document, type)]; type is string | float | int | timestamp
+TABLES = {
+    "bookings": [
+        ("user_id", "user_id", "string"),
+        ("itinerary_id", "itinerary_id", "string"),
+        ("reservation_id", "reservation_id", "string"),
+        ("payment_id", "payment_id", "string"),
+        ("service_type", "service_type", "string"),
+        ("amount", "amount", "float"),
+        ("currency", "currency", "string"),
+        ("status", "status", "string"),
+        ("created_at", "created_at", "timestamp"),
+        ("updated_at", "updated_at", "timestamp"),
+        ("cancelled_at", "cancelled_at", "timestamp"),
+    ],
+    "payments": [
+        ("user_id", "user_id", "string"),
+        ("reservation_id", "reservation_id", "string"),
+        ("amount", "amount", "float"),
+        ("currency", "currency", "string"),
+        ("status", "status", "string"),
+        ("created_at", "created_at", "timestamp"),
+        ("updated_at", "updated_at", "timestamp"),
+    ],
+    "reservations": [
+        ("user_id", "user_id", "string"),
+        ("itinerary_id", "itinerary_id", "string"),
+        ("service_type", "service_type", "string"),
+        ("amount", "amount", "float"),  # single-service reservations (POST /reservations)
+        ("total_amount", "total_amount", "float"),  # trip holds (POST /trips/{id}/reserve)
+        ("currency", "currency", "string"),
+        ("status", "status", "string"),
+        ("expires_at", "expires_at", "timestamp"),
+        ("created_at", "created_at", "timestamp"),
+        ("updated_at", "updated_at", "timestamp"),
+        ("cancelled_at", "cancelled_at", "timestamp"),
+    ],
+    "itineraries": [
+        ("user_id", "user_id", "string"),
+        ("status", "status", "string"),
+        ("destination", "summary.destination", "string"),
+        ("start_date", "summary.start_date", "string"),
+        ("duration_days", "summary.duration_days", "int"),
+        ("created_at", "created_at", "timestamp"),
+        ("updated_at", "updated_at", "timestamp"),
+    ],
+}
+BASE_COLUMNS = [("event_ts", "timestamp"), ("op", "string"), ("doc_id", "string"), ("fields", "string")]
+
+EVENTS = REGISTRY.counter("cdc_events_total", "Changes captured to the CDC journal", ("collection",))
+SEGMENTS = REGISTRY.counter("cdc_segments_written_total", "Columnar segments written", ("collection",))
+FLUSH_LATENCY = REGISTRY.histogram("cdc_flush_seconds", "Duration of a CDC journal compaction")
+ERRORS = REGISTRY.counter("cdc_errors_total", "CDC capture or compaction failures", ("stage",))
+
+_MISSING = object()
+_journal_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_journal = None  # (path, file) of this process's open journal
+_pending = 0
+last_flush = None
+
+
+def columns(collection: str):
+    """[(column, type)] of a collection's segments."""
+    return BASE_COLUMNS + [(column, kind) for column, _, kind in TABLES[collection]]
+
+
+def segment_format():
+    return "parquet" if pyarrow is not None else "json.gz"
+
+
+# -----------------------------
+# Capture
+# -----------------------------
+def _lookup(data: dict, path: str):
+    if path in data:  # update() with a dotted key
+        return data[path]
+    cur = data
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+def _coerce(value, kind: str, now: datetime):
+    """Value as the column type, or _MISSING when it cannot be (e.g. an ArrayUnion)."""
+    if value is None:
+        return None
+    if kind == "timestamp":
+        if type(value).__name__ == "Sentinel":  # SERVER_TIMESTAMP
+            return now
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            return value
+        return _MISSING
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return _MISSING
+    if kind == "string":
+        return str(value)
+    try:
+        return float(value) if kind == "float" else int(value)
+    except ValueError:
+        return _MISSING
+
+
+def _open_journal():
+    global _journal
+    os.makedirs(os.path.join(CDC_DIR, "_outbox"), exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{os.getpid()}-{uuid4().hex[:8]}"
+    path = os.path.join(CDC_DIR, "_outbox", name + ".ndjson")
+    _journal = (path, open(path, "a", encoding="utf-8"))
+    return _journal
+
+
+def capture(collection: str, doc_id: str, op: str, data: dict = None):
+    """
+    Record a write to a captured collection. op: create | update | delete; data is the dict that
+    was written (the full document for create, the update dict for update). Never raises.
+    """
+    global _pending
+    if not CDC_ENABLED or collection not in TABLES:
+        return
+    try:
+        now = datetime.utcnow()
+        values = {}
+        for column, path, kind in TABLES[collection]:
+            value = _lookup(data or {}, path)
+            if value is not _MISSING:
+                value = _coerce(value, kind, now)
+            if value is not _MISSING:
+                values[column] = value.isoformat() if isinstance(value, datetime) else value
+        line = json.dumps({"c": collection, "ts": now.isoformat(), "op": op, "id": doc_id, "v": values},
+                          separators=(",", ":"))
+        with _journal_lock:
+            _, f = _journal or _open_journal()
+            f.write(line + "\n")
+            f.flush()
+            _pending += 1
+        EVENTS.inc(collection=collection)
+    except Exception:
+        ERRORS.inc(stage="capture")
+        logger.exception("CDC capture of %s/%s failed", collection, doc_id)
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+def _seal():
+    """Close this process's journal and mark it ready for compaction."""
+    global _journal, _pending
+    with _journal_lock:
+        if _journal is None:
+            return
+        path, f = _journal
+        _journal, _pending = None, 0
+        f.close()
+    os.replace(path, path[:-len(".ndjson")] + ".sealed")
+
+
+def _claim_ready():
+    """Atomically take every sealed or orphaned journal; returns the claimed paths."""
+    outbox = os.path.join(CDC_DIR, "_outbox")
+    now = time.time()
+    current = _journal[0] if _journal else None
+    candidates = glob.glob(os.path.join(outbox, "*.sealed"))
+    for path in glob.glob(os.path.join(outbox, "*.ndjson")) + glob.glob(os.path.join(outbox, "*.claimed")):
+        try:
+            if path != current and now - os.path.getmtime(path) > CDC_ORPHAN_SECONDS:
+                candidates.append(path)
+        except FileNotFoundError:
+            continue
+    claimed = []
+    for path in candidates:
+        stem = os.path.basename(path).split(".")[0]
+        target = os.path.join(outbox, f"{stem}.{os.getpid()}.claimed")
+        try:
+            os.replace(path, target)  # another worker got there first if this fails
+        except FileNotFoundError:
+            continue
+        claimed.append(target)
+    return claimed
+
+
+def _read_journal(path: str):
+    """{(collection, date): {column: [values]}} from one journal; a torn last line is skipped."""
+    groups = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            collection = event.get("c")
+            if collection not in TABLES:
+                continue
+            cols = groups.get((collection, event["ts"][:10]))
+            if cols is None:
+                cols = groups[(collection, event["ts"][:10])] = {name: [] for name, _ in columns(collection)}
+            values = event["v"]
+            row = {"event_ts": event["ts"], "op": event["op"], "doc_id": event["id"], "fields": ",".join(values), **values}
+            for name in cols:
+                cols[name].append(row.get(name))
+    return groups
+
+
+def _write_segment(collection: str, day: str, stem: str, cols: dict):
+    directory = os.path.join(CDC_DIR, collection, f"date={day}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{stem}.{segment_format()}")
+    tmp = path + ".tmp"
+    if pyarrow is not None:
+        types = {"string": pyarrow.string(), "float": pyarrow.float64(), "int": pyarrow.int64(),
+                 "timestamp": pyarrow.timestamp("us")}
+        arrays, fields = [], []
+        for name, kind in columns(collection):
+            values = cols[name]
+            if kind == "timestamp":
+                values = [datetime.fromisoformat(v) if v is not None else None for v in values]
+            arrays.append(pyarrow.array(values, type=types[kind]))
+            fields.append(pyarrow.field(name, types[kind]))
+        pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields)), tmp)
+    else:
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"collection": collection, "columns": cols}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    SEGMENTS.inc(collection=collection)
+    return path
+
+
+def flush():
+    """Seal this process's journal and compact every ready journal into segments. Returns a summary."""
+    global last_flush
+    if not CDC_ENABLED:
+        return {"enabled": False}
+    with _flush_lock:
+        started = time.perf_counter()
+        _seal()
+        journals = segments = rows = 0
+        for path in _claim_ready():
+            stem = os.path.basename(path).split(".")[0]
+            try:
+                for (collection, day), cols in _read_journal(path).items():
+                    _write_segment(collection, day, stem, cols)
+                    segments += 1
+                    rows += len(cols["doc_id"])
+                os.remove(path)
+                journals += 1
+            except Exception:
+                # left claimed: retried once it is older than CDC_ORPHAN_SECONDS
+                ERRORS.inc(stage="compact")
+                logger.exception("CDC compaction of %s failed", path)
+        FLUSH_LATENCY.observe(time.perf_counter() - started)
+        last_flush = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "journals": journals,
+            "segments": segments,
+            "rows": rows,
+        }
+        return last_flush
+
+
+async def cdc_flusher(interval_seconds: float = CDC_FLUSH_SECONDS):
+    """Background loop started from the app lifespan."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(flush)
+        except Exception:
+            ERRORS.inc(stage="compact")
+            logger.exception("CDC flush failed")
+
+
+def status():
+    return {
+        "enabled": CDC_ENABLED,
+        "dir": CDC_DIR,
+        "format": segment_format(),
+        "flush_seconds": CDC_FLUSH_SECONDS,
+        "pending_events": _pending,
+        "last_flush": last_flush,
+    }
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+def segments(collection: str):
+    """Paths of a collection's segments, oldest partition first."""
+    pattern = os.path.join(CDC_DIR, collection, "date=*", "part-*")
+    return sorted(p for p in glob.glob(pattern) if not p.endswith(".tmp"))
+
+
+def read_segment(path: str):
+    """{column: [values]} of a segment; timestamps come back as naive UTC datetimes."""
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise RuntimeError(f"pyarrow is required to read {path}")
+        return pyarrow.parquet.read_table(path).to_pydict()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    cols = payload["columns"]
+    for name, kind in columns(payload["collection"]):
+        if kind == "timestamp":
+            cols[name] = [datetime.fromisoformat(v) if v is not None else None for v in cols[name]]
+    return cols
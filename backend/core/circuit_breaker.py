@@ -0,0 +1,133 @@
+"""
+Per-provider circuit breakers.
+
+A breaker opens after CIRCUIT_FAILURE_THRESHOLD consecutive failed calls and
+then rejects calls immediately with CircuitOpenError for CIRCUIT_RESET_SECONDS.
+After that one probe call is let through (half-open): success closes the
+breaker, failure re-opens it for another reset period. Callers map
+CircuitOpenError to a fast 503 or to cached data marked stale.
+
+Only provider-side failures count: HTTP callers pass is_failure=http_failure so
+that transport errors, timeouts and 5xx open the breaker, while 4xx responses
+(a bad request or an unknown place) do not.
+"""
+from contextlib import asynccontextmanager
+import os
+import threading
+import time
+
+from core.metrics import REGISTRY
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = REGISTRY.gauge("circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("provider",))
+CIRCUIT_REJECTED = REGISTRY.counter("circuit_rejected_total", "Calls failed fast by an open circuit", ("provider",))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, provider=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], provider=self.name)
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError; returns True when the call is the half-open probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        CIRCUIT_REJECTED.inc(provider=self.name)
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    @asynccontextmanager
+    async def guard(self, *failure_types, is_failure=None):
+        """
+        Run the block under the breaker. Exceptions of failure_types (default: any
+        Exception) for which is_failure(exc) holds (default: all of them) count as
+        provider failures; anything else is re-raised without affecting the breaker.
+        """
+        failure_types = failure_types or (Exception,)
+        probe = self.before_call()
+        try:
+            yield
+        except BaseException as e:
+            if isinstance(e, failure_types) and (is_failure is None or is_failure(e)):
+                self.record_failure()
+            elif probe:
+                self.release_probe()
+            raise
+        else:
+            self.record_success()
+
+    def status(self):
+        return {"state": self.state, "failures": self.failures}
+
+
+def http_failure(exc: BaseException) -> bool:
+    """httpx errors that mean the provider is unhealthy: transport errors, timeouts and 5xx."""
+    import httpx
+
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider: str) -> CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def breaker_status():
+    return {name: breaker.status() for name, breaker in sorted(_breakers.items())}
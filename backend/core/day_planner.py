@@ -0,0 +1,218 @@
+"""
+Budget- and time-constrained day planner.
+
+Candidates are activity dicts with lat/lng plus optional duration_min, estimated_cost
+(or price_total / amount) and score. Selection is greedy under the budget and total
+time available; each day is then routed with nearest-neighbour + 2-opt over a
+precomputed haversine distance matrix.
+"""
+from datetime import date, timedelta
+from typing import Optional, List
+
+from core.geo import distance_matrix
+
+DAY_MINUTES = 8 * 60
+TRAVEL_SPEED_KMH = 25.0
+DEFAULT_DURATION_MIN = 60
+ACTIVITY_BUDGET_SHARE = 0.25  # share of a trip's budget_in_inr planned for activities
+
+
+def item_cost(item: dict):
+    return float(item.get("estimated_cost") or item.get("price_total") or item.get("total_price") or item.get("amount") or 0.0)
+
+
+def item_duration(item: dict):
+    return float(item.get("duration_min") or DEFAULT_DURATION_MIN)
+
+
+def _travel_min(km: float):
+    return km / TRAVEL_SPEED_KMH * 60
+
+
+def _has_coords(item: dict):
+    return item.get("lat") is not None and item.get("lng") is not None
+
+
+def select_candidates(candidates: List[dict], budget: Optional[float], minutes_available: float):
+    """
+    Greedy selection: highest score first, cheaper first on ties, until the budget or the
+    total activity time runs out. Returns (selected, rejected).
+    """
+    ranked = sorted(candidates, key=lambda c: (-float(c.get("score") or 0), item_cost(c)))
+    selected, rejected = [], []
+    spent = 0.0
+    busy = 0.0
+    for c in ranked:
+        cost = item_cost(c)
+        duration = item_duration(c)
+        if (budget is not None and spent + cost > budget) or busy + duration > minutes_available:
+            rejected.append(c)
+            continue
+        selected.append(c)
+        spent += cost
+        busy += duration
+    return selected, rejected
+
+
+def nearest_neighbour(dist, start: int, nodes: List[int]):
+    """Open path from start visiting nodes greedily by distance."""
+    remaining = set(nodes)
+    path = []
+    current = start
+    while remaining:
+        row = dist[current]
+        current = min(remaining, key=row.__getitem__)
+        remaining.remove(current)
+        path.append(current)
+    return path
+
+
+def two_opt(dist, start: int, path: List[int]):
+    """
+    Improve an open path that begins at `start` by reversing segments until no
+    reversal shortens it. The end of the path is free.
+    """
+    route = [start] + path
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            d_ab = dist[a][b]
+            for j in range(i + 1, n):
+                c = route[j]
+                if j + 1 < n:
+                    d = route[j + 1]
+                    delta = dist[a][c] + dist[b][d] - d_ab - dist[c][d]
+                else:
+                    delta = dist[a][c] - d_ab
+                if delta < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    b = route[i]
+                    d_ab = dist[a][b]
+                    improved = True
+    return route[1:]
+
+
+def path_km(dist, start: int, path: List[int]):
+    total = 0.0
+    prev = start
+    for node in path:
+        total += dist[prev][node]
+        prev = node
+    return total
+
+
+def plan_days(
+    candidates: List[dict],
+    duration_days: int,
+    budget_in_inr: Optional[float] = None,
+    start_date: Optional[date] = None,
+    anchor: Optional[dict] = None,
+    day_minutes: float = DAY_MINUTES,
+):
+    """
+    Assign candidates to days and order each day.
+    anchor: {lat, lng} every day starts from (hotel / city center); defaults to the first candidate.
+    Returns {"days": [...], "unscheduled": [...], "total_cost": float}.
+    """
+    duration_days = max(int(duration_days or 1), 1)
+    located = [c for c in candidates if _has_coords(c)]
+    unscheduled = [c for c in candidates if not _has_coords(c)]
+    selected, rejected = select_candidates(located, budget_in_inr, duration_days * day_minutes)
+    unscheduled.extend(rejected)
+
+    days = [{"day": i + 1, "date": (start_date + timedelta(days=i)).isoformat() if start_date else None,
+             "activities": [], "travel_km": 0.0, "busy_min": 0.0} for i in range(duration_days)]
+    if not selected:
+        return {"days": days, "unscheduled": unscheduled, "total_cost": 0.0}
+
+    if anchor is None or not _has_coords(anchor):
+        anchor = selected[0]
+    points = [(float(anchor["lat"]), float(anchor["lng"]))] + [(float(c["lat"]), float(c["lng"])) for c in selected]
+    dist = distance_matrix(points)
+    nodes = list(range(1, len(points)))
+
+    # one greedy tour keeps consecutive stops close; cutting it by time yields compact days
+    tour = nearest_neighbour(dist, 0, nodes)
+    # spread the tour evenly rather than packing the first days full
+    tour_min = _travel_min(path_km(dist, 0, tour)) + sum(item_duration(c) for c in selected)
+    target = min(day_minutes, tour_min / duration_days * 1.1)
+    buckets = [[] for _ in range(duration_days)]
+    day_idx = 0
+    used = 0.0
+    prev = 0
+    for node in tour:
+        item = selected[node - 1]
+        need = _travel_min(dist[prev][node]) + item_duration(item)
+        while day_idx < duration_days - 1 and used + need > target and buckets[day_idx]:
+            day_idx += 1
+            used = 0.0
+            prev = 0
+            need = _travel_min(dist[0][node]) + item_duration(item)
+        if day_idx >= duration_days or used + need > day_minutes:
+            unscheduled.append(item)
+            continue
+        buckets[day_idx].append(node)
+        used += need
+        prev = node
+
+    total_cost = 0.0
+    for day, bucket in zip(days, buckets):
+        if not bucket:
+            continue
+        # bucket is already in tour order; 2-opt only shortens it, so the time budget still holds
+        route = two_opt(dist, 0, bucket)
+        activities = [selected[n - 1] for n in route]
+        travel_km = path_km(dist, 0, route)
+        day["activities"] = activities
+        day["travel_km"] = round(travel_km, 2)
+        day["busy_min"] = round(_travel_min(travel_km) + sum(item_duration(a) for a in activities), 1)
+        total_cost += sum(item_cost(a) for a in activities)
+    return {"days": days, "unscheduled": unscheduled, "total_cost": total_cost}
+
+
+def insert_activity(days: List[dict], item: dict, anchor: Optional[dict] = None, day_minutes: float = DAY_MINUTES):
+    """
+    Cheapest-insertion of one item into existing days (in place). Items without
+    coordinates, or that fit nowhere, go to the end of the least busy day.
+    Returns the index of the day the item was added to.
+    """
+    if not days:
+        days.append({"day": 1, "date": None, "activities": []})
+    if not _has_coords(item):
+        idx = min(range(len(days)), key=lambda i: len(days[i].get("activities", [])))
+        days[idx].setdefault("activities", []).append(item)
+        return idx
+
+    best = None  # (added_km, day_idx, position)
+    for day_idx, day in enumerate(days):
+        acts = day.setdefault("activities", [])
+        stops = [a for a in acts if _has_coords(a)]
+        if len(stops) != len(acts):
+            continue
+        start = anchor if anchor and _has_coords(anchor) else (stops[0] if stops else item)
+        points = [(float(start["lat"]), float(start["lng"]))] + [(float(a["lat"]), float(a["lng"])) for a in stops] + [(float(item["lat"]), float(item["lng"]))]
+        dist = distance_matrix(points)
+        new = len(points) - 1
+        route = list(range(1, new))
+        base_km = path_km(dist, 0, route)
+        busy = _travel_min(base_km) + sum(item_duration(a) for a in stops)
+        for pos in range(len(route) + 1):
+            prev = route[pos - 1] if pos > 0 else 0
+            added = dist[prev][new]
+            if pos < len(route):
+                added += dist[new][route[pos]] - dist[prev][route[pos]]
+            if busy + _travel_min(added) + item_duration(item) > day_minutes:
+                continue
+            if best is None or added < best[0]:
+                best = (added, day_idx, pos)
+
+    if best is None:
+        idx = min(range(len(days)), key=lambda i: len(days[i].get("activities", [])))
+        days[idx].setdefault("activities", []).append(item)
+        return idx
+    _, day_idx, pos = best
+    days[day_idx]["activities"].insert(pos, item)
+    return day_idx
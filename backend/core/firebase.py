@@ -1,33 +1,159 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import logging
 import os
+import threading
+import time
 
-# Initialize db as None
+from core.metrics import instrument_firestore
+
+logger = logging.getLogger(__name__)
+
+# firestore (default) or local: a SQLite document store (core.local_store) for dev, CI and edge
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore").lower()
+# after a failed init, get_db() fails fast and retries no sooner than this, doubling up to the max
+FIREBASE_RETRY_SECONDS = float(os.getenv("FIREBASE_RETRY_SECONDS", "5"))
+FIREBASE_RETRY_MAX_SECONDS = float(os.getenv("FIREBASE_RETRY_MAX_SECONDS", "300"))
+
+# Initialize db as None; the SDK is imported and the client created on first use
 db = None
+firebase_error = None  # last init failure, for logs and startup errors; never returned to clients
+_init_lock = threading.Lock()
+_retry_at = 0.0
+_retry_delay = 0.0
+
+def _record_failure(what: str, e: Exception):
+    """Remember the failure and push the next get_db() retry back (exponential, capped)."""
+    global db, firebase_error, _retry_at, _retry_delay
+    db = None
+    firebase_error = str(e)
+    _retry_delay = min(FIREBASE_RETRY_MAX_SECONDS, _retry_delay * 2 or FIREBASE_RETRY_SECONDS)
+    _retry_at = time.monotonic() + _retry_delay
+    logger.error("%s initialization failed (retry in %.0fs): %s", what, _retry_delay, e)
+    return False
+
+def _record_success(what: str):
+    global firebase_error, _retry_at, _retry_delay
+    firebase_error = None
+    _retry_at = _retry_delay = 0.0
+    logger.info("%s initialized", what)
+    return True
 
 def init_firebase():
+    """
+    Initialise the Admin SDK and Firestore client (idempotent).
+    Imports firebase_admin here so the google-cloud stack isn't loaded at module import.
+    """
+    global db, firebase_error
+    with _init_lock:
+        if db is not None:
+            return True
+        if STORAGE_BACKEND == "local":
+            return _init_local_store()
+        try:
+            from firebase_admin import firestore
+
+            _init_app()
+            db = firestore.client()
+            instrument_firestore()
+            return _record_success("Firebase")
+        except Exception as e:
+            return _record_failure("Firebase", e)
+
+def _init_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        # Check if service account key exists
+        key_path = os.getenv("FIREBASE_CREDENTIALS", "firebase-service-account-key.json")
+        if not os.path.exists(key_path):
+            raise FileNotFoundError(f"Firebase service account key not found at {key_path}")
+
+        cred = credentials.Certificate(key_path)
+        firebase_admin.initialize_app(cred)
+
+def _init_local_store():
     global db
+    from core.local_store import LOCAL_STORE_PATH
     try:
-        if not firebase_admin._apps:
-            # Check if service account key exists
-            key_path = "firebase-service-account-key.json"
-            if not os.path.exists(key_path):
-                raise FileNotFoundError(f"Firebase service account key not found at {key_path}")
-            
-            cred = credentials.Certificate(key_path)
-            firebase_admin.initialize_app(cred)
-        
-        db = firestore.client()
-        print("✅ Firebase initialized successfully")
-        return True
+        from core.local_store import LocalStore
+        db = LocalStore(LOCAL_STORE_PATH)
+        return _record_success(f"Local store at {LOCAL_STORE_PATH}")
     except Exception as e:
-        print(f"❌ Firebase initialization failed: {str(e)}")
-        db = None
-        return False
+        return _record_failure(f"Local store at {LOCAL_STORE_PATH}", e)
 
 def get_db():
-    """Get Firestore database instance"""
-    global db
-    if db is None:
-        raise Exception("Firebase not initialized. Call init_firebase() first.")
+    """Get Firestore database instance, initialising it on first use (failures are retried with backoff)"""
+    if db is None and (time.monotonic() < _retry_at or not init_firebase()):
+        raise Exception("Firebase not initialized")
     return db
+
+def run_transaction(fn):
+    """Run fn(transaction) in a read-write transaction on whichever backend get_db() returns; returns fn's result"""
+    client = get_db()
+    from core.local_store import LocalStore
+    if isinstance(client, LocalStore):
+        return client.transaction().run(fn)
+    from google.cloud import firestore
+    return firestore.transactional(fn)(client.transaction())
+
+def get_auth():
+    """firebase_admin.auth, imported on first use once the default app is initialised"""
+    get_db()
+    if STORAGE_BACKEND == "local":
+        # the local store only replaces Firestore; ID tokens are still verified by Firebase Auth
+        with _init_lock:
+            _init_app()
+    from firebase_admin import auth
+    return auth
+
+# Upper bound on ids accepted by a single batch read
+MAX_BATCH_IDS = 100
+
+def parse_batch_ids(ids):
+    """
+    Split/dedupe ids (accepts comma-separated entries), keeping first-seen order.
+    Raises ValueError when there are none or more than MAX_BATCH_IDS distinct ids.
+    """
+    parsed = {}
+    for entry in ids:
+        for doc_id in entry.split(","):
+            doc_id = doc_id.strip()
+            if doc_id:
+                parsed[doc_id] = None
+                if len(parsed) > MAX_BATCH_IDS:
+                    raise ValueError(f"At most {MAX_BATCH_IDS} ids per batch")
+    if not parsed:
+        raise ValueError("ids is required")
+    return list(parsed)
+
+def get_many(refs):
+    """
+    Resolve many document references (any collections) with one get_all round-trip.
+    Returns {document path: snapshot}; missing documents come back with exists == False.
+    """
+    refs = list(refs)
+    if not refs:
+        return {}
+    return {snap.reference.path: snap for snap in get_db().get_all(refs)}
+
+def get_many_owned(collection: str, ids, uid: str, owner_field: str = "user_id"):
+    """
+    Batch-read documents of one collection by id and check ownership per item.
+    Returns {"items": [...], "missing": [ids], "forbidden": [ids]}, items in request order.
+    """
+    ids = list(dict.fromkeys(ids))
+    col = get_db().collection(collection)
+    refs = [col.document(doc_id) for doc_id in ids]
+    snaps = get_many(refs)
+    items, missing, forbidden = [], [], []
+    for doc_id, ref in zip(ids, refs):
+        snap = snaps.get(ref.path)
+        if snap is None or not snap.exists:
+            missing.append(doc_id)
+            continue
+        data = snap.to_dict()
+        if data.get(owner_field) != uid:
+            forbidden.append(doc_id)
+            continue
+        items.append(data)
+    return {"items": items, "missing": missing, "forbidden": forbidden}
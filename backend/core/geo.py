@@ -0,0 +1,111 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between two lat/lng points."""
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def distance_matrix(points):
+    """
+    Symmetric haversine matrix (km) for a list of (lat, lng).
+    Trig terms are computed once per point so the n^2 loop stays cheap.
+    """
+    n = len(points)
+    lat = [math.radians(p[0]) for p in points]
+    lng = [math.radians(p[1]) for p in points]
+    cos_lat = [math.cos(x) for x in lat]
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        row = matrix[i]
+        for j in range(i + 1, n):
+            a = math.sin((lat[j] - lat[i]) / 2) ** 2 + cos_lat[i] * cos_lat[j] * math.sin((lng[j] - lng[i]) / 2) ** 2
+            d = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+            row[j] = d
+            matrix[j][i] = d
+    return matrix
+
+# -----------------------------
+# Geohash
+# -----------------------------
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5 m cells; stored on documents, queried by prefix
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Geohash of (lat, lng); a prefix of it names every enclosing coarser cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            ch = ch * 2 + (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = ch * 2 + (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+def geohash_cell_size(precision):
+    """(lat degrees, lng degrees) spanned by a cell of the given precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def geohash_bounds(prefix):
+    """(lat_lo, lat_hi, lng_lo, lng_hi) of the cell a geohash prefix names."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in prefix:
+        ch = GEOHASH_BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (ch >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+def distance_to_cell_km(lat, lng, prefix):
+    """Distance in km from (lat, lng) to the nearest point of a geohash cell (0 inside it)."""
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(prefix)
+    near_lat = min(max(lat, lat_lo), lat_hi)
+    near_lng = min(max(lng, lng_lo), lng_hi)
+    return haversine_km(lat, lng, near_lat, near_lng)
+
+def geohash_cover(lat, lng, radius_m):
+    """
+    Geohash prefixes whose cells together cover the circle of radius_m around (lat, lng):
+    the finest cell at least radius_m on each side, plus its eight neighbours.
+    Query them as range scans [prefix, prefix + "~") and filter by exact distance.
+    """
+    radius_km = radius_m / 1000.0
+    km_per_lng_deg = max(math.cos(math.radians(lat)), 1e-6) * math.pi * EARTH_RADIUS_KM / 180
+    km_per_lat_deg = math.pi * EARTH_RADIUS_KM / 180
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = geohash_cell_size(p)
+        if dlat * km_per_lat_deg >= radius_km and dlng * km_per_lng_deg >= radius_km:
+            precision = p
+            break
+    dlat, dlng = geohash_cell_size(precision)
+    prefixes = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            cell_lat = min(max(lat + i * dlat, -90.0), 89.999999)
+            cell_lng = (lng + j * dlng + 180.0) % 360.0 - 180.0
+            prefixes.append(geohash_encode(cell_lat, cell_lng, precision))
+    return list(dict.fromkeys(prefixes))
@@ -0,0 +1,38 @@
+"""
+Shared outbound HTTP client.
+
+Provider calls (OpenWeather, Nominatim, Overpass, FX rates) go through one
+httpx.AsyncClient per event loop instead of a client per request, so pooled
+connections and TLS sessions are reused and the SSL context is built once
+rather than on the event loop for every call. Timeouts are passed per request.
+The client is created on first use and closed from the app lifespan.
+"""
+import asyncio
+import os
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+
+_client = None
+_client_loop = None
+
+
+def http_client():
+    """The shared httpx.AsyncClient for the running event loop (connections are bound to their loop)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        import httpx
+
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS))
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client (app shutdown); the next call creates a new one."""
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
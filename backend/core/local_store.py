@@ -0,0 +1,468 @@
+"""
+Local document store with the Firestore client surface the app uses.
+
+STORAGE_BACKEND=local makes core.firebase.get_db() return a LocalStore instead
+of a Firestore client, for dev, CI, edge boxes and benchmarks without a service
+account. Documents are JSON rows in one SQLite file in WAL mode
+(LOCAL_STORE_PATH); each thread has its own connection, so several workers on a
+host share the data.
+
+Supported: collection / document, get / set (merge) / create / update (dotted
+paths) / delete, where(filter=FieldFilter) with ==, !=, <, <=, >, >=, in,
+not-in, array-contains, array-contains-any, order_by, limit, select, stream, batch,
+get_all, transactions (via core.firebase.run_transaction) and the ArrayUnion /
+ArrayRemove / Increment / SERVER_TIMESTAMP / DELETE_FIELD sentinels.
+
+Every query in the registry (core.queries) gets a SQLite expression index on
+json_extract() of its fields, so the registered queries are index scans rather
+than collection scans. The planner only prefers those indexes over the
+(collection, id) primary key when it has statistics, so the store runs ANALYZE
+after creating them and again every LOCAL_STORE_ANALYZE_EVERY writes; an empty
+store is seeded with statistics that favour the field indexes. Datetimes are stored as tagged, fixed-width ISO strings so
+they compare and sort chronologically.
+"""
+from datetime import date, datetime, timezone
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+LOCAL_STORE_PATH = os.getenv(
+    "LOCAL_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "local_store.sqlite3"),
+)
+LOCAL_STORE_ANALYZE_EVERY = int(os.getenv("LOCAL_STORE_ANALYZE_EVERY", "20000"))  # writes between ANALYZE runs
+# sqlite_stat1 rows for an empty store: a field value matches far fewer rows than a collection
+_SEED_STATS = {"primary": "1000000 10000 1", "field": "1000000 10000 10"}
+
+_DT = "\x00t:"  # datetime tag; the NUL keeps tagged values apart from user strings
+_D = "\x00d:"  # date tag
+_MISSING = object()
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+def _encode_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return _DT + value.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    if isinstance(value, date):
+        return _D + value.isoformat()
+    if isinstance(value, dict):
+        return {k: _encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(v) for v in value]
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, str) and value.startswith("\x00"):
+        if value.startswith(_DT):
+            return datetime.strptime(value[len(_DT):], "%Y-%m-%dT%H:%M:%S.%f")
+        if value.startswith(_D):
+            return date.fromisoformat(value[len(_D):])
+    if isinstance(value, dict):
+        return {k: _decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode_value(v) for v in value]
+    return value
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(_encode_value(data), separators=(",", ":"), default=str)
+
+
+def _loads(blob: str) -> dict:
+    return _decode_value(json.loads(blob))
+
+
+def _json_path(field_path: str) -> str:
+    return "$." + ".".join(f'"{part}"' for part in field_path.split("."))
+
+
+# -----------------------------
+# Field paths and sentinels
+# -----------------------------
+def _get_path(data: dict, path: str):
+    cur = data
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+def _set_path(data: dict, path: str, value):
+    parts = path.split(".")
+    cur = data
+    for part in parts[:-1]:
+        nxt = cur.get(part)
+        if not isinstance(nxt, dict):
+            nxt = cur[part] = {}
+        cur = nxt
+    if value is _MISSING:
+        cur.pop(parts[-1], None)
+    else:
+        cur[parts[-1]] = value
+
+
+def _project(data: dict, field_paths):
+    projected = {}
+    for path in field_paths:
+        value = _get_path(data, path)
+        if value is not _MISSING:
+            _set_path(projected, path, value)
+    return projected
+
+
+def _resolve(current, value):
+    """Apply a Firestore transform sentinel to the current value (matched by class name)."""
+    kind = type(value).__name__
+    if kind == "ArrayUnion":
+        out = list(current) if isinstance(current, list) else []
+        out.extend(v for v in value.values if v not in out)
+        return out
+    if kind == "ArrayRemove":
+        return [v for v in (current if isinstance(current, list) else []) if v not in value.values]
+    if kind == "Increment":
+        return (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) + value.value
+    if kind == "Sentinel":
+        if "delete" in getattr(value, "description", "").lower():
+            return _MISSING
+        return datetime.utcnow()
+    if isinstance(value, dict):
+        base = current if isinstance(current, dict) else {}
+        out = {}
+        for k, v in value.items():
+            resolved = _resolve(base.get(k, _MISSING), v)
+            if resolved is not _MISSING:
+                out[k] = resolved
+        return out
+    return copy.deepcopy(value)
+
+
+def _merge(base: dict, data: dict):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            _set_path(base, key, _resolve(base.get(key, _MISSING), value))
+
+
+def _not_found(path: str):
+    from google.api_core.exceptions import NotFound
+    return NotFound(f"No document to update: {path}")
+
+
+def _already_exists(path: str):
+    from google.api_core.exceptions import AlreadyExists
+    return AlreadyExists(f"Document already exists: {path}")
+
+
+# -----------------------------
+# Documents and queries
+# -----------------------------
+class LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _get_path(self._data or {}, field_path)
+        return None if value is _MISSING else copy.deepcopy(value)
+
+
+class LocalDocumentReference:
+    def __init__(self, store, collection: str, doc_id: str):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    def get(self, transaction=None, **kwargs):
+        conn = transaction._conn if transaction is not None else self._store._conn()
+        return LocalSnapshot(self, self._store._read(conn, self._collection, self.id))
+
+    def set(self, data: dict, merge: bool = False):
+        self._store._apply([("set", self, data, merge)])
+
+    def create(self, data: dict):
+        self._store._apply([("create", self, data, None)])
+
+    def update(self, data: dict):
+        self._store._apply([("update", self, data, None)])
+
+    def delete(self):
+        self._store._apply([("delete", self, None, None)])
+
+
+_SQL_OPS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+class LocalQuery:
+    def __init__(self, store, collection: str, filters=(), orders=(), limit_n=None, fields=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_n
+        self._fields = fields
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return LocalQuery(self._store, self._collection, self._filters + ((field_path, op_string, value),), self._orders, self._limit,
+                          self._fields)
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        direction = "DESC" if str(direction).upper().startswith("DESC") else "ASC"
+        return LocalQuery(self._store, self._collection, self._filters, self._orders + ((field_path, direction),), self._limit,
+                          self._fields)
+
+    def limit(self, count: int):
+        return LocalQuery(self._store, self._collection, self._filters, self._orders, count, self._fields)
+
+    def select(self, field_paths):
+        return LocalQuery(self._store, self._collection, self._filters, self._orders, self._limit, list(field_paths))
+
+    def _sql(self):
+        where, params = ["collection = ?"], [self._collection]
+        for field, op, value in self._filters:
+            column = f"json_extract(data, '{_json_path(field)}')"
+            if op in _SQL_OPS:
+                where.append(f"{column} {_SQL_OPS[op]} ?")
+                params.append(_encode_value(value))
+            elif op in ("in", "not-in"):
+                values = [_encode_value(v) for v in value]
+                where.append(f"{column} {'NOT IN' if op == 'not-in' else 'IN'} ({', '.join('?' * len(values)) or 'NULL'})")
+                params.extend(values)
+            elif op in ("array-contains", "array-contains-any"):
+                values = [_encode_value(v) for v in (value if op == "array-contains-any" else [value])]
+                where.append(f"EXISTS (SELECT 1 FROM json_each(data, '{_json_path(field)}') "
+                             f"WHERE json_each.value IN ({', '.join('?' * len(values))}))")
+                params.extend(values)
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+        sql = f"SELECT id, data FROM docs WHERE {' AND '.join(where)}"
+        if self._orders:
+            # like Firestore, ordering on a field excludes documents that lack it
+            for field, _ in self._orders:
+                sql += f" AND json_type(data, '{_json_path(field)}') IS NOT NULL"
+            sql += " ORDER BY " + ", ".join(f"json_extract(data, '{_json_path(f)}') {d}" for f, d in self._orders)
+        if self._limit:
+            sql += f" LIMIT {int(self._limit)}"
+        return sql, params
+
+    def stream(self, transaction=None):
+        conn = transaction._conn if transaction is not None else self._store._conn()
+        sql, params = self._sql()
+        for doc_id, blob in conn.execute(sql, params).fetchall():
+            data = _loads(blob)
+            if self._fields is not None:
+                data = _project(data, self._fields)
+            yield LocalSnapshot(LocalDocumentReference(self._store, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, store, name: str):
+        super().__init__(store, name)
+        self.id = name
+
+    def document(self, doc_id: str = None):
+        return LocalDocumentReference(self._store, self._collection, doc_id or uuid4().hex[:20])
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+
+class LocalWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(("set", ref, data, merge))
+
+    def create(self, ref, data):
+        self._ops.append(("create", ref, data, None))
+
+    def update(self, ref, data):
+        self._ops.append(("update", ref, data, None))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None, None))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        self._store._apply(ops)
+        return []
+
+
+class LocalTransaction(LocalWriteBatch):
+    """Reads see a consistent snapshot; writes are applied together at commit (BEGIN IMMEDIATE serialises writers)."""
+
+    def __init__(self, store):
+        super().__init__(store)
+        self._conn = store._conn()
+
+    def run(self, fn):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self)
+            self._store._apply(self._ops, conn=self._conn, in_transaction=True)
+            self._conn.execute("COMMIT")
+            return result
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._ops = []
+
+
+# -----------------------------
+# Store
+# -----------------------------
+class LocalStore:
+    def __init__(self, path: str = LOCAL_STORE_PATH, indexes=None):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS docs (collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+                     "PRIMARY KEY (collection, id)) WITHOUT ROWID")
+        self.create_indexes(indexes if indexes is not None else _registry_indexes())
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_indexes(self, indexes):
+        """One expression index per distinct field list (indexes in firestore.indexes.json shape)."""
+        conn = self._conn()
+        for index in indexes:
+            fields = [f["fieldPath"] for f in index["fields"] if "order" in f]
+            if not fields:
+                continue
+            # collection is the leading column, so queries on the same fields share one index
+            name = "ix_" + "_".join(fields).replace(".", "_")
+            columns = ", ".join(f"json_extract(data, '{_json_path(f)}')" for f in fields)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON docs (collection, {columns})')
+        self.analyze()
+
+    def analyze(self):
+        """Refresh the planner statistics, seeding them while the store is empty."""
+        # full scan (~0.2 s per 100k docs): sampled counts cap at the limit and hide low-cardinality fields
+        conn = self._conn()
+        conn.execute("ANALYZE docs")
+        if conn.execute("SELECT 1 FROM sqlite_stat1 WHERE tbl = 'docs' LIMIT 1").fetchone() is None:
+            names = [row[0] for row in conn.execute("SELECT name FROM sqlite_schema WHERE type = 'index' AND tbl_name = 'docs'")]
+            conn.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES ('docs', ?, ?)",
+                             [("docs", _SEED_STATS["primary"])] + [(name, _SEED_STATS["field"]) for name in names])
+            conn.execute("ANALYZE sqlite_schema")  # reload the statistics
+        self._writes = 0
+
+    # ---- client surface ----
+    def collection(self, name: str):
+        return LocalCollectionReference(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def transaction(self):
+        return LocalTransaction(self)
+
+    def get_all(self, references, transaction=None, **kwargs):
+        conn = transaction._conn if transaction is not None else self._conn()
+        for ref in references:
+            yield LocalSnapshot(ref, self._read(conn, ref._collection, ref.id))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---- storage ----
+    def _read(self, conn, collection: str, doc_id: str):
+        row = conn.execute("SELECT data FROM docs WHERE collection = ? AND id = ?", (collection, doc_id)).fetchone()
+        return _loads(row[0]) if row else None
+
+    def _apply(self, ops, conn=None, in_transaction=False):
+        """Apply write ops atomically: all of them or, on the first failure, none."""
+        conn = conn or self._conn()
+        if not in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, ref, data, merge in ops:
+                key = (ref._collection, ref.id)
+                if op == "delete":
+                    conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", key)
+                    continue
+                current = self._read(conn, *key)
+                if op == "create" and current is not None:
+                    raise _already_exists(ref.path)
+                if op == "update":
+                    if current is None:
+                        raise _not_found(ref.path)
+                    for path, value in data.items():
+                        existing = _get_path(current, path)
+                        _set_path(current, path, _resolve(None if existing is _MISSING else existing, value))
+                    doc = current
+                elif merge and current is not None:
+                    _merge(current, data)
+                    doc = current
+                else:
+                    doc = _resolve({}, data)
+                conn.execute("INSERT OR REPLACE INTO docs (collection, id, data) VALUES (?, ?, ?)", key + (_dumps(doc),))
+            if not in_transaction:
+                conn.execute("COMMIT")
+        except BaseException:
+            if not in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self._writes += len(ops)
+        if not in_transaction and self._writes >= LOCAL_STORE_ANALYZE_EVERY:
+            self.analyze()
+
+
+def _registry_indexes():
+    """The index of every registered query, single-field ones included (SQLite has no automatic field indexes)."""
+    from core.queries import QUERIES, index_key
+    seen = {}
+    for spec in QUERIES.values():
+        if spec.index_fields():
+            index = spec.index()
+            seen.setdefault(index_key(index), index)
+    return [seen[key] for key in sorted(seen)]
+
+
+def temporary_store():
+    """A LocalStore in a fresh temp file (bench runs, tests)."""
+    return LocalStore(os.path.join(tempfile.mkdtemp(prefix="travelai-store-"), "store.sqlite3"))
@@ -0,0 +1,267 @@
+"""
+In-process Prometheus-style metrics.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by render(). Helpers cover the app's hot spots: per-route
+request latency, dependency (Firestore / HTTP provider / Stripe) call timers,
+cache hit/miss counters and event-loop lag.
+"""
+from contextlib import contextmanager
+import asyncio
+import functools
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+from core.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v: float):
+    v = float(v)
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for upper, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', _fmt_value(upper))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {series[-2]!r}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labels=()):
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels=()):
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests currently being served")
+DEPENDENCY_LATENCY = REGISTRY.histogram(
+    "dependency_call_duration_seconds", "Outbound dependency call latency", ("dependency", "operation", "outcome"))
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+LOOP_LAG = REGISTRY.histogram("event_loop_lag_seconds", "Delay of a scheduled wakeup on the event loop", buckets=LOOP_LAG_BUCKETS)
+LOOP_LAG_LAST = REGISTRY.gauge("event_loop_lag_last_seconds", "Most recent event-loop lag sample")
+
+
+def render():
+    return REGISTRY.render()
+
+
+@contextmanager
+def track_dependency(dependency: str, operation: str, **span_attributes):
+    """
+    Time a dependency call; outcome is 'error' when the block raises.
+    Also records a client span (a leaf, not made current) when tracing is enabled.
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    with start_span(f"{dependency} {operation}", kind="client", activate=False,
+                    dependency=dependency, operation=operation, **span_attributes):
+        try:
+            yield
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            DEPENDENCY_LATENCY.observe(time.perf_counter() - start, dependency=dependency, operation=operation, outcome=outcome)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Sample how late a sleep wakes up; runs until cancelled."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+# -----------------------------
+# Firestore instrumentation
+# -----------------------------
+def _timed_iter(dependency: str, operation: str, iterator):
+    with track_dependency(dependency, operation):
+        yield from iterator
+
+
+def _wrap(cls, method: str, operation: str, streaming: bool = False):
+    original = getattr(cls, method, None)
+    if original is None or getattr(original, "_metrics_wrapped", False):
+        return
+
+    if streaming:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            return _timed_iter("firestore", operation, original(*args, **kwargs))
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            with track_dependency("firestore", operation):
+                return original(*args, **kwargs)
+
+    wrapper._metrics_wrapped = True
+    setattr(cls, method, wrapper)
+
+
+def instrument_firestore():
+    """
+    Patch the Firestore client classes so every read/write is timed under
+    dependency="firestore". Safe to call more than once. SDK methods that delegate
+    internally (query.get -> query.stream) are recorded under both operations.
+    """
+    try:
+        from google.cloud.firestore_v1.client import Client
+        from google.cloud.firestore_v1.document import DocumentReference
+        from google.cloud.firestore_v1.collection import CollectionReference
+        from google.cloud.firestore_v1.query import Query
+        from google.cloud.firestore_v1.batch import WriteBatch
+        from google.cloud.firestore_v1.transaction import Transaction
+    except ImportError:
+        logger.warning("Firestore SDK not importable; Firestore calls will not be timed")
+        return
+    _wrap(DocumentReference, "get", "document.get")
+    _wrap(DocumentReference, "set", "document.set")
+    _wrap(DocumentReference, "create", "document.create")
+    _wrap(DocumentReference, "update", "document.update")
+    _wrap(DocumentReference, "delete", "document.delete")
+    _wrap(CollectionReference, "add", "collection.add")
+    _wrap(CollectionReference, "get", "collection.get")
+    _wrap(CollectionReference, "stream", "collection.stream", streaming=True)
+    _wrap(Query, "get", "query.get")
+    _wrap(Query, "stream", "query.stream", streaming=True)
+    _wrap(Client, "get_all", "client.get_all", streaming=True)
+    _wrap(WriteBatch, "commit", "batch.commit")
+    _wrap(Transaction, "_commit", "transaction.commit")
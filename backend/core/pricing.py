@@ -0,0 +1,246 @@
+"""
+Pricing: FX-normalised reservation totals in decimal arithmetic.
+
+Amounts are converted and summed as Decimal and rounded once, half-up, to the
+target currency's minor unit (ZERO_DECIMAL currencies have none). Reservations
+store the total both as a float (for display and queries) and as an integer
+total_amount_minor, and checkout compares the client's amount to that integer
+instead of trusting it.
+
+Rates are "units of currency per 1 unit of the table's base", for example:
+
+    {"base": "INR", "as_of": "2026-10-01", "rates": {"INR": 1, "USD": 0.01198, "EUR": 0.01101}}
+
+They are loaded from FX_RATES_FILE (the bundled fx_rates.json by default, which
+is what offline runs and the bench use). fx_refresher(), started from the app
+lifespan, refreshes them every FX_REFRESH_MINUTES: from FX_RATES_URL when it is
+set (any JSON with base + rates, e.g. an exchangerate/openexchangerates
+response), otherwise by re-reading FX_RATES_FILE. The table lives in-process; a
+failed refresh keeps the previous table, and a failed first load is retried
+after FX_RETRY_SECONDS. With FX_MAX_AGE_HOURS set, cross-currency pricing is
+refused once the table's as_of (or load time) is older than that.
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from core.metrics import REGISTRY
+from core.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+FX_RATES_FILE = os.getenv(
+    "FX_RATES_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fx_rates.json"),
+)
+FX_RATES_URL = os.getenv("FX_RATES_URL", "")
+FX_REFRESH_MINUTES = float(os.getenv("FX_REFRESH_MINUTES", "60"))
+FX_RETRY_SECONDS = float(os.getenv("FX_RETRY_SECONDS", "60"))  # after a failed load, before the next attempt
+FX_MAX_AGE_HOURS = float(os.getenv("FX_MAX_AGE_HOURS", "0"))  # 0 = rates never go stale
+PRICING_CURRENCY = os.getenv("PRICING_CURRENCY", "INR")  # reservation currency when items disagree
+
+# ISO 4217 currencies without a minor unit (Stripe treats these the same way)
+ZERO_DECIMAL = {"BIF", "CLP", "DJF", "GNF", "JPY", "KMF", "KRW", "MGA", "PYG", "RWF", "UGX", "VND", "VUV", "XAF", "XOF", "XPF"}
+
+FX_REFRESHES = REGISTRY.counter("fx_rate_refresh_total", "FX rate table loads", ("source", "outcome"))
+
+
+class FXRateUnavailable(Exception):
+    """No rate for a currency in the current table."""
+
+
+class RateTable:
+    def __init__(self, base: str, rates: dict, as_of=None, source: str = ""):
+        self.base = base.upper()
+        self.rates = {code.upper(): Decimal(str(rate)) for code, rate in rates.items() if rate}
+        self.rates.setdefault(self.base, Decimal(1))
+        self.as_of = as_of
+        self.source = source
+        self.loaded_at = datetime.utcnow()
+
+    @classmethod
+    def from_json(cls, payload: dict, source: str):
+        base = payload.get("base") or payload.get("base_code")
+        rates = payload.get("rates") or payload.get("conversion_rates")
+        if not base or not isinstance(rates, dict):
+            raise ValueError(f"{source}: expected base and rates")
+        return cls(base, rates, payload.get("as_of") or payload.get("date") or payload.get("time_last_update_utc"), source)
+
+    def rates_time(self) -> datetime:
+        """When the rates were published (as_of, as naive UTC), else when they were loaded."""
+        if self.as_of:
+            text = str(self.as_of)
+            for parse in (datetime.fromisoformat, parsedate_to_datetime):
+                try:
+                    published = parse(text)
+                except (TypeError, ValueError):
+                    continue
+                if published.tzinfo is not None:
+                    published = published.astimezone(timezone.utc).replace(tzinfo=None)
+                return published
+        return self.loaded_at
+
+    def is_stale(self, max_age_hours: float = None) -> bool:
+        max_age_hours = FX_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+        if max_age_hours <= 0:
+            return False
+        return (datetime.utcnow() - self.rates_time()).total_seconds() > max_age_hours * 3600
+
+    def rate(self, from_currency: str, to_currency: str) -> Decimal:
+        """Units of to_currency per unit of from_currency."""
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        if from_currency == to_currency:
+            return Decimal(1)
+        try:
+            return self.rates[to_currency] / self.rates[from_currency]
+        except KeyError as e:
+            raise FXRateUnavailable(f"No FX rate for {e.args[0]}")
+
+
+_table = None
+_table_lock = threading.Lock()
+_retry_at = 0.0  # monotonic time of the next load attempt while only the empty table is available
+
+
+def _load_file(path: str = FX_RATES_FILE):
+    with open(path, encoding="utf-8") as f:
+        return RateTable.from_json(json.load(f), source=os.path.basename(path))
+
+
+def reload_file(path: str = None):
+    """Re-read FX_RATES_FILE and swap it in; keeps the current table on failure. Returns True on success."""
+    global _table, _retry_at
+    path = path or FX_RATES_FILE
+    try:
+        table = _load_file(path)
+    except (OSError, ValueError) as e:
+        FX_REFRESHES.inc(source="file", outcome="error")
+        _retry_at = time.monotonic() + FX_RETRY_SECONDS
+        if _table is None:
+            logger.warning("FX rates file %s unavailable (%s); only same-currency pricing works", path, e)
+            _table = RateTable(PRICING_CURRENCY, {}, source="none")
+        else:
+            logger.warning("FX rates file %s could not be reloaded (%s); keeping the current table", path, e)
+        return False
+    _table = table
+    FX_REFRESHES.inc(source="file", outcome="ok")
+    return True
+
+
+def rate_table() -> RateTable:
+    """
+    The current table, loaded from FX_RATES_FILE on first use. While that load has failed the
+    table is empty (same-currency pricing only) and the file is retried every FX_RETRY_SECONDS.
+    """
+    if _table is None or (_table.source == "none" and time.monotonic() >= _retry_at):
+        with _table_lock:
+            if _table is None or (_table.source == "none" and time.monotonic() >= _retry_at):
+                reload_file()
+    return _table
+
+
+async def refresh_rates(url: str = FX_RATES_URL):
+    """Fetch the rate table from url and swap it in; keeps the current table on failure."""
+    global _table
+    try:
+        r = await http_client().get(url, timeout=10.0)
+        r.raise_for_status()
+        table = RateTable.from_json(r.json(), source=url.split("?")[0])
+    except Exception as e:
+        FX_REFRESHES.inc(source="url", outcome="error")
+        logger.warning("FX rate refresh from %s failed: %s", url.split("?")[0], e)
+        return False
+    _table = table
+    FX_REFRESHES.inc(source="url", outcome="ok")
+    return True
+
+
+async def refresh():
+    """Refresh from FX_RATES_URL when it is set, else re-read FX_RATES_FILE. Returns True on success."""
+    if FX_RATES_URL:
+        return await refresh_rates()
+    return await asyncio.to_thread(reload_file)
+
+
+async def fx_refresher(interval_minutes: float = FX_REFRESH_MINUTES):
+    """Background loop started from the app lifespan."""
+    while True:
+        await refresh()
+        await asyncio.sleep(interval_minutes * 60)
+
+
+def status():
+    table = rate_table()
+    return {"base": table.base, "as_of": table.as_of, "source": table.source, "currencies": sorted(table.rates),
+            "loaded_at": table.loaded_at.isoformat(), "refresh_url": bool(FX_RATES_URL), "stale": table.is_stale()}
+
+
+# -----------------------------
+# Decimal arithmetic
+# -----------------------------
+def to_decimal(amount) -> Decimal:
+    """Decimal from a float/str/int via its shortest repr, so 0.1 stays 0.1."""
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount {amount!r}")
+    return value
+
+
+def exponent(currency: str) -> int:
+    return 0 if currency.upper() in ZERO_DECIMAL else 2
+
+
+def quantize(amount: Decimal, currency: str) -> Decimal:
+    return amount.quantize(Decimal(1).scaleb(-exponent(currency)), rounding=ROUND_HALF_UP)
+
+
+def to_minor(amount, currency: str) -> int:
+    """Integer amount in the currency's minor unit (what Stripe expects)."""
+    return int(quantize(to_decimal(amount), currency).scaleb(exponent(currency)))
+
+
+def convert(amount, from_currency: str, to_currency: str) -> Decimal:
+    """Unrounded conversion with the current table."""
+    return to_decimal(amount) * rate_table().rate(from_currency, to_currency)
+
+
+def price_items(items, currency: str = None):
+    """
+    Normalise [(amount, currency)] into one currency and total them.
+    The target is `currency`, else the items' common currency, else PRICING_CURRENCY.
+    Converted amounts are summed unrounded and the total is rounded once. Raises
+    FXRateUnavailable for a conversion when the table is older than FX_MAX_AGE_HOURS.
+    Returns {"currency", "total" (Decimal), "total_minor", "lines": [{"amount", "currency", "converted", "fx_rate"}], "fx"}.
+    """
+    items = [(to_decimal(amount), (code or PRICING_CURRENCY).upper()) for amount, code in items]
+    if currency is None:
+        codes = {code for _, code in items}
+        currency = codes.pop() if len(codes) == 1 else PRICING_CURRENCY
+    currency = currency.upper()
+    table = rate_table()
+    if any(code != currency for _, code in items) and table.is_stale():
+        raise FXRateUnavailable(f"FX rates are out of date (as of {table.as_of or table.loaded_at.isoformat()})")
+    lines, total = [], Decimal(0)
+    for amount, code in items:
+        rate = table.rate(code, currency)
+        converted = amount * rate
+        total += converted
+        lines.append({"amount": amount, "currency": code, "converted": quantize(converted, currency), "fx_rate": rate})
+    total = quantize(total, currency)
+    converted_any = any(code != currency for _, code in items)
+    return {
+        "currency": currency,
+        "total": total,
+        "total_minor": int(total.scaleb(exponent(currency))),
+        "lines": lines,
+        "fx": {"base": table.base, "as_of": table.as_of, "source": table.source} if converted_any else None,
+    }
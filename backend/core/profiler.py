@@ -0,0 +1,240 @@
+"""
+Opt-in sampling profiler and event-loop block detector.
+
+A daemon thread samples the event-loop thread's stack every
+PROFILER_INTERVAL_MS. Each sample is charged to the request whose task is
+running on the loop at that instant (found through the request context
+variable), so time spent awaiting I/O is not counted; requests that take longer
+than PROFILER_SLOW_MS keep their samples as collapsed stacks rooted at the
+route template.
+
+The same thread watches a heartbeat coroutine: when the loop has not ticked for
+LOOP_BLOCK_MS it logs the loop thread's stack once per stall and keeps sampling
+it into a separate stack table until the loop recovers.
+
+Both tables are rendered in the collapsed "frame;frame;frame count" format that
+flamegraph.pl / speedscope read. Enable with PROFILER_ENABLED=1 or at runtime
+through the admin endpoint.
+"""
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", "500"))
+LOOP_BLOCK_MS = float(os.getenv("LOOP_BLOCK_MS", "100"))
+MAX_STACK_DEPTH = 64
+MAX_DISTINCT_STACKS = 5000
+RECENT_EVENTS = 100
+
+SLOW_REQUESTS = REGISTRY.counter("slow_requests_total", "Requests slower than PROFILER_SLOW_MS", ("route",))
+LOOP_BLOCKS = REGISTRY.counter("event_loop_blocked_total", "Stalls of the event loop longer than LOOP_BLOCK_MS")
+
+_current_request: ContextVar[Optional["RequestProfile"]] = ContextVar("profiled_request", default=None)
+
+try:
+    from asyncio.tasks import _current_tasks  # {loop: running task}; read-only use from the sampler thread
+except ImportError:  # pragma: no cover - interpreter without the private table
+    _current_tasks = None
+
+
+def collapse_stack(frame) -> str:
+    """Root-first 'module:function;...' for a frame chain."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackTable:
+    """Bounded Counter of collapsed stacks."""
+
+    def __init__(self, max_stacks: int = MAX_DISTINCT_STACKS):
+        self.max_stacks = max_stacks
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stack: str, count: int = 1):
+        with self._lock:
+            if stack not in self._counts and len(self._counts) >= self.max_stacks:
+                stack = "[truncated]"
+            self._counts[stack] += count
+
+    def merge(self, counts: Counter, prefix: str = ""):
+        for stack, count in counts.items():
+            self.add(f"{prefix};{stack}" if prefix else stack, count)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+    def total(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def render(self) -> str:
+        with self._lock:
+            items = sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.start = time.perf_counter()
+        self.samples = Counter()
+
+    @property
+    def label(self):
+        return f"{self.method} {self.route or self.path}"
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = PROFILER_ENABLED
+        self.interval = PROFILER_INTERVAL_MS / 1000.0
+        self.slow_threshold = PROFILER_SLOW_MS / 1000.0
+        self.block_threshold = LOOP_BLOCK_MS / 1000.0
+        self.slow_stacks = StackTable()
+        self.blocked_stacks = StackTable()
+        self.slow_requests = deque(maxlen=RECENT_EVENTS)
+        self.blocks = deque(maxlen=RECENT_EVENTS)
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._heartbeat_task = None
+
+    # ---- lifecycle (called from the app lifespan) ----
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def reset(self):
+        self.slow_stacks.clear()
+        self.blocked_stacks.clear()
+        self.slow_requests.clear()
+        self.blocks.clear()
+
+    async def _heartbeat(self):
+        tick = max(self.block_threshold / 4, 0.005)
+        while True:
+            self._last_beat = time.perf_counter()
+            await asyncio.sleep(tick)
+
+    # ---- sampler thread ----
+    def _run(self):
+        stall_started = None
+        while not self._stop.wait(self.interval if self.enabled else max(self.block_threshold / 4, 0.005)):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            if self.enabled:
+                self._sample_request(frame)
+
+            stalled_for = time.perf_counter() - self._last_beat
+            if self.block_threshold <= 0 or stalled_for < self.block_threshold:
+                stall_started = None
+                continue
+            stack = collapse_stack(frame)
+            self.blocked_stacks.add(stack)
+            if stall_started != self._last_beat:
+                # first detection of this stall: log the offending stack once
+                stall_started = self._last_beat
+                LOOP_BLOCKS.inc()
+                self.blocks.append({"at": datetime.utcnow().isoformat(), "blocked_ms": round(stalled_for * 1000, 1), "stack": stack})
+                logger.warning("Event loop blocked for %.0f ms:\n%s", stalled_for * 1000, "".join(traceback.format_stack(frame)))
+
+    def _sample_request(self, frame):
+        if _current_tasks is None:
+            return
+        task = _current_tasks.get(self._loop)
+        if task is None:
+            return
+        try:
+            record = task.get_context().get(_current_request)
+        except Exception:
+            return
+        if record is not None:
+            record.samples[collapse_stack(frame)] += 1
+
+    # ---- request hooks ----
+    def finish(self, record: RequestProfile):
+        elapsed = time.perf_counter() - record.start
+        if elapsed < self.slow_threshold:
+            return
+        SLOW_REQUESTS.inc(route=record.label)
+        self.slow_requests.append({
+            "at": datetime.utcnow().isoformat(),
+            "route": record.label,
+            "path": record.path,
+            "duration_ms": round(elapsed * 1000, 1),
+            "on_loop_ms": round(sum(record.samples.values()) * self.interval * 1000, 1),
+        })
+        self.slow_stacks.merge(record.samples, prefix=record.label)
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None,
+            "interval_ms": self.interval * 1000,
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "slow_samples": self.slow_stacks.total(),
+            "blocked_samples": self.blocked_stacks.total(),
+            "recent_slow_requests": list(self.slow_requests),
+            "recent_blocks": list(self.blocks),
+        }
+
+
+PROFILER = Profiler()
+
+
+@contextmanager
+def profile_request(method: str, path: str):
+    """Attach a RequestProfile to the current context while a request is served."""
+    if not PROFILER.enabled:
+        yield None
+        return
+    record = RequestProfile(method, path)
+    token = _current_request.set(record)
+    try:
+        yield record
+    finally:
+        _current_request.reset(token)
+        PROFILER.finish(record)
@@ -0,0 +1,220 @@
+"""
+Registry of the Firestore queries the app issues.
+
+Every collection query is declared once with register() and built through
+query(name, **values), so the set of query shapes is known up front. From the
+registry we derive the composite indexes Firestore needs (equality filters,
+then the range field, then the sort fields) and:
+
+  * write firestore.indexes.json for `firebase deploy --only firestore:indexes`
+        cd backend && python -m core.queries --write
+  * check the committed manifest at startup (validate_manifest); with
+    FIRESTORE_INDEX_CHECK=strict a missing index aborts startup
+  * check a query built at runtime has a declared index (bench/fake_firestore
+    raises like Firestore's FAILED_PRECONDITION when one is missing)
+
+Single-field queries and equality-only combinations are served by Firestore's
+automatic indexes and need no manifest entry.
+"""
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from core.firebase import get_db
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = os.getenv(
+    "FIRESTORE_INDEXES_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "firestore.indexes.json"),
+)
+FIRESTORE_INDEX_CHECK = os.getenv("FIRESTORE_INDEX_CHECK", "warn").lower()  # off | warn | strict
+RANGE_OPS = ("<", "<=", ">", ">=", "!=", "not-in")
+
+
+class QuerySpec:
+    def __init__(self, name: str, collection: str, filters: Tuple[Tuple[str, str], ...] = (),
+                 order_by: Tuple[Tuple[str, str], ...] = (), limit: Optional[int] = None):
+        self.name = name
+        self.collection = collection
+        self.filters = tuple(filters)
+        self.order_by = tuple(order_by)
+        self.limit = limit
+
+    @property
+    def equality_fields(self):
+        return [f[0] for f in self.filters if f[1] in ("==", "in", "array-contains", "array-contains-any")]
+
+    @property
+    def range_fields(self):
+        return list(dict.fromkeys(f[0] for f in self.filters if f[1] in RANGE_OPS))
+
+    def index_fields(self):
+        """Field order of the composite index this query needs: equalities, range, sorts."""
+        fields = []
+        for field in self.equality_fields:
+            fields.append((field, "CONTAINS" if self.filters_op(field).startswith("array-contains") else "ASCENDING"))
+        sorted_fields = [field for field, _ in self.order_by]
+        for field in self.range_fields:
+            if field not in sorted_fields:
+                fields.append((field, "ASCENDING"))
+        for field, direction in self.order_by:
+            if field not in self.equality_fields:
+                fields.append((field, direction.upper()))
+        return fields
+
+    def filters_op(self, field: str):
+        return next(f[1] for f in self.filters if f[0] == field)
+
+    def needs_composite_index(self):
+        fields = self.index_fields()
+        if len(fields) <= 1:
+            return False
+        # equality-only queries are answered by merging single-field indexes
+        return bool(self.range_fields or self.order_by)
+
+    def index(self):
+        return {
+            "collectionGroup": self.collection,
+            "queryScope": "COLLECTION",
+            "fields": [
+                {"fieldPath": field, "arrayConfig": "CONTAINS"} if order == "CONTAINS" else {"fieldPath": field, "order": order}
+                for field, order in self.index_fields()
+            ],
+        }
+
+    def build(self, limit: Optional[int] = None, **values):
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        q = get_db().collection(self.collection)
+        for field, op, *param in self.filters:
+            key = param[0] if param else field.replace(".", "_")
+            if key not in values:
+                raise KeyError(f"query {self.name} needs a value for {key}")
+            q = q.where(filter=FieldFilter(field, op, values[key]))
+        for field, direction in self.order_by:
+            q = q.order_by(field, direction=direction.upper())
+        limit = limit if limit is not None else self.limit
+        if limit:
+            q = q.limit(limit)
+        return q
+
+
+QUERIES: Dict[str, QuerySpec] = {}
+
+
+def register(name: str, collection: str, filters=(), order_by=(), limit: Optional[int] = None):
+    QUERIES[name] = QuerySpec(name, collection, filters, order_by, limit)
+    return QUERIES[name]
+
+
+def query(name: str, limit: Optional[int] = None, **values):
+    """
+    Build a registered query. Filter values are passed by field name, with dots
+    replaced by underscores (generation.job_id -> generation_job_id), or by the
+    parameter name given as a filter's third element (two bounds on one field).
+    """
+    return QUERIES[name].build(limit=limit, **values)
+
+
+# -----------------------------
+# Declared queries
+# -----------------------------
+register("itineraries_by_user", "itineraries", [("user_id", "==")], [("created_at", "DESCENDING")], limit=100)
+register("itineraries_by_user_status", "itineraries", [("user_id", "=="), ("status", "==")], [("created_at", "DESCENDING")], limit=100)
+register("itineraries_by_status_in", "itineraries", [("status", "in")])
+register("itinerary_by_generation_job", "itineraries", [("generation.job_id", "==")], limit=1)
+register("reservations_by_user", "reservations", [("user_id", "==")], [("created_at", "DESCENDING")])
+register("reservation_by_idempotency_key", "reservations", [("idempotency_key", "==")], limit=1)
+register("payments_by_user", "payments", [("user_id", "==")], [("created_at", "DESCENDING")])
+register("payment_by_intent", "payments", [("stripe_payment_intent_id", "==")], limit=1)
+register("bookings_by_user", "bookings", [("user_id", "==")], [("created_at", "DESCENDING")])
+register("comments_by_itinerary", "comments", [("itinerary_id", "==")], [("created_at", "ASCENDING")])
+register("comments_by_activity", "comments", [("activity_id", "==")], [("created_at", "ASCENDING")])
+register("votes_by_itinerary", "votes", [("itinerary_id", "==")])
+register("votes_by_activity", "votes", [("activity_id", "==")])
+register("group_members_by_itinerary", "group_members", [("itinerary_id", "==")])
+register("hidden_gems_recent", "hidden_gems", order_by=[("created_at", "DESCENDING")])
+register("hidden_gems_by_geohash", "hidden_gems", [("geohash", ">=", "geohash_start"), ("geohash", "<", "geohash_end")])
+register("hidden_gems_by_itinerary", "hidden_gems", [("itinerary_id", "==")], [("created_at", "DESCENDING")])
+register("weather_alerts_by_itinerary", "weather_alerts", [("itinerary_id", "==")], [("date", "ASCENDING")])
+register("engine_alerts_by_itinerary_in", "weather_alerts", [("itinerary_id", "in"), ("source", "==")])
+
+
+# -----------------------------
+# Manifest
+# -----------------------------
+def index_key(index: dict):
+    return (index["collectionGroup"], index.get("queryScope", "COLLECTION"),
+            tuple((f["fieldPath"], f.get("order") or f.get("arrayConfig")) for f in index["fields"]))
+
+
+def required_indexes():
+    """Distinct composite indexes needed by the registry, in a stable order."""
+    seen = {}
+    for spec in QUERIES.values():
+        if spec.needs_composite_index():
+            index = spec.index()
+            seen.setdefault(index_key(index), index)
+    return [seen[key] for key in sorted(seen)]
+
+
+def build_manifest():
+    return {"indexes": required_indexes(), "fieldOverrides": []}
+
+
+def load_manifest(path: str = MANIFEST_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def missing_indexes(manifest: dict):
+    """Queries (by name) whose composite index is absent from the manifest."""
+    declared = {index_key(index) for index in manifest.get("indexes", [])}
+    return sorted(spec.name for spec in QUERIES.values()
+                  if spec.needs_composite_index() and index_key(spec.index()) not in declared)
+
+
+def validate_manifest(path: str = MANIFEST_PATH, mode: str = FIRESTORE_INDEX_CHECK):
+    """
+    Compare the registry with the committed manifest. Logs missing indexes; raises
+    RuntimeError in strict mode. Returns the missing query names.
+    """
+    if mode == "off":
+        return []
+    try:
+        missing = missing_indexes(load_manifest(path))
+    except (OSError, ValueError) as e:
+        missing = sorted(spec.name for spec in QUERIES.values() if spec.needs_composite_index())
+        logger.error("Firestore index manifest unreadable at %s: %s", path, e)
+    if missing:
+        message = f"Firestore composite indexes missing from {path} for: {', '.join(missing)}"
+        if mode == "strict":
+            raise RuntimeError(message)
+        logger.warning("%s (run `python -m core.queries --write`)", message)
+    return missing
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Generate or check firestore.indexes.json from the query registry")
+    parser.add_argument("--write", action="store_true", help="write the manifest")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the manifest is missing an index")
+    parser.add_argument("--path", default=MANIFEST_PATH)
+    args = parser.parse_args()
+
+    if args.write:
+        with open(args.path, "w", encoding="utf-8") as f:
+            json.dump(build_manifest(), f, indent=2)
+            f.write("\n")
+        print(f"wrote {len(required_indexes())} composite indexes to {args.path}")
+    elif args.check:
+        missing = validate_manifest(args.path, mode="warn")
+        print("missing: " + ", ".join(missing) if missing else "manifest covers every registered query")
+        sys.exit(1 if missing else 0)
+    else:
+        json.dump(build_manifest(), sys.stdout, indent=2)
+        print()
@@ -0,0 +1,186 @@
+"""
+Admission control: per-user token buckets and per-provider concurrency caps.
+
+check_rate_limit() charges one token from the bucket keyed by (uid, limit
+name) and rejects with 429 and a Retry-After header when it is empty; routes
+use it through api.authentication.rate_limit(). Override a limit with
+RATE_LIMIT_<NAME>=<per_minute>[/<burst>]; 0 disables it, and
+RATE_LIMITS_ENABLED=0 disables all of them.
+
+provider_slot(provider) bounds how many calls to one upstream (Overpass,
+OpenWeather, Nominatim, Stripe) run at once in this worker. A caller waits up
+to PROVIDER_QUEUE_TIMEOUT seconds for a slot, then gets 503 with Retry-After
+instead of piling more connections onto a struggling or rate-limiting provider.
+Override a cap with PROVIDER_CONCURRENCY_<PROVIDER>=<n>. Providers with a
+request-rate policy (Nominatim: one request per second) are also paced by a
+token bucket inside the slot; the wait counts against the same queue timeout.
+Override a rate with PROVIDER_RATE_<PROVIDER>=<requests per second>, 0 to disable.
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from core.metrics import REGISTRY
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "1").lower() not in ("0", "false", "no")
+MAX_TRACKED_BUCKETS = 50000
+PROVIDER_QUEUE_TIMEOUT = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", "2.0"))
+PROVIDER_CONCURRENCY = {
+    "overpass": 4,      # public instance; slot count is enforced per client IP
+    "openweather": 16,
+    "nominatim": 1,     # one request at a time; the per-second policy is PROVIDER_RATE
+    "stripe": 16,
+}
+PROVIDER_RATE = {
+    "nominatim": 1.0,   # usage policy: at most one request per second
+}
+
+RATE_LIMITED = REGISTRY.counter("rate_limited_total", "Requests rejected by the per-user rate limiter", ("limit",))
+PROVIDER_REJECTED = REGISTRY.counter("provider_rejected_total", "Calls shed because a provider's concurrency cap or rate was exhausted", ("provider",))
+PROVIDER_IN_FLIGHT = REGISTRY.gauge("provider_in_flight", "Provider calls currently holding a slot", ("provider",))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, burst: float):
+        self.rate = rate_per_sec
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Consume one token; returns 0 on success, else seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets keyed by (uid, limit name), least recently used evicted past max_buckets."""
+
+    def __init__(self, max_buckets: int = MAX_TRACKED_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, per_minute: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(per_minute / 60.0, burst)
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(now)
+
+
+LIMITER = RateLimiter()
+
+
+def configured_limit(name: str, per_minute: float, burst: float = None):
+    """(per_minute, burst) for a named limit after applying RATE_LIMIT_<NAME>."""
+    burst = per_minute if burst is None else burst
+    raw = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if not raw:
+        return per_minute, burst
+    rate, _, size = raw.partition("/")
+    per_minute = float(rate)
+    return per_minute, float(size) if size else max(per_minute, 1.0)
+
+
+def check_rate_limit(key, name: str, per_minute: float, burst: float):
+    """Charge one token for key under limit `name`; raises 429 with Retry-After when exhausted."""
+    if not RATE_LIMITS_ENABLED or per_minute <= 0:
+        return
+    retry_after = LIMITER.hit((key, name), per_minute, burst)
+    if retry_after > 0:
+        RATE_LIMITED.inc(limit=name)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for {name}",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+# -----------------------------
+# Provider concurrency caps and request rates
+# -----------------------------
+_semaphores = {}
+_pacers = {}
+
+
+def _provider_semaphore(provider: str):
+    sem = _semaphores.get(provider)
+    if sem is None:
+        limit = int(os.getenv(f"PROVIDER_CONCURRENCY_{provider.upper()}", PROVIDER_CONCURRENCY.get(provider, 0)))
+        sem = _semaphores[provider] = asyncio.Semaphore(limit) if limit > 0 else False
+    return sem
+
+
+def _provider_pacer(provider: str):
+    bucket = _pacers.get(provider)
+    if bucket is None:
+        rate = float(os.getenv(f"PROVIDER_RATE_{provider.upper()}", PROVIDER_RATE.get(provider, 0)))
+        bucket = _pacers[provider] = TokenBucket(rate, 1.0) if rate > 0 else False
+    return bucket
+
+
+def _provider_busy(provider: str, retry_after: float):
+    PROVIDER_REJECTED.inc(provider=provider)
+    return HTTPException(
+        status_code=503,
+        detail=f"{provider} is busy, retry shortly",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def _pace(provider: str, bucket: TokenBucket, deadline: float):
+    """Wait for the provider's next request token; 503 when it would not arrive before deadline."""
+    while True:
+        now = time.monotonic()
+        wait = bucket.take(now)
+        if wait <= 0:
+            return
+        if now + wait > deadline:
+            raise _provider_busy(provider, wait)
+        await asyncio.sleep(wait)
+
+
+@asynccontextmanager
+async def provider_slot(provider: str, timeout: float = None):
+    """
+    Hold one of the provider's concurrency slots and, for paced providers, a request token;
+    503 with Retry-After when they are not available in time.
+    """
+    sem, pacer = _provider_semaphore(provider), _provider_pacer(provider)
+    if not sem and not pacer:
+        yield
+        return
+    timeout = PROVIDER_QUEUE_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    if sem:
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise _provider_busy(provider, timeout)
+    try:
+        if pacer:
+            await _pace(provider, pacer, deadline)
+        PROVIDER_IN_FLIGHT.inc(provider=provider)
+        try:
+            yield
+        finally:
+            PROVIDER_IN_FLIGHT.dec(provider=provider)
+    finally:
+        if sem:
+            sem.release()
@@ -0,0 +1,131 @@
+"""
+Fast JSON responses and negotiated compression.
+
+FastJSONResponse serialises with orjson when it is installed (the `perf`
+extra) and falls back to the standard library otherwise; both paths write
+datetimes, dates, Decimals and sets natively, so large itinerary payloads can be
+returned directly without a jsonable_encoder pass.
+
+CompressionMiddleware gzip- or brotli-encodes complete (non-streamed) responses
+of compressible types above COMPRESSION_MIN_BYTES, picking the encoding from
+Accept-Encoding. Streamed responses (NDJSON bundle, SSE job events) pass through
+untouched so they keep flushing per chunk.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+import gzip
+import json
+import os
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: pip install .[perf]
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: pip install .[perf]
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "application/xml")
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    # anything else (pydantic models, Firestore GeoPoint / DocumentReference, ...) as FastAPI would encode it
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """Serialise to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def negotiate_encoding(accept_encoding: str):
+    """'br' or 'gzip' per the client's Accept-Encoding q-values (br preferred on ties), else None."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            offered[token.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda enc: offered.get(enc, wildcard))
+    return best if offered.get(best, wildcard) > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # hold the headers until the first body chunk shows whether this is a single-shot response
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            content_type = headers.get("content-type", "")
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                await send(start)
+                await send(message)
+                return
+            compressed = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
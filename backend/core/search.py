@@ -0,0 +1,337 @@
+"""
+Embedded full-text search over trips, comments and hidden gems.
+
+Documents live in a SQLite FTS5 inverted index on local disk
+(SEARCH_INDEX_PATH), shared by every worker on the host. Write paths call
+index_trip / index_comment / index_gem / remove after the Firestore write, so
+the index stays current without ever scanning Firestore at query time;
+rebuild() repopulates it from Firestore (admin endpoint) after a fresh deploy.
+
+The index is per host: a host only indexes the writes it served, so results
+are complete only when the API runs on a single host. Behind a multi-host load
+balancer, writes served elsewhere are missing until the next rebuild on that
+host (POST /api/admin/search/reindex). Do not point SEARCH_INDEX_PATH at a
+network filesystem; SQLite locking is not reliable there.
+
+search() ranks with BM25 (title weighted above body and themes), treats every
+query term as a prefix, and returns facet counts over the full match set for
+category, status and theme. Visibility is part of the query: trips match only
+their owner, comments only the requested itinerary, gems everyone.
+
+Indexing failures are logged and never fail the write that triggered them.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, Optional
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_PATH = os.getenv(
+    "SEARCH_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "search_index.sqlite3"),
+)
+KINDS = ("trips", "comments", "gems")
+FACETS = ("category", "status", "theme")
+BM25_WEIGHTS = (10.0, 1.0, 4.0)  # title, body, themes
+MAX_TERMS = 12
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+INDEX_WRITES = REGISTRY.counter("search_index_writes_total", "Search index upserts and deletes", ("kind", "op"))
+INDEX_ERRORS = REGISTRY.counter("search_index_errors_total", "Search index operations that failed", ("op",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_meta (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    title TEXT,
+    category TEXT,
+    status TEXT,
+    owner TEXT,
+    scope TEXT,
+    updated_at TEXT,
+    UNIQUE (kind, doc_id)
+);
+CREATE INDEX IF NOT EXISTS search_meta_scope ON search_meta (kind, scope);
+CREATE INDEX IF NOT EXISTS search_meta_owner ON search_meta (kind, owner);
+CREATE TABLE IF NOT EXISTS search_themes (
+    id INTEGER NOT NULL,
+    theme TEXT NOT NULL,
+    PRIMARY KEY (id, theme)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    title, body, themes,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchIndex:
+    """The on-disk index; one SQLite connection per thread."""
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- writes ----
+    def upsert(self, kind: str, doc_id: str, title: str, body: str, themes: Iterable[str] = (),
+               category: Optional[str] = None, status: Optional[str] = None, owner: Optional[str] = None,
+               scope: Optional[str] = None, updated_at: Optional[str] = None):
+        themes = sorted({t.strip().lower() for t in themes if t and t.strip()})
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id FROM search_meta WHERE kind = ? AND doc_id = ?", (kind, doc_id)).fetchone()
+            if row:
+                rowid = row[0]
+                conn.execute(
+                    "UPDATE search_meta SET title = ?, category = ?, status = ?, owner = ?, scope = ?, updated_at = ? WHERE id = ?",
+                    (title, category, status, owner, scope, updated_at, rowid),
+                )
+                conn.execute("DELETE FROM search_fts WHERE rowid = ?", (rowid,))
+                conn.execute("DELETE FROM search_themes WHERE id = ?", (rowid,))
+            else:
+                rowid = conn.execute(
+                    "INSERT INTO search_meta (kind, doc_id, title, category, status, owner, scope, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, doc_id, title, category, status, owner, scope, updated_at),
+                ).lastrowid
+            conn.execute("INSERT INTO search_fts (rowid, title, body, themes) VALUES (?, ?, ?, ?)",
+                         (rowid, title or "", body or "", " ".join(themes)))
+            conn.executemany("INSERT INTO search_themes (id, theme) VALUES (?, ?)", [(rowid, t) for t in themes])
+        INDEX_WRITES.inc(kind=kind, op="upsert")
+
+    def delete(self, kind: str, doc_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id FROM search_meta WHERE kind = ? AND doc_id = ?", (kind, doc_id)).fetchone()
+            if row is None:
+                return
+            conn.execute("DELETE FROM search_fts WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM search_themes WHERE id = ?", (row[0],))
+            conn.execute("DELETE FROM search_meta WHERE id = ?", (row[0],))
+        INDEX_WRITES.inc(kind=kind, op="delete")
+
+    def clear(self, kind: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = "SELECT id FROM search_meta WHERE kind = ?"
+            conn.execute(f"DELETE FROM search_fts WHERE rowid IN ({ids})", (kind,))
+            conn.execute(f"DELETE FROM search_themes WHERE id IN ({ids})", (kind,))
+            conn.execute("DELETE FROM search_meta WHERE kind = ?", (kind,))
+
+    # ---- queries ----
+    def search(self, kind: str, q: str, owner: Optional[str] = None, scope: Optional[str] = None,
+               filters: Optional[dict] = None, limit: int = 20, offset: int = 0):
+        match = match_expression(q)
+        if match is None:
+            return {"total": 0, "results": [], "facets": {facet: {} for facet in FACETS}}
+        where = ["search_fts MATCH ?", "m.kind = ?"]
+        params = [match, kind]
+        if owner is not None:
+            where.append("m.owner = ?")
+            params.append(owner)
+        if scope is not None:
+            where.append("m.scope = ?")
+            params.append(scope)
+        for field in ("category", "status"):
+            if (filters or {}).get(field):
+                where.append(f"m.{field} = ?")
+                params.append(filters[field])
+        if (filters or {}).get("theme"):
+            where.append("EXISTS (SELECT 1 FROM search_themes t WHERE t.id = m.id AND t.theme = ?)")
+            params.append(filters["theme"].lower())
+        matched = f"FROM search_fts JOIN search_meta m ON m.id = search_fts.rowid WHERE {' AND '.join(where)}"
+
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT m.doc_id, m.title, m.category, m.status, m.scope, m.updated_at, "
+            f"bm25(search_fts, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS rank, "
+            f"snippet(search_fts, 1, '', '', '…', 16) "
+            f"{matched} ORDER BY rank LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        total = conn.execute(f"SELECT count(*) {matched}", params).fetchone()[0]
+        facets = {}
+        for field in ("category", "status"):
+            facets[field] = dict(conn.execute(
+                f"SELECT m.{field}, count(*) {matched} AND m.{field} IS NOT NULL GROUP BY m.{field} ORDER BY count(*) DESC",
+                params,
+            ).fetchall())
+        facets["theme"] = dict(conn.execute(
+            f"SELECT t.theme, count(*) FROM search_themes t WHERE t.id IN (SELECT m.id {matched}) "
+            f"GROUP BY t.theme ORDER BY count(*) DESC LIMIT 50",
+            params,
+        ).fetchall())
+        themes = self._themes([row[0] for row in rows], kind)
+        results = [{
+            "id": doc_id,
+            "title": title,
+            "snippet": snippet,
+            "score": round(-rank, 4),  # FTS5 bm25() is lower-is-better
+            "category": category,
+            "status": status,
+            "itinerary_id": scope,
+            "themes": themes.get(doc_id, []),
+            "updated_at": updated_at,
+        } for doc_id, title, category, status, scope, updated_at, rank, snippet in rows]
+        return {"total": total, "results": results, "facets": facets}
+
+    def _themes(self, doc_ids, kind):
+        if not doc_ids:
+            return {}
+        marks = ", ".join("?" * len(doc_ids))
+        rows = self._conn().execute(
+            f"SELECT m.doc_id, t.theme FROM search_themes t JOIN search_meta m ON m.id = t.id "
+            f"WHERE m.kind = ? AND m.doc_id IN ({marks}) ORDER BY t.theme",
+            [kind] + list(doc_ids),
+        ).fetchall()
+        themes = {}
+        for doc_id, theme in rows:
+            themes.setdefault(doc_id, []).append(theme)
+        return themes
+
+
+def match_expression(q: str):
+    """FTS5 MATCH string: every term a quoted prefix, all terms required. None when q has no terms."""
+    terms = _TOKEN.findall((q or "").lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+_index = None
+_index_lock = threading.Lock()
+_failed = False
+
+
+def get_index() -> SearchIndex:
+    """The shared index, opened on first use; raises SearchUnavailable if it cannot be opened."""
+    global _index, _failed
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = SearchIndex()
+                except sqlite3.Error as e:
+                    if not _failed:
+                        _failed = True
+                        logger.error("Search index unavailable at %s: %s", SEARCH_INDEX_PATH, e)
+                    raise SearchUnavailable(str(e))
+    return _index
+
+
+def _safely(op: str, fn, *args, **kwargs):
+    try:
+        fn(get_index(), *args, **kwargs)
+    except (SearchUnavailable, sqlite3.Error) as e:
+        INDEX_ERRORS.inc(op=op)
+        logger.warning("Search index %s failed: %s", op, e)
+
+
+# -----------------------------
+# Document mapping
+# -----------------------------
+def _text(*parts):
+    return " ".join(str(p) for p in parts if p)
+
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def trip_fields(it: dict):
+    summary = it.get("summary") or {}
+    request = it.get("request") or {}
+    activities = [a.get("name") for d in summary.get("days", []) for a in d.get("activities", [])]
+    title = summary.get("destination") or request.get("destination") or it.get("destination") or ""
+    return {
+        "title": title,
+        "body": _text(summary.get("display_name"), request.get("origin"), *activities),
+        "themes": request.get("themes") or it.get("themes") or [],
+        "status": it.get("status"),
+        "owner": it.get("user_id"),
+        "updated_at": _iso(it.get("updated_at")),
+    }
+
+
+def comment_fields(comment: dict):
+    return {
+        "title": "",
+        "body": comment.get("text") or "",
+        "owner": comment.get("user_id"),
+        "scope": comment.get("itinerary_id"),
+        "updated_at": _iso(comment.get("updated_at")),
+    }
+
+
+def gem_fields(gem: dict):
+    location = gem.get("location") or {}
+    category = (gem.get("category") or "").lower() or None
+    return {
+        "title": gem.get("name") or "",
+        "body": _text(gem.get("description"), location.get("name"), location.get("address")),
+        "themes": [category] if category else [],
+        "category": category,
+        "owner": gem.get("submitted_by_user_id"),
+        "updated_at": _iso(gem.get("updated_at")),
+    }
+
+
+_FIELDS = {"trips": trip_fields, "comments": comment_fields, "gems": gem_fields}
+
+
+def index_trip(itinerary_id: str, it: dict):
+    _safely("upsert", SearchIndex.upsert, "trips", itinerary_id, **trip_fields(it))
+
+
+def index_comment(comment_id: str, comment: dict):
+    _safely("upsert", SearchIndex.upsert, "comments", comment_id, **comment_fields(comment))
+
+
+def index_gem(gem_id: str, gem: dict):
+    _safely("upsert", SearchIndex.upsert, "gems", gem_id, **gem_fields(gem))
+
+
+def remove(kind: str, doc_id: str):
+    _safely("delete", SearchIndex.delete, kind, doc_id)
+
+
+def search(kind: str, q: str, **kwargs):
+    return get_index().search(kind, q, **kwargs)
+
+
+def rebuild():
+    """Re-index every itinerary, comment and hidden gem from Firestore. Returns counts per kind."""
+    from core.firebase import get_db
+
+    index = get_index()
+    counts = {}
+    for kind, collection in (("trips", "itineraries"), ("comments", "comments"), ("gems", "hidden_gems")):
+        index.clear(kind)
+        counts[kind] = 0
+        for doc in get_db().collection(collection).stream():
+            index.upsert(kind, doc.id, **_FIELDS[kind](doc.to_dict()))
+            counts[kind] += 1
+    return counts
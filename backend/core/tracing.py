@@ -0,0 +1,260 @@
+"""
+Lightweight OpenTelemetry-style tracing.
+
+Spans carry W3C trace-context ids so a trace started by an agent tool call
+(`traceparent` request header) continues through the API handler and into its
+Firestore / provider calls. Finished spans go to a local exporter selected by
+TRACING_EXPORTER: "console" (log lines), "file" (JSON lines at TRACING_FILE)
+or "none" (default). The file exporter only queues spans; a background thread
+appends them every TRACING_FLUSH_SECONDS. agents/tracing.py exports through
+the same exporter.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_FLUSH_SECONDS = float(os.getenv("TRACING_FLUSH_SECONDS", "1"))
+TRACING_BUFFER_SPANS = int(os.getenv("TRACING_BUFFER_SPANS", "10000"))  # queued spans; beyond this new ones are dropped
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "travelai-api")
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "status",
+                 "error", "start_ns", "end_ns", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str, sampled: bool, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error = None
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self):
+        return {
+            "service": SERVICE_NAME,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": datetime.fromtimestamp(self.start_ns / 1e9, tz=timezone.utc).isoformat(),
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _RemoteParent:
+    """Span context received from a `traceparent` header."""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+_current = ContextVar("current_span", default=None)
+
+
+# -----------------------------
+# Exporters
+# -----------------------------
+# Exporters take finished spans as dicts (Span.to_dict() or an agent tool span).
+class ConsoleExporter:
+    def export(self, record: dict):
+        logger.info("span %s", json.dumps(record, default=str))
+
+    def close(self):
+        pass
+
+
+class FileExporter:
+    """
+    JSON lines appended to `path`. export() only queues the record; a daemon thread
+    serialises and writes the queue every flush_seconds (sooner once half of
+    max_buffer is waiting), so request threads never open the file. A full queue
+    drops new spans and counts them in `dropped`.
+    """
+
+    def __init__(self, path: str, flush_seconds: float = TRACING_FLUSH_SECONDS, max_buffer: int = TRACING_BUFFER_SPANS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # keeps batches in order between the writer and flush()
+        self._closed = False
+        self._thread = None
+        atexit.register(self.close)
+
+    def export(self, record: dict):
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+            if len(self._buffer) >= self.max_buffer // 2:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_seconds)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Write the queued spans now."""
+        with self._write_lock:
+            with self._cond:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return
+            data = "".join(json.dumps(record, default=str) + "\n" for record in records)
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(data)
+            except OSError:
+                logger.exception("writing %d spans to %s failed", len(records), self.path)
+
+    def close(self):
+        """Stop the writer thread and write what is still queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+
+def make_exporter(kind: str = TRACING_EXPORTER, path: str = TRACING_FILE):
+    if kind == "console":
+        return ConsoleExporter()
+    if kind == "file":
+        return FileExporter(path)
+    return None
+
+
+_exporter = make_exporter()
+
+
+def set_exporter(exporter):
+    """Replace the span exporter (None disables tracing)."""
+    global _exporter
+    _exporter = exporter
+
+
+def enabled():
+    return _exporter is not None
+
+
+def export(record: dict):
+    """Hand a finished span dict to the exporter (no-op when tracing is disabled)."""
+    exporter = _exporter
+    if exporter is None:
+        return
+    try:
+        exporter.export(record)
+    except Exception:
+        logger.exception("span export failed")
+
+
+def close():
+    """Write out spans the exporter still holds (app shutdown)."""
+    if _exporter is not None:
+        _exporter.close()
+
+
+# -----------------------------
+# Span API
+# -----------------------------
+def parse_traceparent(header: Optional[str]):
+    if not header:
+        return None
+    m = _TRACEPARENT_RE.match(header.strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return _RemoteParent(m.group(1), m.group(2), m.group(3) == "01")
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", parent=None, activate: bool = True, **attributes):
+    """
+    Open a span as a child of `parent` (a Span or parsed traceparent), else of the
+    current span, else as a new trace root. When activate is True the span becomes the
+    current span for the block. Yields None when tracing is disabled.
+    """
+    if _exporter is None:
+        yield None
+        return
+    parent = parent or _current.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, kind, parent.sampled, attributes)
+    else:
+        span = Span(name, secrets.token_hex(16), None, kind, random.random() < TRACING_SAMPLE_RATIO, attributes)
+    token = _current.set(span) if activate else None
+    try:
+        yield span
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        if token is not None:
+            _current.reset(token)
+        if span.sampled:
+            export(span.to_dict())
+
+
+def inject_headers(headers: Optional[dict] = None):
+    """Add the current span's traceparent to outbound request headers."""
+    headers = dict(headers or {})
+    span = _current.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+    return headers
@@ -0,0 +1,265 @@
+"""
+Write-behind buffer for small, frequent Firestore writes.
+
+Two kinds of write go through it:
+
+  defer(collection, doc_id, fields, increments)  fire-and-forget field updates
+      (last_login, counters, telemetry). Updates to the same document coalesce
+      until the next flush: later field values win and increments add up, so a
+      burst of logins or votes becomes one write per document.
+  await write(collection, doc_id, doc)  a full document set that the caller
+      needs committed before it answers (comments, votes). Concurrent calls are
+      group-committed: they wait at most WRITE_BEHIND_LINGER_MS and share one
+      batch round-trip.
+
+A flush commits up to WRITE_BEHIND_BATCH_SIZE entries as one Firestore batch.
+It runs when that many entries are pending, after the linger when a caller is
+waiting, and otherwise every WRITE_BEHIND_FLUSH_MS. If a batch fails its entries
+are committed one by one so a single bad document (e.g. deleted since) cannot
+sink the others; deferred updates that still fail are held back and retried on
+later flushes, the first one WRITE_BEHIND_FLUSH_MS later and doubling from there,
+and dropped after WRITE_BEHIND_MAX_ATTEMPTS. At most WRITE_BEHIND_MAX_PENDING
+deferred documents are held: beyond that new updates are dropped and counted,
+while awaited writes bypass the buffer. close() (app shutdown) flushes everything,
+held retries included, once more.
+"""
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from core.firebase import get_db
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1").lower() in ("1", "true", "yes")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "400"))  # Firestore caps a batch at 500 writes
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "1000"))
+WRITE_BEHIND_LINGER_MS = float(os.getenv("WRITE_BEHIND_LINGER_MS", "10"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_MAX_ATTEMPTS = 3
+
+FLUSH_LATENCY = REGISTRY.histogram("write_behind_flush_seconds", "Duration of a write-behind batch commit")
+FLUSHED = REGISTRY.counter("write_behind_flushed_total", "Entries committed by the write-behind buffer", ("kind",))
+COALESCED = REGISTRY.counter("write_behind_coalesced_total", "Deferred updates merged into an already pending document")
+DROPPED = REGISTRY.counter("write_behind_dropped_total", "Deferred updates discarded", ("reason",))
+PENDING = REGISTRY.gauge("write_behind_pending", "Entries waiting for the next flush")
+
+
+class _Entry:
+    __slots__ = ("collection", "doc_id", "doc", "fields", "increments", "future", "attempts", "retry_at")
+
+    def __init__(self, collection: str, doc_id: str, doc: Optional[dict] = None, future=None):
+        self.collection = collection
+        self.doc_id = doc_id
+        self.doc = doc  # full set (awaited write) when not None
+        self.fields = {}
+        self.increments = {}
+        self.future = future
+        self.attempts = 0
+        self.retry_at = 0.0
+
+    def apply(self, batch, db):
+        ref = db.collection(self.collection).document(self.doc_id)
+        if self.doc is not None:
+            batch.set(ref, self.doc)
+            return
+        from google.cloud.firestore_v1 import Increment
+
+        update = dict(self.fields)
+        for path, amount in self.increments.items():
+            update[path] = Increment(amount)
+        batch.update(ref, update)
+
+
+def _commit(entries):
+    db = get_db()
+    batch = db.batch()
+    for entry in entries:
+        entry.apply(batch, db)
+    batch.commit()
+
+
+def _commit_each(entries):
+    """Commit entries individually; returns [(entry, exception or None)]."""
+    results = []
+    for entry in entries:
+        try:
+            _commit([entry])
+            results.append((entry, None))
+        except Exception as e:
+            results.append((entry, e))
+    return results
+
+
+class WriteBehindBuffer:
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 linger_ms: float = WRITE_BEHIND_LINGER_MS, max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 enabled: bool = WRITE_BEHIND_ENABLED):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.linger = linger_ms / 1000.0
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._deferred = OrderedDict()  # (collection, doc_id) -> _Entry, coalesced
+        self._retrying = OrderedDict()  # failed deferred entries waiting for their retry_at
+        self._writes = []  # awaited full-document writes, in arrival order
+        self._timer = None
+        self._timer_due = None
+        self._flushing = None
+        self._closed = False
+
+    def _pending(self):
+        """Entries the next flush may take (held retries excluded)."""
+        return len(self._deferred) + len(self._writes)
+
+    def _held(self):
+        return self._pending() + len(self._retrying)
+
+    # ---- producers ----
+    def defer(self, collection: str, doc_id: str, fields: Optional[dict] = None, increments: Optional[dict] = None):
+        """
+        Queue a field update (dotted paths allowed) and/or counter increments for an existing
+        document. Returns False when the update was dropped because the buffer is full.
+        """
+        if not self.enabled or self._closed:
+            return self._write_through(collection, doc_id, fields, increments)
+        key = (collection, doc_id)
+        entry = self._deferred.get(key) or self._retrying.get(key)
+        if entry is None:
+            if len(self._deferred) + len(self._retrying) >= self.max_pending:
+                DROPPED.inc(reason="full")
+                return False
+            entry = self._deferred[key] = _Entry(collection, doc_id)
+        else:
+            COALESCED.inc()
+        entry.fields.update(fields or {})
+        for path, amount in (increments or {}).items():
+            entry.increments[path] = entry.increments.get(path, 0) + amount
+        self._schedule(self.flush_interval)
+        return True
+
+    async def write(self, collection: str, doc_id: str, doc: dict):
+        """Set a whole document and return once it is committed (group-committed with concurrent writes)."""
+        if not self.enabled or self._closed or len(self._writes) >= self.max_pending:
+            await asyncio.to_thread(_commit, [_Entry(collection, doc_id, doc)])
+            FLUSHED.inc(kind="write")
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._writes.append(_Entry(collection, doc_id, doc, future))
+        self._schedule(self.linger)
+        await future
+
+    def _write_through(self, collection, doc_id, fields, increments):
+        entry = _Entry(collection, doc_id)
+        entry.fields.update(fields or {})
+        entry.increments.update(increments or {})
+        try:
+            _commit([entry])
+        except Exception as e:
+            DROPPED.inc(reason="error")
+            logger.warning("Write-through update of %s/%s failed: %s", collection, doc_id, e)
+            return False
+        FLUSHED.inc(kind="deferred")
+        return True
+
+    # ---- flushing ----
+    def _schedule(self, delay: float):
+        PENDING.set(self._held())
+        if self._pending() >= self.batch_size:
+            delay = 0
+        loop = asyncio.get_running_loop()
+        due = loop.time() + delay
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    def _take(self):
+        entries = self._writes[:self.batch_size]
+        del self._writes[:len(entries)]
+        while len(entries) < self.batch_size and self._deferred:
+            entries.append(self._deferred.popitem(last=False)[1])
+        return entries
+
+    def _release_retries(self):
+        """Move held retries that are due (all of them once closed) back into the queue."""
+        now = asyncio.get_running_loop().time()
+        for key, entry in list(self._retrying.items()):
+            if entry.retry_at <= now or self._closed:
+                del self._retrying[key]
+                self._deferred[key] = entry
+
+    async def flush(self):
+        """
+        Commit everything pending, one batch at a time. Held retries are released once,
+        at the start, so an update that fails again waits for a later flush.
+        """
+        self._release_retries()
+        while self._pending():
+            entries = self._take()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(_commit, entries)
+                results = [(entry, None) for entry in entries]
+            except Exception as e:
+                logger.warning("Write-behind batch of %d failed (%s); committing individually", len(entries), e)
+                results = await asyncio.to_thread(_commit_each, entries)
+            FLUSH_LATENCY.observe(time.perf_counter() - started)
+            for entry, error in results:
+                self._settle(entry, error)
+        PENDING.set(self._held())
+        if self._retrying and not self._closed:
+            due = min(entry.retry_at for entry in self._retrying.values())
+            self._schedule(max(0.0, due - asyncio.get_running_loop().time()))
+
+    def _settle(self, entry: _Entry, error: Optional[Exception]):
+        kind = "deferred" if entry.doc is None else "write"
+        if error is None:
+            FLUSHED.inc(kind=kind)
+            if entry.future is not None and not entry.future.done():
+                entry.future.set_result(None)
+            return
+        if entry.future is not None:
+            if not entry.future.done():
+                entry.future.set_exception(error)
+            return
+        entry.attempts += 1
+        key = (entry.collection, entry.doc_id)
+        if entry.attempts >= WRITE_BEHIND_MAX_ATTEMPTS or self._closed:
+            DROPPED.inc(reason="error")
+            logger.warning("Dropping deferred update of %s/%s after %d attempts: %s",
+                           entry.collection, entry.doc_id, entry.attempts, error)
+            return
+        newer = self._deferred.pop(key, None)
+        if newer is not None:
+            # newer updates arrived meanwhile: fold them over the failed ones
+            entry.fields.update(newer.fields)
+            for path, amount in newer.increments.items():
+                entry.increments[path] = entry.increments.get(path, 0) + amount
+        delay = self.flush_interval * 2 ** (entry.attempts - 1)
+        entry.retry_at = asyncio.get_running_loop().time() + delay
+        self._retrying[key] = entry
+
+    async def close(self):
+        """Flush on shutdown; later writes go straight to Firestore."""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        await self.flush()
+
+
+WRITE_BEHIND = WriteBehindBuffer()
@@ -0,0 +1,26 @@
+"""
+gunicorn settings for the API with uvicorn workers.
+
+    cd backend && gunicorn -c gunicorn.conf.py main:app
+
+Reads the same environment variables as serve.py.
+"""
+import os
+
+from serve import server_config
+
+_config = server_config()
+
+bind = f"{_config['host']}:{_config['port']}"
+workers = _config["workers"]
+worker_class = "uvicorn.workers.UvicornWorker"  # picks uvloop/httptools when installed
+keepalive = _config["timeout_keep_alive"]
+backlog = _config["backlog"]
+forwarded_allow_ips = _config["forwarded_allow_ips"]
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# recycle workers periodically to bound memory growth from long-lived caches
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+accesslog = "-" if _config["access_log"] else None
+loglevel = _config["log_level"]
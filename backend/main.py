@@ -1,10 +1,17 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
 import uvicorn
 
 # Import router
 from api.authentication import router as auth_router
 from api.trips import router as trips_router
+from api.trip_bundle import router as trip_bundle_router
+from api.trip_generation import router as trip_generation_router
 from api.payments import router as payments_router
 from api.reservations import router as reservations_router
 from api.group_members import router as group_members_router
@@ -12,14 +19,67 @@ from api.comments import router as comments_router
 from api.votes import router as votes_router
 from api.hidden_gems import router as hidden_gems_router
 from api.weather_alerts import router as weather_alerts_router # New import
-from core.firebase import init_firebase
+from api.admin import router as admin_router
+from api.search import router as search_router
+from api import alert_engine, trip_generation
+from core import firebase, queries, cdc, pricing
+from core import metrics, tracing
+from core.profiler import PROFILER, profile_request
+from core.write_behind import WRITE_BEHIND
+from core.http_client import close_http_client
+from core.responses import FastJSONResponse, CompressionMiddleware
 
-# Initialize Firebase
-firebase_initialized = init_firebase()
-if not firebase_initialized:
-    print("⚠️ Warning: Firebase initialization failed. Some features may not work.")
+# Set REQUIRE_FIREBASE=1 to refuse to start without a working Firestore client
+REQUIRE_FIREBASE = os.getenv("REQUIRE_FIREBASE", "").lower() in ("1", "true", "yes")
 
-app = FastAPI(title="TravelAI Pro API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Firebase (and the google-cloud stack it imports) is initialised off the event loop
+    initialized = await asyncio.to_thread(firebase.init_firebase)
+    if not initialized:
+        if REQUIRE_FIREBASE:
+            raise RuntimeError(f"Firebase initialization failed: {firebase.firebase_error}")
+        print("⚠️ Warning: Firebase initialization failed. Some features may not work.")
+    # every registered query must have its composite index in firestore.indexes.json
+    queries.validate_manifest()
+    loop_lag_task = asyncio.create_task(metrics.monitor_event_loop())
+    PROFILER.start()
+    # opt-in: WEATHER_ALERTS_INTERVAL_MINUTES > 0 (every worker loops; one claims each interval's run)
+    alert_task = None
+    if alert_engine.WEATHER_ALERTS_INTERVAL_MINUTES > 0:
+        alert_task = asyncio.create_task(alert_engine.alert_scheduler())
+    # compacts the change-data-capture journal into columnar segments
+    cdc_task = asyncio.create_task(cdc.cdc_flusher()) if cdc.CDC_ENABLED else None
+    # FX rates are re-fetched from FX_RATES_URL, or re-read from FX_RATES_FILE without one
+    fx_task = asyncio.create_task(pricing.fx_refresher())
+    # fails itineraries left "generating" by a worker that died mid-job
+    sweep_task = asyncio.create_task(trip_generation.generation_sweeper())
+    try:
+        yield
+    finally:
+        if alert_task is not None:
+            alert_task.cancel()
+        fx_task.cancel()
+        sweep_task.cancel()
+        # in-flight generations cannot outlive the process: record them as failed
+        await trip_generation.shutdown_jobs()
+        if cdc_task is not None:
+            cdc_task.cancel()
+            await asyncio.to_thread(cdc.flush)
+        PROFILER.stop()
+        loop_lag_task.cancel()
+        # pending last_login / counter updates
+        await WRITE_BEHIND.close()
+        # pooled provider connections
+        await close_http_client()
+        # spans still queued for TRACING_FILE
+        tracing.close()
+
+app = FastAPI(title="TravelAI Pro API", version="1.0.0", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# gzip/brotli for large single-shot responses; added first so it sits innermost and sees the
+# handler's complete body (the http middlewares below re-stream it in chunks)
+app.add_middleware(CompressionMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -38,9 +98,59 @@ async def add_security_headers(request, call_next):
     response.headers["Cross-Origin-Embedder-Policy"] = "unsafe-none"
     return response
 
+# Per-route latency histogram; route is the matched template so ids don't explode cardinality
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+# Opt-in sampling profiler; keeps stacks of requests slower than PROFILER_SLOW_MS
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    with profile_request(request.method, request.url.path) as record:
+        response = await call_next(request)
+        if record is not None:
+            route = request.scope.get("route")
+            record.route = getattr(route, "path", None)
+        return response
+
+# Server span per request, continuing the caller's trace when a traceparent header is sent
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    parent = tracing.parse_traceparent(request.headers.get("traceparent"))
+    with tracing.start_span(f"{request.method} {request.url.path}", kind="server", parent=parent,
+                            **{"http.method": request.method, "http.target": request.url.path}) as span:
+        response = await call_next(request)
+        if span is not None:
+            route = request.scope.get("route")
+            if route is not None:
+                span.name = f"{request.method} {route.path}"
+                span.set_attribute("http.route", route.path)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.status = "error"
+            response.headers["traceparent"] = span.traceparent
+        return response
+
 # Mount authentication router
 app.include_router(auth_router, prefix="/api", tags=["Authentication & User"])
 app.include_router(trips_router, tags=["Trips"]) # Removed prefix="/api"
+app.include_router(trip_bundle_router, tags=["Trips"])
+app.include_router(trip_generation_router, tags=["Trips"])
 app.include_router(payments_router, tags=["Payments & Booking"]) # Removed prefix="/api"
 app.include_router(reservations_router, tags=["Reservations"]) # New router inclusion
 app.include_router(group_members_router, tags=["Group Collaboration"]) # New router inclusion
@@ -48,16 +158,32 @@ app.include_router(comments_router, tags=["Comments"]) # New router inclusion
 app.include_router(votes_router, tags=["Votes"]) # New router inclusion
 app.include_router(hidden_gems_router, tags=["Hidden Gems"]) # New router inclusion
 app.include_router(weather_alerts_router, tags=["Weather Alerts"]) # New router inclusion
+app.include_router(search_router, tags=["Search"])
+app.include_router(admin_router, tags=["Admin"])
 
 @app.get("/")
 def root():
     return {"message": "TravelAI Pro API is running"}
 
+# Prometheus scrape endpoint; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    token = os.getenv("METRICS_TOKEN", "")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Health check
 @app.get("/api/health")
 async def health_check():
     from datetime import datetime
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    # init failures are logged by core.firebase; unauthenticated callers only see the status
+    firebase_ok = firebase.db is not None
+    return {
+        "status": "healthy" if firebase_ok else "degraded",
+        "firebase": "ok" if firebase_ok else "unavailable",
+        "timestamp": datetime.utcnow(),
+    }
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,51 @@
+"""
+Production launcher: N uvicorn workers with uvloop/httptools when available.
+
+    cd backend && python serve.py
+
+Settings (environment):
+  HOST / PORT                 bind address (0.0.0.0:8000)
+  WEB_CONCURRENCY             worker processes (default: CPU count)
+  KEEP_ALIVE                  keep-alive timeout in seconds (75, above typical LB idle timeouts)
+  BACKLOG                     listen backlog (2048)
+  LIMIT_CONCURRENCY           per-worker connection cap before 503 (unset = unlimited)
+  FORWARDED_ALLOW_IPS         proxies trusted for X-Forwarded-* ("127.0.0.1")
+  CACHE_BACKEND               defaults to "sqlite" (host-wide shared cache) when running
+                              more than one worker; see core/cache.py
+
+The same tuning is available under gunicorn via gunicorn.conf.py.
+"""
+import importlib.util
+import os
+
+import uvicorn
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_config():
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    if workers > 1:
+        # per-worker caches would multiply misses; share them across the host by default
+        os.environ.setdefault("CACHE_BACKEND", "sqlite")
+    limit = os.getenv("LIMIT_CONCURRENCY")
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "8000")),
+        "workers": workers,
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "timeout_keep_alive": int(os.getenv("KEEP_ALIVE", "75")),
+        "backlog": int(os.getenv("BACKLOG", "2048")),
+        "limit_concurrency": int(limit) if limit else None,
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "access_log": os.getenv("ACCESS_LOG", "").lower() in ("1", "true", "yes"),
+        "log_level": os.getenv("LOG_LEVEL", "info"),
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run("main:app", **server_config())
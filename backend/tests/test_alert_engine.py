@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+import core.firebase
+from api import alert_engine
+from bench.fake_firestore import FakeFirestore
+
+TODAY = date.today()
+
+
+def forecast(pops):
+    return {"daily": [{"dt": (TODAY + timedelta(days=i)).isoformat(), "pop": pop, "temp": {"min": 10, "max": 20}}
+                      for i, pop in enumerate(pops)]}
+
+
+class AlertEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.db = core.firebase.db = FakeFirestore()
+        self.db.collection("itineraries").document("it_1").set({
+            "status": "upcoming",
+            "summary": {"destination": "Goa", "center": {"lat": 15.5, "lng": 73.8},
+                        "start_date": TODAY.isoformat(), "duration_days": 2},
+            "booking_options": {"hotels": [{"quote_id": "q"}]},
+        })
+        self.pops = [0.9, 0.1]
+        self.fetch = alert_engine.fetch_weather_for_latlng
+
+        async def fake_fetch(lat, lng):
+            return forecast(self.pops)
+        alert_engine.fetch_weather_for_latlng = fake_fetch
+
+    def tearDown(self):
+        alert_engine.fetch_weather_for_latlng = self.fetch
+
+    def alert_ids(self):
+        return sorted(doc.id for doc in self.db.collection("weather_alerts").stream())
+
+    def test_cleared_alerts_are_deleted_from_stored_state(self):
+        asyncio.run(alert_engine.run_alert_engine())
+        self.assertEqual(self.alert_ids(), [alert_engine.alert_id("it_1", TODAY.isoformat(), "rain")])
+
+        # a fresh worker (no in-process state) still clears the alert once rain is no longer forecast
+        self.pops = [0.1, 0.1]
+        summary = asyncio.run(alert_engine.run_alert_engine())
+        self.assertEqual(self.alert_ids(), [])
+        self.assertEqual(summary["alerts_cleared"], 1)
+
+    def test_manual_alerts_are_kept(self):
+        self.db.collection("weather_alerts").document("alert_x").set({"itinerary_id": "it_1", "message": "manual"})
+        self.pops = [0.1, 0.1]
+        asyncio.run(alert_engine.run_alert_engine())
+        self.assertEqual(self.alert_ids(), ["alert_x"])
+
+    def test_itineraries_are_loaded_without_unused_fields(self):
+        (_, it), = alert_engine._load_active_itineraries()
+        self.assertNotIn("booking_options", it)
+        self.assertEqual(it["summary"]["destination"], "Goa")
+
+    def test_one_worker_claims_each_interval(self):
+        self.assertTrue(alert_engine.claim_run(60))
+        self.assertFalse(alert_engine.claim_run(60))
+
+
+class EvaluateRulesTest(unittest.TestCase):
+    WEATHER = {"daily": [
+        {"dt": "2026-06-01", "pop": 0.9, "temp": {"min": 20, "max": 30}},
+        {"dt": "2026-06-02", "pop": 0.7, "temp": {"min": None, "max": 38}},
+        {"dt": "2026-06-03", "pop": None, "temp": {"min": -8, "max": 2}},
+    ]}
+    EXPECTED = {
+        "2026-06-01": {"rain": ("high", "Heavy rain likely (90% chance)")},
+        "2026-06-02": {"rain": ("medium", "Rain likely (70% chance)"), "heat": ("high", "Extreme heat, up to 38°C")},
+        "2026-06-03": {"cold": ("medium", "Freezing temperatures, down to -8°C")},
+    }
+
+    def test_most_severe_hit_per_rule(self):
+        hits = alert_engine.evaluate_rules(alert_engine.forecast_columns(self.WEATHER))
+        self.assertEqual(hits, self.EXPECTED)
+
+    def test_without_numpy(self):
+        with mock.patch.object(alert_engine, "numpy", None):
+            hits = alert_engine.evaluate_rules(alert_engine.forecast_columns(self.WEATHER))
+        self.assertEqual(hits, self.EXPECTED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import core.firebase
+from core import alternatives
+from core.alternatives import AlternativesIndex, index_for, precompute_top_k
+from bench.fake_firestore import FakeFirestore
+from api.trips import get_alternatives, AlternativesRequest
+
+HOTELS = [
+    {"id": "h1", "price_total": 1000, "stars": 3, "lat": 15.50, "lng": 73.80, "themes": ["Beach"]},
+    {"id": "h2", "price_total": 2000, "stars": 4, "lat": 15.51, "lng": 73.81},
+    {"id": "h3", "price_total": 3000, "stars": 4.5, "lat": 15.90, "lng": 74.20, "themes": ["beach"]},
+    {"id": "h4", "price_total": 4000, "stars": 5, "lat": 15.52, "lng": 73.80, "category": "Heritage"},
+    {"id": "h5", "price_total": 2100, "lat": 15.50, "lng": 73.81},
+]
+
+
+def ids(items):
+    return [c["id"] for c in items]
+
+
+class AlternativesIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = AlternativesIndex({"hotels": HOTELS})
+
+    def test_price_bounds_are_inclusive(self):
+        self.assertEqual(ids(self.index.query("hotel", {"min_price": 2000, "max_price": 3000})), ["h2", "h5", "h3"])
+        self.assertEqual(ids(self.index.query("hotel", {"max_price": 999})), [])
+        self.assertEqual(ids(self.index.query("hotel", {"min_price": 4000})), ["h4"])
+
+    def test_radius_filters_by_distance(self):
+        # h3 is ~60 km away; the others are within 3 km of the origin
+        near = self.index.query("hotel", {"distance_km": 5}, origin=(15.50, 73.80))
+        self.assertEqual(ids(near), ["h1", "h2", "h5", "h4"])
+        self.assertEqual(ids(self.index.query("hotel", {"distance_km": 1, "lat": 15.90, "lng": 74.20})), ["h3"])
+
+    def test_stars_compare_as_floats(self):
+        self.assertEqual(ids(self.index.query("hotel", {"min_stars": 4.5})), ["h3", "h4"])
+        self.assertEqual(ids(self.index.query("hotel", {"min_stars": 4})), ["h2", "h3", "h4"])
+
+    def test_theme_matches_themes_and_category(self):
+        self.assertEqual(ids(self.index.query("hotel", {"theme": "BEACH"})), ["h1", "h3"])
+        self.assertEqual(ids(self.index.query("hotel", {"theme": "heritage"})), ["h4"])
+
+    def test_exclude_and_limit(self):
+        self.assertEqual(ids(self.index.query("hotel", {"limit": 2}, exclude={"h1"})), ["h2", "h5"])
+
+    def test_top_k_prefers_similar_price_then_distance(self):
+        self.assertEqual(self.index.top_k_for(dict(HOTELS[1], type="hotel"), k=2), ["h5", "h1"])
+        self.assertEqual(self.index.top_k_for({"id": "x", "type": "flight"}), [])
+
+    def test_precompute_covers_itinerary_items(self):
+        topk = precompute_top_k({"days": []}, {"hotels": HOTELS}, k=1)
+        self.assertEqual(topk["h2"], ["h5"])
+        self.assertEqual(set(topk), {"h1", "h2", "h3", "h4", "h5"})
+
+
+class IndexCacheTest(unittest.TestCase):
+    def setUp(self):
+        alternatives._cache.clear()
+
+    def test_index_is_rebuilt_when_updated_at_changes(self):
+        it = {"updated_at": "t1", "booking_options": {"hotels": HOTELS[:1]}}
+        first = index_for("it1", it)
+        self.assertIs(index_for("it1", dict(it)), first)
+        changed = index_for("it1", {"updated_at": "t2", "booking_options": {"hotels": HOTELS}})
+        self.assertIsNot(changed, first)
+        self.assertEqual(len(changed.types["hotel"].items), len(HOTELS))
+
+
+class AlternativesEndpointTest(unittest.TestCase):
+    def setUp(self):
+        alternatives._cache.clear()
+        self.db = core.firebase.db = FakeFirestore()
+        self.db.collection("itineraries").document("it1").set({
+            "user_id": "u1", "updated_at": "t1", "booking_options": {"hotels": HOTELS},
+            "alternatives_topk": {"h2": ["h5"]},
+        })
+
+    def alternatives(self, **body):
+        return asyncio.run(get_alternatives("it1", AlternativesRequest(item_type="hotel", current_id="h2", **body),
+                                            current_user={"uid": "u1"}))["alternatives"]
+
+    def test_without_constraints_serves_the_precomputed_top_k(self):
+        self.assertEqual(ids(self.alternatives()), ["h5"])
+
+    def test_constraints_query_the_index(self):
+        self.assertEqual(ids(self.alternatives(constraints={"stars": "4.5"})), ["h3", "h4"])
+        self.assertEqual(ids(self.alternatives(constraints={"max_price": 2500, "distance_km": 5})), ["h1", "h5"])
+
+    def test_invalid_constraints_are_rejected(self):
+        for constraints in ({"max_price": "cheap"}, {"limit": 0}, {"limit": 101}, {"distance_km": -1}):
+            with self.assertRaises(ValidationError):
+                AlternativesRequest(item_type="hotel", current_id="h2", constraints=constraints)
+
+    def test_other_users_are_forbidden(self):
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(get_alternatives("it1", AlternativesRequest(item_type="hotel", current_id="h2"),
+                                         current_user={"uid": "u2"}))
+        self.assertEqual(ctx.exception.status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from datetime import datetime, timedelta
+
+from core import analytics
+
+NOW = datetime.utcnow().replace(microsecond=0)
+DAY = (NOW - timedelta(days=1)).date().isoformat()
+
+DOCS = {
+    "itineraries": {"it1": {"destination": "Goa"}, "it2": {"destination": ""}},
+    "bookings": {
+        "b1": {"itinerary_id": "it1", "reservation_id": "r1", "amount": 100.0, "currency": "INR", "status": "confirmed",
+               "created_at": NOW - timedelta(days=1)},
+        "b2": {"itinerary_id": "it1", "reservation_id": "r2", "amount": 50.0, "currency": "INR", "status": "cancelled",
+               "created_at": NOW - timedelta(days=1)},
+        "b3": {"itinerary_id": "it2", "reservation_id": None, "amount": None, "currency": None, "status": "confirmed",
+               "created_at": NOW - timedelta(days=1)},
+        "b4": {"itinerary_id": "it9", "amount": 7.0, "currency": "USD", "status": "confirmed", "created_at": NOW - timedelta(days=90)},
+    },
+    "reservations": {
+        "r1": {"status": "held", "created_at": NOW - timedelta(days=1), "expires_at": NOW - timedelta(hours=1)},
+        "r2": {"status": "cancelled", "created_at": NOW - timedelta(days=1), "expires_at": NOW + timedelta(hours=1)},
+        "r3": {"status": "held", "created_at": NOW - timedelta(days=1), "expires_at": NOW - timedelta(hours=1)},
+        "r4": {"status": "held", "created_at": None, "expires_at": NOW + timedelta(hours=1)},
+        "r5": {"status": "paid", "created_at": NOW - timedelta(days=1), "expires_at": None},
+    },
+    "payments": {},
+}
+
+
+class AggregatesTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = analytics.numpy
+
+    def tearDown(self):
+        analytics.numpy = self.numpy
+
+    def load(self):
+        for name, docs in DOCS.items():
+            snapshot = analytics._snapshots[name]
+            snapshot.docs, snapshot._stamps, snapshot._columns = {k: dict(v) for k, v in docs.items()}, {}, None
+            snapshot.version += 1
+        analytics._results.clear()
+
+    def modes(self):
+        modes = [("lists", None)] + ([("numpy", self.numpy)] if self.numpy is not None else [])
+        for mode, module in modes:
+            with self.subTest(mode=mode):
+                analytics.numpy = module
+                self.load()
+                yield
+
+    def test_bookings_daily(self):
+        for _ in self.modes():
+            self.assertEqual(analytics.bookings_daily(30), [
+                {"date": DAY, "currency": "", "bookings": 1, "cancelled": 0, "gmv": 0.0},
+                {"date": DAY, "currency": "INR", "bookings": 2, "cancelled": 1, "gmv": 100.0},
+            ])
+            self.assertEqual(len(analytics.bookings_daily(0)), 3)
+
+    def test_gmv_by_destination(self):
+        for _ in self.modes():
+            self.assertEqual(analytics.gmv_by_destination(0), [
+                {"destination": "Goa", "currency": "INR", "bookings": 1, "gmv": 100.0},
+                {"destination": "unknown", "currency": "USD", "bookings": 1, "gmv": 7.0},
+                {"destination": "unknown", "currency": "", "bookings": 1, "gmv": 0.0},
+            ])
+
+    def test_reservation_conversion(self):
+        for _ in self.modes():
+            result = analytics.reservation_conversion(30)
+            self.assertEqual((result["reservations"], result["paid"], result["booked"]), (4, 2, 1))
+            self.assertEqual(result["daily"], [{"date": DAY, "reservations": 4, "paid": 2, "booked": 1, "conversion_rate": 0.25}])
+
+    def test_hold_expiry(self):
+        for _ in self.modes():
+            self.assertEqual(analytics.hold_expiry(30), {
+                "holds": 4, "resolved": 3, "outcomes": {"converted": 2, "expired": 1, "active": 1},
+                "expiry_rate": 0.3333, "conversion_rate": 0.6667,
+            })
+
+
+if __name__ == "__main__":
+    unittest.main()
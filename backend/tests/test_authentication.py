@@ -0,0 +1,82 @@
+import asyncio
+import os
+import shutil
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from fastapi import HTTPException
+
+import core.firebase
+from core import local_store
+from api import authentication
+from api.authentication import load_user_profile, update_user_doc, get_user_profile, sync_login, UserProfileUpdate, update_user_profile
+
+USER = {"uid": "u1"}
+
+
+class ProfileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db = local_store.temporary_store()
+        self.previous, core.firebase.db = core.firebase.db, self.db
+        self.users = self.db.collection("users")
+        self.users.document("u1").set({"uid": "u1", "full_name": "Asha", "last_login": datetime(2026, 1, 1)})
+        authentication._profiles.delete("u1")
+
+    def tearDown(self):
+        authentication._profiles.delete("u1")
+        core.firebase.db = self.previous
+        self.db.close()
+        shutil.rmtree(os.path.dirname(self.db.path))
+
+    def test_profile_is_read_through_once(self):
+        with mock.patch.object(authentication, "_read_user", wraps=authentication._read_user) as read:
+            for _ in range(3):
+                self.assertEqual(asyncio.run(load_user_profile("u1"))["full_name"], "Asha")
+        self.assertEqual(read.call_count, 1)
+        self.assertIsNone(asyncio.run(load_user_profile("nobody")))
+
+    def test_update_replaces_the_cached_profile(self):
+        asyncio.run(load_user_profile("u1"))
+        asyncio.run(update_user_profile(UserProfileUpdate(full_name="Asha R"), current_user=USER))
+        profile = asyncio.run(get_user_profile(current_user=USER))["profile"]
+        self.assertEqual(profile["full_name"], "Asha R")
+        self.assertNotIn("uid", profile)
+
+    def test_read_through_racing_an_update_does_not_pin_the_old_profile(self):
+        stale = self.users.document("u1").get().to_dict()
+        real_update = self.users.document("u1").update
+
+        def update(data):
+            # a concurrent read-through that loaded the old document caches it mid-write
+            authentication._profiles.set("u1", stale)
+            real_update(data)
+
+        document = mock.Mock(update=update)
+        with mock.patch.object(authentication, "get_db") as get_db:
+            get_db.return_value.collection.return_value.document.return_value = document
+            asyncio.run(update_user_doc("u1", {"full_name": "Asha R"}))
+        self.assertEqual(asyncio.run(load_user_profile("u1"))["full_name"], "Asha R")
+
+    def test_update_of_a_missing_profile_is_404(self):
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(update_user_doc("nobody", {"full_name": "x"}))
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_login_refreshes_the_cached_last_login(self):
+        asyncio.run(load_user_profile("u1"))
+        with mock.patch.object(authentication.WRITE_BEHIND, "defer") as defer:
+            asyncio.run(sync_login(current_user=USER))
+        (collection, uid, fields), _ = defer.call_args
+        self.assertEqual((collection, uid), ("users", "u1"))
+        profile = asyncio.run(get_user_profile(current_user=USER))["profile"]
+        self.assertEqual(profile["last_login"], fields["last_login"])
+
+    def test_login_without_a_profile_is_404(self):
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(sync_login(current_user={"uid": "nobody"}))
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import pickle
+import tempfile
+import unittest
+from datetime import date, datetime
+
+from core import cache
+
+
+class SharedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.backend = cache.SQLiteBackend(os.path.join(self.dir.name, "cache.sqlite3"))
+        self.previous, cache._backend = cache._backend, self.backend
+        self.cache = cache.Cache("test", ttl=60)
+
+    def tearDown(self):
+        cache._backend = self.previous
+        self.dir.cleanup()
+
+    def test_datetimes_round_trip_through_json(self):
+        value = {"fetched_at": datetime(2026, 1, 2, 3, 4, 5), "day": date(2026, 1, 2), "ids": ("a", "b")}
+        self.cache.set("k", value)
+        self.assertEqual(self.cache.get("k"), {"fetched_at": datetime(2026, 1, 2, 3, 4, 5), "day": date(2026, 1, 2), "ids": ["a", "b"]})
+
+    def test_pickled_blobs_are_never_loaded(self):
+        self.backend.set("test:k", pickle.dumps({"x": 1}), 60)
+        self.assertEqual(self.cache.get("k", "miss"), "miss")
+
+    def test_unserialisable_values_are_not_cached(self):
+        self.cache.set("k", object())
+        self.assertIsNone(self.cache.get("k"))
+
+    def test_async_variants(self):
+        async def run():
+            await self.cache.aset("k", [1, 2])
+            self.assertEqual(await self.cache.aget("k"), [1, 2])
+            await self.cache.adelete("k")
+            self.assertIsNone(await self.cache.aget("k"))
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from core import cdc
+
+
+class CdcTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.outbox = os.path.join(self.tmp, "_outbox")
+        self.patches = [mock.patch.object(cdc, "CDC_DIR", self.tmp), mock.patch.object(cdc, "CDC_ENABLED", True),
+                        mock.patch.object(cdc, "CDC_ORPHAN_SECONDS", 60)]
+        for patch in self.patches:
+            patch.start()
+        cdc._journal, cdc._pending = None, 0
+
+    def tearDown(self):
+        if cdc._journal is not None:
+            cdc._journal[1].close()
+        cdc._journal, cdc._pending = None, 0
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.tmp)
+
+    def write_journal(self, name, events, age_seconds=0):
+        os.makedirs(self.outbox, exist_ok=True)
+        path = os.path.join(self.outbox, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for ts, doc_id, values in events:
+                f.write(json.dumps({"c": "payments", "ts": ts, "op": "create", "id": doc_id, "v": values}) + "\n")
+        if age_seconds:
+            stamp = time.time() - age_seconds
+            os.utime(path, (stamp, stamp))
+        return path
+
+    def rows(self, collection):
+        rows = []
+        for path in cdc.segments(collection):
+            cols = cdc.read_segment(path)
+            rows.extend(dict(zip(cols, values)) for values in zip(*cols.values()))
+        return rows
+
+    def test_captured_changes_are_compacted_into_segments(self):
+        created = datetime(2026, 3, 1, 12, 0)
+        cdc.capture("bookings", "b1", "create", {"user_id": "u1", "amount": 1200, "status": "confirmed",
+                                                 "created_at": created, "tags": ["x"]})
+        cdc.capture("bookings", "b1", "update", {"status": "cancelled", "cancelled_at": None})
+        cdc.capture("itineraries", "it1", "update", {"summary.destination": "Goa", "summary.duration_days": "3"})
+        cdc.capture("comments", "c1", "create", {"text": "not captured"})
+        self.assertEqual(cdc.status()["pending_events"], 3)
+
+        summary = cdc.flush()
+        self.assertEqual((summary["journals"], summary["rows"]), (1, 3))
+        self.assertEqual(os.listdir(self.outbox), [])
+        create, update = self.rows("bookings")
+        self.assertEqual((create["op"], create["amount"], create["created_at"]), ("create", 1200.0, created))
+        self.assertEqual(create["fields"], "user_id,amount,status,created_at")
+        # a partial update only sets the fields it wrote; explicit nulls are kept apart from absent columns
+        self.assertEqual((update["status"], update["fields"], update["amount"]), ("cancelled", "status,cancelled_at", None))
+        (trip,) = self.rows("itineraries")
+        self.assertEqual((trip["destination"], trip["duration_days"]), ("Goa", 3))
+        self.assertIsInstance(trip["event_ts"], datetime)
+
+    def test_events_are_partitioned_by_date(self):
+        self.write_journal("j1.sealed", [("2026-03-01T23:59:00", "p1", {}), ("2026-03-02T00:01:00", "p2", {})])
+        cdc.flush()
+        self.assertEqual([os.path.basename(os.path.dirname(p)) for p in cdc.segments("payments")],
+                         ["date=2026-03-01", "date=2026-03-02"])
+
+    def test_torn_last_line_is_skipped(self):
+        path = self.write_journal("j1.sealed", [("2026-03-01T10:00:00", "p1", {"amount": 5.0})])
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"c": "payments", "ts": "2026-03-01T10:0')
+        self.assertEqual(cdc.flush()["rows"], 1)
+
+    def test_orphaned_journals_are_claimed(self):
+        self.write_journal("dead.ndjson", [("2026-03-01T10:00:00", "p1", {})], age_seconds=120)
+        self.write_journal("busy.ndjson", [("2026-03-01T10:00:00", "p2", {})])
+        self.write_journal("crashed.123.claimed", [("2026-03-01T10:00:00", "p3", {})], age_seconds=120)
+        self.write_journal("sealed.sealed", [("2026-03-01T10:00:00", "p4", {})])
+
+        summary = cdc.flush()
+        self.assertEqual(summary["journals"], 3)
+        self.assertEqual(sorted(r["doc_id"] for r in self.rows("payments")), ["p1", "p3", "p4"])
+        # another live worker's journal is left alone until it goes quiet
+        self.assertEqual(os.listdir(self.outbox), ["busy.ndjson"])
+
+    def test_own_open_journal_is_never_claimed_as_orphan(self):
+        cdc.capture("payments", "p1", "create", {"status": "paid"})
+        path = cdc._journal[0]
+        stamp = time.time() - 120
+        os.utime(path, (stamp, stamp))
+        self.assertEqual(cdc._claim_ready(), [])
+
+    def test_recompacting_a_journal_replaces_its_segment(self):
+        events = [("2026-03-01T10:00:00", "p1", {}), ("2026-03-01T11:00:00", "p2", {})]
+        self.write_journal("j1.sealed", events)
+        cdc.flush()
+        # the same journal compacted again after a crash between writing segments and removing it
+        self.write_journal("j1.sealed", events)
+        cdc.flush()
+        self.assertEqual(len(cdc.segments("payments")), 1)
+        self.assertEqual(len(self.rows("payments")), 2)
+
+    def test_failed_compaction_is_left_claimed_for_retry(self):
+        self.write_journal("j1.sealed", [("2026-03-01T10:00:00", "p1", {})])
+        with mock.patch.object(cdc, "_write_segment", side_effect=OSError("disk full")):
+            with self.assertLogs("core.cdc", "ERROR"):
+                self.assertEqual(cdc.flush()["journals"], 0)
+        (left,) = os.listdir(self.outbox)
+        self.assertTrue(left.startswith("j1.") and left.endswith(".claimed"))
+
+    def test_disabled(self):
+        with mock.patch.object(cdc, "CDC_ENABLED", False):
+            cdc.capture("payments", "p1", "create", {"status": "paid"})
+            self.assertEqual(cdc.flush(), {"enabled": False})
+        self.assertIsNone(cdc._journal)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+import core.firebase
+from core import cdc
+from bench.fake_firestore import FakeFirestore
+from api.payments import create_booking, create_checkout, BookingCreateRequest, CheckoutRequest
+from api.trips import reserve_items, ReserveRequest, ReservationItem
+from tests.test_pricing import use_fixture_rates
+
+USER = {"uid": "u1"}
+
+
+class CheckoutAmountTest(unittest.TestCase):
+    def setUp(self):
+        use_fixture_rates()
+        cdc.CDC_ENABLED = False
+        self.db = core.firebase.db = FakeFirestore()
+        self.db.collection("itineraries").document("it1").set({
+            "id": "it1",
+            "user_id": "u1",
+            "booking_options": {
+                "hotels": [{"quote_id": "q_ht", "price_total": 5000, "currency": "INR"}],
+                "activities": [{"id": "act_1", "estimated_cost": 20, "currency": "USD"}],
+            },
+        })
+
+    def reserve(self, *items, currency=None):
+        body = ReserveRequest(items=[ReservationItem(**item) for item in items], currency=currency)
+        return asyncio.run(reserve_items("it1", body, current_user=USER))
+
+    def checkout(self, reservation_id, amount, currency):
+        body = CheckoutRequest(reservation_id=reservation_id, amount=amount, currency=currency)
+        return asyncio.run(create_checkout(body, current_user=USER))
+
+    def assert_status(self, status, fn, *args, **kwargs):
+        with self.assertRaises(HTTPException) as ctx:
+            fn(*args, **kwargs)
+        self.assertEqual(ctx.exception.status_code, status)
+
+    def test_reserve_prices_from_quotes(self):
+        r = self.reserve({"type": "hotel", "provider_quote_id": "q_ht"}, {"type": "activity", "provider_quote_id": "act_1"})
+        # 20 USD = 1600 INR
+        self.assertEqual((r["total_amount"], r["currency"]), (6600.0, "INR"))
+        stored = self.db.peek("reservations", r["reservation_id"])
+        self.assertEqual(stored["total_amount_minor"], 660000)
+
+    def test_reserve_rejects_client_price_or_currency(self):
+        self.assert_status(400, self.reserve, {"type": "hotel", "provider_quote_id": "q_ht", "amount": 1})
+        self.assert_status(400, self.reserve, {"type": "hotel", "provider_quote_id": "q_ht", "currency": "JPY"})
+        self.assert_status(400, self.reserve, {"type": "hotel", "provider_quote_id": "q_unknown", "amount": 1})
+        r = self.reserve({"type": "hotel", "provider_quote_id": "q_ht", "amount": 5000, "currency": "INR"})
+        self.assertEqual(r["total_amount"], 5000.0)
+
+    def test_checkout_amount_or_currency_mismatch_is_400(self):
+        r = self.reserve({"type": "hotel", "provider_quote_id": "q_ht"})
+        self.assert_status(400, self.checkout, r["reservation_id"], 4999.99, "INR")
+        self.assert_status(400, self.checkout, r["reservation_id"], 5000, "USD")
+        self.assertEqual(self.db.count("payments"), 0)
+
+    def test_booking_reindexes_the_trip(self):
+        r = self.reserve({"type": "hotel", "provider_quote_id": "q_ht"})
+        self.db.collection("payments").document("pay_1").set({"user_id": "u1", "status": "succeeded", "amount": 5000, "currency": "INR"})
+        body = BookingCreateRequest(itinerary_id="it1", reservation_id=r["reservation_id"], payment_id="pay_1",
+                                    service_type="hotel", service_details={})
+        with mock.patch("core.search.index_trip") as index_trip:
+            asyncio.run(create_booking(body, current_user=USER))
+        index_trip.assert_called_once()
+        itinerary_id, doc = index_trip.call_args.args
+        self.assertEqual((itinerary_id, doc["status"], doc["user_id"]), ("it1", "booked", "u1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
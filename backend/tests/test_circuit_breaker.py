@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+import httpx
+
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError, http_failure, OPEN, CLOSED
+
+
+def status_error(code):
+    request = httpx.Request("GET", "https://provider.test/")
+    return httpx.HTTPStatusError(f"{code}", request=request, response=httpx.Response(code, request=request))
+
+
+class HttpFailureTest(unittest.TestCase):
+    def call(self, breaker, exc):
+        async def run():
+            async with breaker.guard(httpx.HTTPError, is_failure=http_failure):
+                raise exc
+        with self.assertRaises(type(exc)):
+            asyncio.run(run())
+
+    def test_client_errors_do_not_open_the_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        for code in (400, 404, 404):
+            self.call(breaker, status_error(code))
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+    def test_server_errors_and_timeouts_open_the_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        self.call(breaker, status_error(503))
+        self.call(breaker, httpx.ReadTimeout("timed out"))
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_classification(self):
+        self.assertTrue(http_failure(httpx.ConnectError("refused")))
+        self.assertTrue(http_failure(status_error(500)))
+        self.assertFalse(http_failure(status_error(429)))
+        self.assertFalse(http_failure(httpx.DecodingError("bad gzip")))
+
+
+if __name__ == "__main__":
+    unittest.main()
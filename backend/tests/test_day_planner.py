@@ -0,0 +1,121 @@
+import asyncio
+import os
+import shutil
+import unittest
+from datetime import date
+from unittest import mock
+
+from fastapi import HTTPException
+
+import core.firebase
+from core import cdc, local_store
+from core.day_planner import plan_days, two_opt, insert_activity, ACTIVITY_BUDGET_SHARE
+
+ANCHOR = {"lat": 15.50, "lng": 73.80}
+
+
+def act(id, lat, lng, cost=0, duration=60, score=0, name=None):
+    return {"id": id, "name": name or id, "lat": lat, "lng": lng, "estimated_cost": cost, "duration_min": duration, "score": score}
+
+
+class PlanDaysTest(unittest.TestCase):
+    def test_budget_and_coordinates_limit_the_plan(self):
+        candidates = [act("a", 15.51, 73.81, cost=500, score=3), act("b", 15.52, 73.82, cost=400, score=2),
+                      act("c", 15.53, 73.83, cost=300, score=1), {"id": "nowhere", "estimated_cost": 10}]
+        plan = plan_days(candidates, 2, budget_in_inr=900, start_date=date(2026, 3, 1), anchor=ANCHOR)
+        scheduled = [a["id"] for d in plan["days"] for a in d["activities"]]
+        self.assertEqual(sorted(scheduled), ["a", "b"])
+        self.assertEqual(sorted(a["id"] for a in plan["unscheduled"]), ["c", "nowhere"])
+        self.assertEqual(plan["total_cost"], 900)
+        self.assertEqual([d["date"] for d in plan["days"]], ["2026-03-01", "2026-03-02"])
+
+    def test_days_respect_the_time_limit(self):
+        candidates = [act(f"a{i}", 15.50 + i / 1000, 73.80, duration=120) for i in range(6)]
+        plan = plan_days(candidates, 2, anchor=ANCHOR, day_minutes=300)
+        for day in plan["days"]:
+            self.assertLessEqual(day["busy_min"], 300)
+        self.assertEqual(sum(len(d["activities"]) for d in plan["days"]) + len(plan["unscheduled"]), 6)
+        self.assertTrue(plan["unscheduled"])
+
+
+class TwoOptTest(unittest.TestCase):
+    def test_uncrosses_a_path(self):
+        # 0 -> 2 -> 1 -> 3 along a line crosses itself; the best open path visits in order
+        points = [0, 1, 2, 3]
+        dist = [[abs(a - b) for b in points] for a in points]
+        self.assertEqual(two_opt(dist, 0, [2, 1, 3]), [1, 2, 3])
+
+    def test_keeps_an_optimal_path(self):
+        points = [0, 1, 2, 3]
+        dist = [[abs(a - b) for b in points] for a in points]
+        self.assertEqual(two_opt(dist, 0, [1, 2, 3]), [1, 2, 3])
+
+
+class InsertActivityTest(unittest.TestCase):
+    def test_cheapest_position(self):
+        days = [{"day": 1, "activities": [act("a", 15.50, 73.81), act("c", 15.50, 73.83)]}]
+        self.assertEqual(insert_activity(days, act("b", 15.50, 73.82), anchor=ANCHOR), 0)
+        self.assertEqual([a["id"] for a in days[0]["activities"]], ["a", "b", "c"])
+
+    def test_without_coordinates_goes_to_the_least_busy_day(self):
+        days = [{"day": 1, "activities": [act("a", 15.5, 73.8)]}, {"day": 2, "activities": []}]
+        self.assertEqual(insert_activity(days, {"id": "x"}), 1)
+
+    def test_full_days_fall_back_to_the_least_busy_day(self):
+        days = [{"day": 1, "activities": [act("a", 15.5, 73.8, duration=400)]},
+                {"day": 2, "activities": [act("b", 15.5, 73.8, duration=300), act("c", 15.5, 73.8, duration=100)]}]
+        self.assertEqual(insert_activity(days, act("d", 15.5, 73.8, duration=120), anchor=ANCHOR, day_minutes=480), 0)
+
+
+class ReplanTest(unittest.TestCase):
+    def setUp(self):
+        cdc.CDC_ENABLED = False
+        # replan runs in a transaction, which the local store supports
+        self.db = local_store.temporary_store()
+        self.previous, core.firebase.db = core.firebase.db, self.db
+
+    def tearDown(self):
+        core.firebase.db = self.previous
+        self.db.close()
+        shutil.rmtree(os.path.dirname(self.db.path))
+
+    def replan(self, **body):
+        from api.trips import replan_trip, ReplanRequest
+
+        with mock.patch("core.search.index_trip"):
+            return asyncio.run(replan_trip("it1", ReplanRequest(**body), current_user={"uid": "u1"}))
+
+    def store(self, activities, **doc):
+        self.db.collection("itineraries").document("it1").set({
+            "user_id": "u1", "summary": {"center": ANCHOR, "duration_days": 1, "days": [{"day": 1, "activities": activities}]},
+            "booking_options": {"activities": []}, **doc})
+
+    def test_custom_activities_without_ids_are_kept_apart(self):
+        self.store([{"name": "Cafe", "lat": 15.51, "lng": 73.81}, {"name": "Fort", "lat": 15.52, "lng": 73.82},
+                    {"name": "Cafe", "lat": 15.51, "lng": 73.81}])
+        result = self.replan()
+        self.assertEqual(sorted(a["name"] for a in result["days"][0]["activities"]), ["Cafe", "Fort"])
+
+    def test_budget_falls_back_to_the_stored_trip_budget(self):
+        self.store([act("a", 15.51, 73.81, cost=200, score=2), act("b", 15.52, 73.82, cost=200, score=1)],
+                   request={"budget_in_inr": 300 / ACTIVITY_BUDGET_SHARE})
+        self.assertEqual([a["id"] for a in self.replan()["unscheduled"]], ["b"])
+
+        # an explicit budget is kept for the next replan
+        self.replan(budget_in_inr=1000)
+        stored = self.db.collection("itineraries").document("it1").get().to_dict()
+        self.assertEqual(stored["summary"]["activity_budget_in_inr"], 1000)
+        self.assertEqual(self.replan()["unscheduled"], [])
+
+    def test_missing_and_foreign_itineraries(self):
+        from api.trips import replan_trip, ReplanRequest
+
+        self.store([])
+        for itinerary_id, uid, status in (("nope", "u1", 404), ("it1", "u2", 403)):
+            with self.assertRaises(HTTPException) as ctx:
+                asyncio.run(replan_trip(itinerary_id, ReplanRequest(), current_user={"uid": uid}))
+            self.assertEqual(ctx.exception.status_code, status)
+
+
+if __name__ == "__main__":
+    unittest.main()
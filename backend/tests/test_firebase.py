@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from core import firebase
+
+
+class InitBackoffTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (firebase.db, firebase.firebase_error, firebase._retry_at, firebase._retry_delay)
+        firebase.db, firebase._retry_at, firebase._retry_delay = None, 0.0, 0.0
+
+    def tearDown(self):
+        firebase.db, firebase.firebase_error, firebase._retry_at, firebase._retry_delay = self.saved
+
+    def failing_init(self):
+        return firebase._record_failure("Firebase", FileNotFoundError("/secrets/key.json not found"))
+
+    def test_failed_init_is_not_retried_until_the_backoff_passes(self):
+        with mock.patch.object(firebase, "init_firebase", side_effect=self.failing_init) as init:
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    firebase.get_db()
+            self.assertEqual(init.call_count, 1)
+            firebase._retry_at = 0.0
+            with self.assertRaises(Exception):
+                firebase.get_db()
+            self.assertEqual(init.call_count, 2)
+        self.assertEqual(firebase._retry_delay, 2 * firebase.FIREBASE_RETRY_SECONDS)
+
+    def test_health_does_not_expose_the_init_error(self):
+        import main
+
+        self.failing_init()
+        body = asyncio.run(main.health_check())
+        self.assertEqual((body["status"], body["firebase"]), ("degraded", "unavailable"))
+        self.assertNotIn("key.json", str(body))
+
+
+class ParseBatchIdsTest(unittest.TestCase):
+    def test_splits_and_dedupes(self):
+        self.assertEqual(firebase.parse_batch_ids(["a,b", " b ", "c,,a"]), ["a", "b", "c"])
+
+    def test_rejects_empty_and_oversized_batches(self):
+        for ids in ([" , "], [",".join(str(i) for i in range(firebase.MAX_BATCH_IDS + 1))]):
+            with self.assertRaises(ValueError):
+                firebase.parse_batch_ids(ids)
+
+    def test_duplicates_do_not_count_towards_the_limit(self):
+        ids = [",".join(str(i) for i in range(firebase.MAX_BATCH_IDS))] * 3
+        self.assertEqual(len(firebase.parse_batch_ids(ids)), firebase.MAX_BATCH_IDS)
+
+
+class BatchEndpointTest(unittest.TestCase):
+    def setUp(self):
+        from bench.fake_firestore import FakeFirestore
+
+        self.saved = firebase.db
+        firebase.db = FakeFirestore()
+        firebase.db.collection("reservations").document("r1").set({"user_id": "u1", "status": "pending_payment"})
+        firebase.db.collection("reservations").document("r2").set({"user_id": "u2", "status": "pending_payment"})
+
+    def tearDown(self):
+        firebase.db = self.saved
+
+    def test_reads_owned_missing_and_forbidden(self):
+        from api.reservations import batch_get_reservations
+
+        result = asyncio.run(batch_get_reservations(ids=["r1,r2", "r3"], current_user={"uid": "u1"}))
+        self.assertEqual([r["status"] for r in result["reservations"]], ["pending_payment"])
+        self.assertEqual((result["missing"], result["forbidden"]), (["r3"], ["r2"]))
+
+    def test_bad_ids_are_a_400(self):
+        from fastapi import HTTPException
+        from api.payments import batch_get_payments
+
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(batch_get_payments(ids=[" , "], current_user={"uid": "u1"}))
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
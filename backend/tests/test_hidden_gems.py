@@ -0,0 +1,91 @@
+import asyncio
+import math
+import unittest
+from unittest import mock
+
+import core.firebase
+from core.geo import geohash_encode, geohash_bounds, geohash_cover, haversine_km
+from bench.fake_firestore import FakeFirestore
+from api import hidden_gems
+from api.hidden_gems import (gems_near, add_hidden_gem, update_hidden_gem, delete_hidden_gem,
+                             HiddenGemCreateRequest, HiddenGemUpdateRequest, Location, RegionIndex)
+
+USER = {"uid": "u1"}
+CENTER = (15.5, 73.8)
+
+
+class GeohashTest(unittest.TestCase):
+    def test_encode_and_bounds(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds("u4pruydqqvj")
+        self.assertTrue(lat_lo <= 57.64911 < lat_hi and lng_lo <= 10.40744 < lng_hi)
+
+    def test_cover_contains_the_whole_circle(self):
+        for lat, lng, radius_m in ((15.5, 73.8, 2000), (60.0, 10.0, 40000), (0.0, 179.99, 5000)):
+            cover = geohash_cover(lat, lng, radius_m)
+            for step in range(36):
+                # points just inside the circle, every 10 degrees of bearing
+                d = radius_m * 0.999 / 1000 / 111.32
+                p_lat = lat + d * math.cos(math.radians(step * 10))
+                p_lng = lng + d * math.sin(math.radians(step * 10)) / math.cos(math.radians(lat))
+                p_lng = (p_lng + 180.0) % 360.0 - 180.0
+                gh = geohash_encode(p_lat, p_lng)
+                self.assertTrue(any(gh.startswith(prefix) for prefix in cover), (lat, lng, step))
+
+
+class GemsNearTest(unittest.TestCase):
+    def setUp(self):
+        self.db = core.firebase.db = FakeFirestore()
+        self.regions = mock.patch.object(hidden_gems, "_regions", RegionIndex())
+        self.regions.start()
+        self.search = mock.patch.multiple("core.search", index_gem=mock.DEFAULT, remove=mock.DEFAULT)
+        self.search.start()
+
+    def tearDown(self):
+        self.regions.stop()
+        self.search.stop()
+
+    def put(self, gem_id, lat, lng):
+        location = {"latitude": lat, "longitude": lng}
+        self.db.collection("hidden_gems").document(gem_id).set({
+            "id": gem_id, "name": gem_id, "location": location, "geohash": hidden_gems.gem_geohash(location),
+            "submitted_by_user_id": "u1"})
+
+    def near(self, radius_m=2000):
+        return [g["id"] for g in asyncio.run(gems_near(*CENTER, radius_m))]
+
+    def test_radius_filter_and_order(self):
+        self.put("far", 15.52, 73.80)     # ~2.2 km
+        self.put("near", 15.501, 73.80)   # ~110 m
+        self.put("mid", 15.51, 73.80)     # ~1.1 km
+        self.assertEqual(self.near(), ["near", "mid"])
+        self.assertEqual(self.near(3000), ["near", "mid", "far"])
+
+    def test_dense_cell_is_read_by_children(self):
+        # the far corner of the centre cell fills the scan limit before the near gem
+        for i in range(5):
+            self.put(f"crowd{i}", 15.46975 + i * 1e-4, 73.78518)
+        self.put("near", 15.501, 73.80)
+        with mock.patch.object(hidden_gems, "NEAR_SCAN_LIMIT", 3):
+            self.assertEqual(self.near(), ["near"])
+            self.assertIs(hidden_gems._regions.get(geohash_encode(*CENTER, 5)), hidden_gems.DENSE_CELL)
+            self.assertEqual(self.near(), ["near"])  # served from the marker and the child cells
+
+    def test_writes_invalidate_hot_cells(self):
+        self.assertEqual(self.near(), [])
+        body = HiddenGemCreateRequest(name="Cove", description="", category="nature", location=Location(latitude=15.501, longitude=73.80))
+        gem_id = asyncio.run(add_hidden_gem(body, current_user=USER))["gem_id"]
+        self.assertEqual(self.near(), [gem_id])
+
+        moved = HiddenGemUpdateRequest(location=Location(latitude=15.60, longitude=73.80))
+        asyncio.run(update_hidden_gem(gem_id, moved, current_user=USER))
+        self.assertEqual(self.near(), [])
+        asyncio.run(update_hidden_gem(gem_id, HiddenGemUpdateRequest(location=Location(latitude=15.501, longitude=73.80)), current_user=USER))
+        self.assertEqual(self.near(), [gem_id])
+
+        asyncio.run(delete_hidden_gem(gem_id, current_user=USER))
+        self.assertEqual(self.near(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
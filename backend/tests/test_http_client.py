@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+from core import http_client
+from api import trips
+
+
+class SharedClientTest(unittest.TestCase):
+    def test_one_client_per_loop_until_closed(self):
+        async def scenario():
+            first = http_client.http_client()
+            self.assertIs(http_client.http_client(), first)
+            await http_client.close_http_client()
+            self.assertTrue(first.is_closed)
+            second = http_client.http_client()
+            self.assertIsNot(second, first)
+            return second
+
+        previous = asyncio.run(scenario())
+        # a new event loop gets its own client: connections cannot cross loops
+        async def other_loop():
+            client = http_client.http_client()
+            await http_client.close_http_client()
+            return client
+
+        self.assertIsNot(asyncio.run(other_loop()), previous)
+
+    def test_provider_calls_reuse_the_shared_client(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.params.get("q"))
+            return httpx.Response(200, json={"q": request.url.params.get("q")})
+
+        async def scenario():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with mock.patch.object(trips, "http_client", return_value=client) as shared:
+                results = [await trips.http_get_json("https://provider.test/search", params={"q": q}, dependency="test")
+                           for q in ("a", "b")]
+            self.assertEqual(shared.call_count, 2)
+            self.assertFalse(client.is_closed)
+            await client.aclose()
+            return results
+
+        self.assertEqual(asyncio.run(scenario()), [{"q": "a"}, {"q": "b"}])
+        self.assertEqual(calls, ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
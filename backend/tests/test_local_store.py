@@ -0,0 +1,50 @@
+import os
+import shutil
+import unittest
+
+from core import firebase, local_store
+from core.queries import query
+
+INDEXED_QUERIES = [
+    ("reservation_by_idempotency_key", {"idempotency_key": "k5"}, "ix_idempotency_key"),
+    ("itinerary_by_generation_job", {"generation_job_id": "j5"}, "ix_generation_job_id"),
+    ("itineraries_by_status_in", {"status": ["failed"]}, "ix_status"),
+    ("itineraries_by_user", {"user_id": "u1"}, "ix_user_id_created_at"),
+]
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.store = local_store.temporary_store()
+        self.previous, firebase.db = firebase.db, self.store
+
+    def tearDown(self):
+        firebase.db = self.previous
+        self.store.close()
+        shutil.rmtree(os.path.dirname(self.store.path))
+
+    def assertUsesIndexes(self):
+        for name, values, index in INDEXED_QUERIES:
+            sql, params = query(name, **values)._sql()
+            plan = " ".join(row[-1] for row in self.store._conn().execute("EXPLAIN QUERY PLAN " + sql, params))
+            self.assertIn(f"USING INDEX {index}", plan, name)
+
+    def test_empty_store_prefers_field_indexes(self):
+        self.assertUsesIndexes()
+
+    def test_analyzed_store_prefers_field_indexes(self):
+        batch = self.store.batch()
+        for i in range(3000):
+            batch.set(self.store.collection("itineraries").document(f"it{i}"), {
+                "user_id": f"u{i % 50}", "status": ("upcoming", "booked", "failed")[i % 3],
+                "generation": {"job_id": f"j{i}"}, "created_at": i})
+            batch.set(self.store.collection("reservations").document(f"r{i}"), {
+                "user_id": f"u{i % 50}", "idempotency_key": f"k{i}", "created_at": i})
+        batch.commit()
+        self.store.analyze()
+        self.assertUsesIndexes()
+        self.assertEqual(len(query("itineraries_by_status_in", status=["failed"]).get()), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
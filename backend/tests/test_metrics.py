@@ -0,0 +1,119 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from core import metrics
+
+
+class RenderTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_and_gauge_lines(self):
+        counter = self.registry.counter("jobs_total", "Jobs run", ("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind='say "hi"\n')
+        gauge = self.registry.gauge("queue_depth", "Queued jobs")
+        gauge.set(4)
+        gauge.dec(1.5)
+        self.assertEqual(self.registry.render().splitlines(), [
+            "# HELP jobs_total Jobs run",
+            "# TYPE jobs_total counter",
+            'jobs_total{kind="a"} 1',
+            'jobs_total{kind="say \\"hi\\"\\n"} 2',
+            "# HELP queue_depth Queued jobs",
+            "# TYPE queue_depth gauge",
+            "queue_depth 2.5",
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.5, 0.1))
+        for value in (0.05, 0.2, 0.3, 2.0):
+            histogram.observe(value, route="/x")
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{route="/x",le="0.1"} 1',
+            'latency_seconds_bucket{route="/x",le="0.5"} 3',
+            'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+            'latency_seconds_sum{route="/x"} 2.55',
+            'latency_seconds_count{route="/x"} 4',
+        ])
+
+    def test_registering_a_name_twice_returns_the_same_metric(self):
+        first = self.registry.counter("hits_total", "Hits")
+        self.assertIs(self.registry.counter("hits_total", "Hits"), first)
+        self.assertEqual(self.registry.render().count("# TYPE hits_total"), 1)
+
+
+class InstrumentationTest(unittest.TestCase):
+    def count(self, dependency, operation, outcome):
+        series = metrics.DEPENDENCY_LATENCY._series.get((dependency, operation, outcome))
+        return series[-1] if series else 0
+
+    def test_track_dependency_records_the_outcome(self):
+        ok, error = self.count("test", "op", "ok"), self.count("test", "op", "error")
+        with metrics.track_dependency("test", "op"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.track_dependency("test", "op"):
+                raise ValueError("boom")
+        self.assertEqual((self.count("test", "op", "ok"), self.count("test", "op", "error")), (ok + 1, error + 1))
+
+    def test_wrapped_methods_are_timed_once(self):
+        class Ref:
+            def get(self):
+                return "doc"
+
+            def stream(self):
+                yield from (1, 2)
+
+        metrics._wrap(Ref, "get", "test.get")
+        metrics._wrap(Ref, "get", "test.get")
+        metrics._wrap(Ref, "stream", "test.stream", streaming=True)
+        self.assertEqual(Ref().get(), "doc")
+        stream = Ref().stream()
+        # a stream is timed while it is consumed
+        self.assertEqual(self.count("firestore", "test.stream", "ok"), 0)
+        self.assertEqual(list(stream), [1, 2])
+        self.assertEqual(self.count("firestore", "test.get", "ok"), 1)
+        self.assertEqual(self.count("firestore", "test.stream", "ok"), 1)
+
+    def test_cache_results(self):
+        before = metrics.CACHE_REQUESTS.value(cache="test", result="miss")
+        metrics.record_cache("test", hit=False)
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache="test", result="miss"), before + 1)
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def get(self, path, **kwargs):
+        import httpx
+        import main
+
+        async def request():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                return await client.get(path, **kwargs)
+        return asyncio.run(request())
+
+    def count(self, method, route, status):
+        series = metrics.REQUEST_LATENCY._series.get((method, route, str(status)))
+        return series[-1] if series else 0
+
+    def test_requests_are_labelled_by_route_template(self):
+        root, unmatched = self.count("GET", "/", 200), self.count("GET", "unmatched", 404)
+        self.get("/")
+        self.get("/no/such/route/123")
+        self.assertEqual(self.count("GET", "/", 200), root + 1)
+        self.assertEqual(self.count("GET", "unmatched", 404), unmatched + 1)
+        body = self.get("/metrics").text
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/",status="200"}', body)
+        self.assertIn("http_requests_in_flight", body)
+
+    def test_metrics_token(self):
+        with mock.patch.dict(os.environ, {"METRICS_TOKEN": "s3cret"}):
+            self.assertEqual(self.get("/metrics").status_code, 401)
+            response = self.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from core import pricing
+
+FX_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fx_rates.json")
+
+
+def use_fixture_rates():
+    pricing._table = pricing._load_file(FX_FIXTURE)
+
+
+class ToMinorTest(unittest.TestCase):
+    def test_two_decimal_currencies_round_half_up(self):
+        self.assertEqual(pricing.to_minor(19.999, "USD"), 2000)
+        self.assertEqual(pricing.to_minor(0.005, "INR"), 1)
+        self.assertEqual(pricing.to_minor("12.34", "eur"), 1234)
+
+    def test_float_repr_is_not_truncated(self):
+        # int(0.29 * 100) == 28
+        self.assertEqual(pricing.to_minor(0.29, "USD"), 29)
+
+    def test_zero_decimal_currencies(self):
+        self.assertEqual(pricing.to_minor(1234.5, "JPY"), 1235)
+        self.assertEqual(pricing.to_minor(1000, "KRW"), 1000)
+
+    def test_rejects_non_finite(self):
+        with self.assertRaises(ValueError):
+            pricing.to_minor(float("nan"), "USD")
+
+
+class PriceItemsTest(unittest.TestCase):
+    def setUp(self):
+        use_fixture_rates()
+
+    def test_same_currency_total_is_exact(self):
+        priced = pricing.price_items([(0.1, "INR"), (0.2, "INR")])
+        self.assertEqual(priced["currency"], "INR")
+        self.assertEqual(priced["total"], Decimal("0.30"))
+        self.assertEqual(priced["total_minor"], 30)
+        self.assertIsNone(priced["fx"])
+
+    def test_mixed_currencies_fall_back_to_pricing_currency(self):
+        priced = pricing.price_items([(10, "USD"), (5, "EUR"), (200, "INR")])
+        self.assertEqual(priced["currency"], pricing.PRICING_CURRENCY)
+        # 10 USD = 800 INR, 5 EUR = 500 INR
+        self.assertEqual(priced["total"], Decimal("1500.00"))
+        self.assertEqual([line["converted"] for line in priced["lines"]], [Decimal("800.00"), Decimal("500.00"), Decimal("200.00")])
+        self.assertEqual(priced["fx"]["as_of"], "2026-01-01")
+
+    def test_explicit_zero_decimal_target(self):
+        priced = pricing.price_items([(10, "USD"), (0.3, "INR")], "JPY")
+        # 10 USD = 1600 JPY, 0.3 INR = 0.6 JPY; rounded once on the total
+        self.assertEqual(priced["total"], Decimal("1601"))
+        self.assertEqual(priced["total_minor"], 1601)
+
+    def test_total_is_rounded_once(self):
+        priced = pricing.price_items([(0.004, "USD"), (0.004, "USD")], "USD")
+        self.assertEqual(priced["total_minor"], 1)
+
+    def test_common_currency_is_kept(self):
+        priced = pricing.price_items([(1, "usd"), (2.5, "USD")])
+        self.assertEqual((priced["currency"], priced["total_minor"]), ("USD", 350))
+
+    def test_unknown_currency(self):
+        with self.assertRaises(pricing.FXRateUnavailable):
+            pricing.price_items([(1, "XYZ")], "INR")
+
+
+class RateTableRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "fx_rates.json")
+        self.patches = [mock.patch.object(pricing, "FX_RATES_FILE", self.path),
+                        mock.patch.object(pricing, "FX_RATES_URL", "")]
+        for patch in self.patches:
+            patch.start()
+        pricing._table = None
+        pricing._retry_at = 0.0
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        pricing._table = None
+        pricing._retry_at = 0.0
+        shutil.rmtree(self.tmp)
+
+    def test_failed_initial_load_is_retried(self):
+        self.assertEqual(pricing.rate_table().source, "none")
+        shutil.copy(FX_FIXTURE, self.path)
+        # still inside the retry window
+        self.assertEqual(pricing.rate_table().source, "none")
+        pricing._retry_at = 0.0
+        self.assertEqual(pricing.rate_table().as_of, "2026-01-01")
+
+    def test_refresher_rereads_the_file_without_a_url(self):
+        shutil.copy(FX_FIXTURE, self.path)
+        self.assertEqual(pricing.rate_table().rates["USD"], Decimal("0.0125"))
+        with open(self.path, "w") as f:
+            f.write('{"base": "INR", "as_of": "2026-02-01", "rates": {"INR": 1, "USD": 0.01}}')
+        self.assertTrue(asyncio.run(pricing.refresh()))
+        self.assertEqual(pricing.rate_table().as_of, "2026-02-01")
+        self.assertEqual(pricing.rate_table().rates["USD"], Decimal("0.01"))
+
+    def test_failed_reload_keeps_the_current_table(self):
+        shutil.copy(FX_FIXTURE, self.path)
+        pricing.rate_table()
+        os.remove(self.path)
+        self.assertFalse(pricing.reload_file())
+        self.assertEqual(pricing.rate_table().as_of, "2026-01-01")
+
+
+class StaleRatesTest(unittest.TestCase):
+    def setUp(self):
+        use_fixture_rates()
+
+    def test_stale_table_refuses_conversion(self):
+        with mock.patch.object(pricing, "FX_MAX_AGE_HOURS", 24):
+            with self.assertRaises(pricing.FXRateUnavailable):
+                pricing.price_items([(10, "USD"), (200, "INR")], "INR")
+            # no conversion needed
+            self.assertEqual(pricing.price_items([(200, "INR")])["total_minor"], 20000)
+
+    def test_no_max_age_never_goes_stale(self):
+        with mock.patch.object(pricing, "FX_MAX_AGE_HOURS", 0):
+            self.assertEqual(pricing.price_items([(10, "USD")], "INR")["total"], Decimal("800.00"))
+
+    def test_age_falls_back_to_load_time(self):
+        table = pricing.RateTable("INR", {"INR": Decimal(1)}, as_of="not a date")
+        self.assertFalse(table.is_stale(1))
+        self.assertTrue(pricing.RateTable("INR", {}, as_of="Fri, 27 Mar 2020 00:00:01 +0000").is_stale(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+import time
+import unittest
+from unittest import mock
+
+from core import profiler
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+class StackTableTest(unittest.TestCase):
+    def test_render_is_sorted_and_bounded(self):
+        table = profiler.StackTable(max_stacks=2)
+        table.add("a;b")
+        table.merge({"a;c": 3, "a;d": 1}, prefix="GET /x")
+        table.add("a;b", 3)
+        self.assertEqual(table.render(), "a;b 4\nGET /x;a;c 3\n[truncated] 1\n")
+        self.assertEqual(table.total(), 8)
+
+    def test_collapse_stack_is_root_first(self):
+        def inner():
+            return profiler.collapse_stack(sys._getframe())
+
+        stack = inner().split(";")
+        self.assertEqual(stack[-1], f"{__name__}:StackTableTest.test_collapse_stack_is_root_first.<locals>.inner")
+        self.assertEqual(stack[-2], f"{__name__}:StackTableTest.test_collapse_stack_is_root_first")
+
+
+class SamplingTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = profiler.Profiler()
+        self.profiler.enabled = True
+        self.profiler.interval = 0.001
+        self.profiler.slow_threshold = 0.0
+        self.profiler.block_threshold = 0.05
+        patch = mock.patch.object(profiler, "PROFILER", self.profiler)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def run_with_profiler(self, coro_fn):
+        async def main():
+            self.profiler.start()
+            try:
+                # let the heartbeat tick before measuring
+                await asyncio.sleep(0.01)
+                return await coro_fn()
+            finally:
+                self.profiler.stop()
+        return asyncio.run(main())
+
+    def test_samples_are_charged_to_the_request_on_the_loop(self):
+        async def busy():
+            with profiler.profile_request("GET", "/busy") as record:
+                record.route = "/busy/{id}"
+                spin(0.03)
+
+        async def waiting():
+            with profiler.profile_request("GET", "/waiting"):
+                await asyncio.sleep(0.03)
+
+        async def both():
+            await asyncio.gather(busy(), waiting())
+
+        self.run_with_profiler(both)
+        slow = {r["route"]: r for r in self.profiler.slow_requests}
+        self.assertEqual(set(slow), {"GET /busy/{id}", "GET /waiting"})
+        self.assertGreater(slow["GET /busy/{id}"]["on_loop_ms"], 2 * slow["GET /waiting"]["on_loop_ms"])
+        stacks = self.profiler.slow_stacks.render()
+        self.assertIn("GET /busy/{id};", stacks)
+        self.assertIn(f"{__name__}:spin", stacks)
+
+    def test_fast_requests_are_not_kept(self):
+        self.profiler.slow_threshold = 10.0
+
+        async def fast():
+            with profiler.profile_request("GET", "/fast"):
+                spin(0.01)
+
+        self.run_with_profiler(fast)
+        self.assertEqual((list(self.profiler.slow_requests), self.profiler.slow_stacks.total()), ([], 0))
+
+    def test_disabled_profiler_does_not_track_requests(self):
+        self.profiler.enabled = False
+        with profiler.profile_request("GET", "/x") as record:
+            self.assertIsNone(record)
+
+    def test_a_stall_is_logged_once(self):
+        before = profiler.LOOP_BLOCKS.value()
+
+        async def stall():
+            block_loop(0.2)
+            await asyncio.sleep(0.02)
+
+        with self.assertLogs("core.profiler", "WARNING") as logs:
+            self.run_with_profiler(stall)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(profiler.LOOP_BLOCKS.value(), before + 1)
+        (block,) = self.profiler.blocks
+        self.assertGreaterEqual(block["blocked_ms"], 50)
+        self.assertTrue(block["stack"].endswith(f"{__name__}:block_loop"))
+        self.assertGreater(self.profiler.blocked_stacks.total(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import time
+import unittest
+
+from fastapi import HTTPException
+
+from core import rate_limit
+
+
+class ProviderPacingTest(unittest.TestCase):
+    def tearDown(self):
+        rate_limit._pacers.pop("paced", None)
+        rate_limit._semaphores.pop("paced", None)
+
+    def test_nominatim_is_paced_to_one_request_per_second(self):
+        self.assertEqual(rate_limit.PROVIDER_RATE["nominatim"], 1.0)
+
+    def test_calls_are_spaced_by_the_rate(self):
+        rate_limit._pacers["paced"] = rate_limit.TokenBucket(20.0, 1.0)
+
+        async def run():
+            started = time.monotonic()
+            for _ in range(3):
+                async with rate_limit.provider_slot("paced"):
+                    pass
+            return time.monotonic() - started
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+    def test_wait_past_the_timeout_is_503_and_frees_the_slot(self):
+        rate_limit._pacers["paced"] = rate_limit.TokenBucket(1.0, 1.0)
+
+        async def run():
+            rate_limit._semaphores["paced"] = asyncio.Semaphore(1)
+            async with rate_limit.provider_slot("paced", timeout=0.05):
+                pass
+            with self.assertRaises(HTTPException) as ctx:
+                async with rate_limit.provider_slot("paced", timeout=0.05):
+                    pass
+            self.assertEqual(ctx.exception.status_code, 503)
+            self.assertFalse(rate_limit._semaphores["paced"].locked())
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from core import search
+
+
+class MatchExpressionTest(unittest.TestCase):
+    def test_terms_become_quoted_prefixes(self):
+        self.assertEqual(search.match_expression('Kyo "temp" OR c++'), '"kyo"* "temp"* "or"* "c"*')
+
+    def test_no_terms(self):
+        self.assertIsNone(search.match_expression(" -*- "))
+        self.assertIsNone(search.match_expression(None))
+
+    def test_term_count_is_capped(self):
+        self.assertEqual(search.match_expression(" ".join(f"t{i}" for i in range(20))).count("*"), search.MAX_TERMS)
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index = search.SearchIndex(os.path.join(self.tmp, "search.sqlite3"))
+        gems = [
+            ("g1", "Kyoto temples at dawn", "Quiet walk past the shrines", "culture"),
+            ("g2", "Night market", "Street food near Kyoto station", "food"),
+            ("g3", "Café Kyōto", "Tiny coffee bar", "food"),
+            ("g4", "Lisbon trams", "Ride tram 28", "culture"),
+        ]
+        for doc_id, title, body, category in gems:
+            self.index.upsert("gems", doc_id, title, body, themes=[category], category=category)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def ids(self, result):
+        return [r["id"] for r in result["results"]]
+
+    def test_prefix_terms_and_diacritics(self):
+        self.assertEqual(self.ids(self.index.search("gems", "kyo temp")), ["g1"])
+        self.assertEqual(self.ids(self.index.search("gems", "cafe kyoto")), ["g3"])
+
+    def test_title_matches_rank_above_body_matches(self):
+        result = self.index.search("gems", "kyoto")
+        self.assertEqual(set(self.ids(result)), {"g1", "g2", "g3"})
+        self.assertEqual(self.ids(result)[-1], "g2")
+        self.assertEqual(result["results"][-1]["snippet"], "Street food near Kyoto station")
+
+    def test_facets_count_the_full_match_set(self):
+        result = self.index.search("gems", "kyoto", limit=1)
+        self.assertEqual((result["total"], len(result["results"])), (3, 1))
+        self.assertEqual(result["facets"]["category"], {"food": 2, "culture": 1})
+        self.assertEqual(result["facets"]["theme"], {"food": 2, "culture": 1})
+
+    def test_filters_narrow_results_and_facets(self):
+        result = self.index.search("gems", "kyoto", filters={"theme": "FOOD"})
+        self.assertEqual(sorted(self.ids(result)), ["g2", "g3"])
+        self.assertEqual(result["facets"]["category"], {"food": 2})
+        self.assertEqual(self.ids(self.index.search("gems", "kyoto", filters={"category": "culture"})), ["g1"])
+
+    def test_owner_and_scope_limit_visibility(self):
+        self.index.upsert("trips", "t1", "Kyoto", "", owner="u1", status="draft")
+        self.index.upsert("trips", "t2", "Kyoto", "", owner="u2", status="draft")
+        self.index.upsert("comments", "c1", "", "see you in kyoto", scope="t1")
+        self.assertEqual(self.ids(self.index.search("trips", "kyoto", owner="u1")), ["t1"])
+        self.assertEqual(self.ids(self.index.search("comments", "kyoto", scope="t2")), [])
+        self.assertEqual(self.index.search("comments", "kyoto", scope="t1")["results"][0]["itinerary_id"], "t1")
+
+    def test_upsert_replaces_and_delete_removes(self):
+        self.index.upsert("gems", "g4", "Porto trams", "Ride tram 1", themes=["culture"], category="culture")
+        self.assertEqual(self.ids(self.index.search("gems", "lisbon")), [])
+        self.assertEqual(self.ids(self.index.search("gems", "porto")), ["g4"])
+        self.index.delete("gems", "g4")
+        self.assertEqual(self.index.search("gems", "tram")["total"], 0)
+        self.index.clear("gems")
+        self.assertEqual(self.index.search("gems", "kyoto")["total"], 0)
+
+    def test_trip_documents_are_searchable_by_activity(self):
+        trip = {"user_id": "u1", "status": "upcoming", "request": {"destination": "Goa", "themes": ["Beach"]},
+                "summary": {"days": [{"activities": [{"name": "Dudhsagar waterfall"}]}]}}
+        self.index.upsert("trips", "t1", **search.trip_fields(trip))
+        (hit,) = self.index.search("trips", "waterfall", owner="u1")["results"]
+        self.assertEqual((hit["title"], hit["status"], hit["themes"]), ("Goa", "upcoming", ["beach"]))
+
+
+class SearchEndpointTest(unittest.TestCase):
+    def call(self, **kwargs):
+        from api.search import search as endpoint
+
+        params = {"kind": "trips", "itinerary_id": None, "category": None, "status": None, "theme": None,
+                  "limit": 20, "offset": 0, "current_user": {"uid": "u1"}}
+        params.update(kwargs)
+        return asyncio.run(endpoint(**params))
+
+    def test_comments_need_an_itinerary(self):
+        with self.assertRaises(HTTPException) as ctx:
+            self.call(q="hi", kind="comments")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_unavailable_index_is_a_503(self):
+        with mock.patch.object(search, "get_index", side_effect=search.SearchUnavailable("locked")):
+            with self.assertRaises(HTTPException) as ctx:
+                self.call(q="kyoto")
+        self.assertEqual(ctx.exception.status_code, 503)
+
+    def test_trips_are_searched_as_the_caller(self):
+        with mock.patch.object(search, "search", return_value={"total": 0, "results": [], "facets": {}}) as fn:
+            self.call(q="kyoto")
+        self.assertEqual((fn.call_args.kwargs["owner"], fn.call_args.kwargs["scope"]), ("u1", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
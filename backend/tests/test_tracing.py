@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from core import tracing
+
+
+class ListExporter:
+    def __init__(self):
+        self.records = []
+
+    def export(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class FileExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "traces.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def lines(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_export_only_queues(self):
+        exporter = tracing.FileExporter(self.path, flush_seconds=60)
+        exporter.export({"name": "a"})
+        self.assertEqual(self.lines(), [])
+        exporter.close()
+        self.assertEqual(self.lines(), [{"name": "a"}])
+
+    def test_writer_thread_flushes_on_its_interval(self):
+        exporter = tracing.FileExporter(self.path, flush_seconds=0.05)
+        for i in range(3):
+            exporter.export({"n": i})
+        deadline = time.monotonic() + 2
+        while len(self.lines()) < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual([line["n"] for line in self.lines()], [0, 1, 2])
+        exporter.close()
+
+    def test_full_buffer_drops_new_spans(self):
+        exporter = tracing.FileExporter(self.path, flush_seconds=60, max_buffer=2)
+        # keep the writer asleep so the queue stays full
+        exporter._cond.notify = lambda: None
+        for i in range(4):
+            exporter.export({"n": i})
+        self.assertEqual(exporter.dropped, 2)
+        del exporter._cond.notify
+        exporter.close()
+        self.assertEqual([line["n"] for line in self.lines()], [0, 1])
+        exporter.export({"n": 4})
+        self.assertEqual(exporter.dropped, 3)
+
+
+class SharedExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = tracing._exporter
+        self.exporter = ListExporter()
+        tracing.set_exporter(self.exporter)
+
+    def tearDown(self):
+        tracing.set_exporter(self.saved)
+
+    def test_spans_and_agent_tool_spans_share_the_exporter(self):
+        from agents.tracing import traced_tool, trace_headers
+
+        @traced_tool
+        def tool():
+            return trace_headers()["traceparent"]
+
+        with tracing.start_span("GET /x", kind="server") as span:
+            span.set_attribute("http.status_code", 200)
+        traceparent = tool()
+
+        api, agent = self.exporter.records
+        self.assertEqual((api["name"], api["attributes"]), ("GET /x", {"http.status_code": 200}))
+        self.assertEqual(agent["name"], "tool tool")
+        self.assertEqual(traceparent, f"00-{agent['trace_id']}-{agent['span_id']}-01")
+
+
+if __name__ == "__main__":
+    unittest.main()
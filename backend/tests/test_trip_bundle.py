@@ -0,0 +1,98 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from api import trip_bundle
+
+TRIP = {"user_id": "u1", "summary": {"destination": "Goa"}}
+
+
+class TripBundleTest(unittest.TestCase):
+    def setUp(self):
+        self.cancelled = []
+        self.release_weather = None
+
+        async def weather(doc_ref, it):
+            try:
+                await self.release_weather.wait()
+            except asyncio.CancelledError:
+                self.cancelled.append("weather")
+                raise
+            return {"daily": []}
+
+        async def hidden_gems(it, filter=None, radius_m=None):
+            raise HTTPException(status_code=503, detail="Places unavailable")
+
+        self.patches = [
+            mock.patch.object(trip_bundle, "load_owned_itinerary", return_value=("ref", TRIP)),
+            mock.patch.object(trip_bundle, "resolve_trip_weather", weather),
+            mock.patch.object(trip_bundle, "resolve_hidden_gems", hidden_gems),
+            mock.patch.object(trip_bundle, "list_itinerary_comments", return_value=[{"text": "hi"}]),
+            mock.patch.object(trip_bundle, "list_itinerary_votes", side_effect=RuntimeError("boom")),
+            mock.patch.object(trip_bundle, "list_itinerary_group_members", return_value=[]),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def bundle(self, **kwargs):
+        return trip_bundle.get_trip_bundle("it1", current_user={"uid": "u1"}, filter=None, radius_m=5000, **kwargs)
+
+    def test_streams_parts_in_completion_order(self):
+        async def run():
+            self.release_weather = asyncio.Event()
+            response = await self.bundle(include="weather,itinerary,hidden_gems,votes", stream=True)
+            lines = []
+            async for chunk in response.body_iterator:
+                lines.append(json.loads(chunk))
+                if len(lines) == 3:
+                    self.release_weather.set()
+            return response, lines
+
+        with self.assertLogs("api.trip_bundle", "ERROR"):
+            response, lines = asyncio.run(run())
+        self.assertEqual(response.media_type, "application/x-ndjson")
+        self.assertEqual(lines[-1], {"part": "weather", "success": True, "data": {"daily": []}})
+        by_part = {line["part"]: line for line in lines}
+        self.assertEqual(by_part["itinerary"]["data"], TRIP)
+        self.assertEqual((by_part["hidden_gems"]["status_code"], by_part["hidden_gems"]["error"]), (503, "Places unavailable"))
+        self.assertEqual((by_part["votes"]["success"], by_part["votes"]["status_code"]), (False, 500))
+
+    def test_closing_the_stream_cancels_unfinished_parts(self):
+        async def run():
+            self.release_weather = asyncio.Event()
+            response = await self.bundle(include="itinerary,weather", stream=True)
+            first = await response.body_iterator.__anext__()
+            # the client disconnects while weather is still pending
+            await response.body_iterator.aclose()
+            await asyncio.sleep(0)
+            return json.loads(first)
+
+        first = asyncio.run(run())
+        self.assertEqual(first["part"], "itinerary")
+        self.assertEqual(self.cancelled, ["weather"])
+
+    def test_unstreamed_bundle_is_keyed_by_part(self):
+        async def run():
+            self.release_weather = asyncio.Event()
+            self.release_weather.set()
+            return await self.bundle(include="comments, weather,comments", stream=False)
+
+        result = asyncio.run(run())
+        self.assertEqual(sorted(result["parts"]), ["comments", "weather"])
+        self.assertEqual(result["parts"]["comments"], {"success": True, "data": [{"text": "hi"}]})
+
+    def test_unknown_part_is_rejected(self):
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(self.bundle(include="itinerary,photos"))
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
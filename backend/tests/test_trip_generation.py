@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import shutil
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fastapi import HTTPException
+
+import core.firebase
+from core import cdc, local_store
+from api import trip_generation
+from api.trip_generation import (TripCreateRequest, create_trip, get_generation_job, stream_generation_job,
+                                 shutdown_jobs, sweep_stale_generations, INTERRUPTED_ERROR)
+
+USER = {"uid": "u1"}
+GEMS = [{"id": f"g{i}", "name": f"Gem {i}", "lat": 15.5 + i / 100, "lng": 73.8, "tags": {"tourism": "museum"}} for i in range(4)]
+
+
+async def geocode(query):
+    return {"lat": 15.5, "lng": 73.8, "display_name": query}
+
+
+async def no_weather(lat, lng):
+    return {"daily": []}
+
+
+async def gems_near(lat, lng, filter=None):
+    return GEMS
+
+
+class TripGenerationTest(unittest.TestCase):
+    def setUp(self):
+        cdc.CDC_ENABLED = False
+        self.db = local_store.temporary_store()
+        self.previous, core.firebase.db = core.firebase.db, self.db
+        trip_generation._jobs.clear()
+        self.patches = [
+            mock.patch.object(trip_generation, "geocode", geocode),
+            mock.patch.object(trip_generation, "fetch_weather_for_latlng", no_weather),
+            mock.patch.object(trip_generation, "fetch_gems_near", gems_near),
+            mock.patch("core.search.index_trip"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        trip_generation._jobs.clear()
+        core.firebase.db = self.previous
+        self.db.close()
+        shutil.rmtree(os.path.dirname(self.db.path))
+
+    def itinerary(self, itinerary_id):
+        return self.db.collection("itineraries").document(itinerary_id).get().to_dict()
+
+    async def create(self, **body):
+        return await create_trip(TripCreateRequest(destination="Goa", duration_days=2, budget_in_inr=10000, **body), current_user=USER)
+
+    def test_pipeline_saves_the_itinerary(self):
+        async def scenario():
+            created = await self.create()
+            await trip_generation._jobs[created["job_id"]].task
+            return created
+
+        created = asyncio.run(scenario())
+        doc = self.itinerary(created["itinerary_id"])
+        self.assertEqual(doc["status"], "upcoming")
+        self.assertEqual(doc["generation"]["state"], "succeeded")
+        self.assertEqual(len(doc["summary"]["days"]), 2)
+        self.assertTrue(doc["booking_options"]["activities"])
+        self.assertIn("alternatives_topk", doc)
+
+    def test_missing_destination_fails_the_job(self):
+        async def not_found(query):
+            return None
+
+        async def scenario():
+            with mock.patch.object(trip_generation, "geocode", not_found):
+                created = await self.create()
+                await trip_generation._jobs[created["job_id"]].task
+            return created
+
+        created = asyncio.run(scenario())
+        doc = self.itinerary(created["itinerary_id"])
+        self.assertEqual(doc["status"], "failed")
+        self.assertIn("Could not geocode", doc["generation"]["error"])
+
+    def test_polling_falls_back_to_the_shared_cache_and_the_document(self):
+        async def scenario():
+            created = await self.create()
+            await trip_generation._jobs[created["job_id"]].task
+            job_id = created["job_id"]
+            local = (await get_generation_job(job_id, current_user=USER))["job"]
+            trip_generation._jobs.clear()  # another worker
+            shared = (await get_generation_job(job_id, current_user=USER))["job"]
+            await trip_generation._shared_jobs.adelete(job_id)
+            stored = (await get_generation_job(job_id, current_user=USER))["job"]
+            with self.assertRaises(HTTPException) as ctx:
+                await get_generation_job(job_id, current_user={"uid": "u2"})
+            self.assertEqual(ctx.exception.status_code, 403)
+            return local, shared, stored
+
+        local, shared, stored = asyncio.run(scenario())
+        self.assertEqual([s["state"] for s in (local, shared, stored)], ["succeeded"] * 3)
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(get_generation_job("job_missing", current_user=USER))
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_events_stream_until_the_job_finishes(self):
+        async def scenario():
+            created = await self.create()
+            response = await stream_generation_job(created["job_id"], current_user=USER)
+            return [json.loads(chunk[len("data: "):]) async for chunk in response.body_iterator]
+
+        events = asyncio.run(scenario())
+        self.assertEqual(events[-1]["state"], "succeeded")
+        done = {e["stage"] for e in events if e.get("stage_state") == "done"}
+        self.assertEqual(done, set(trip_generation.PIPELINE_STAGES))
+        self.assertEqual([e["seq"] for e in events], list(range(len(events))))
+
+    def test_shutdown_marks_unfinished_jobs_failed(self):
+        async def hang(query):
+            await asyncio.Event().wait()
+
+        async def scenario():
+            with mock.patch.object(trip_generation, "geocode", hang):
+                created = await self.create()
+                await asyncio.sleep(0.01)
+                await shutdown_jobs()
+            return created
+
+        created = asyncio.run(scenario())
+        doc = self.itinerary(created["itinerary_id"])
+        self.assertEqual(doc["status"], "failed")
+        self.assertEqual(doc["generation"]["error"], INTERRUPTED_ERROR)
+        self.assertEqual(trip_generation._jobs[created["job_id"]].state, "failed")
+
+    def test_sweep_fails_only_stale_generating_itineraries(self):
+        old, now = datetime.utcnow() - timedelta(hours=2), datetime.utcnow()
+        for itinerary_id, status, updated_at in (("stale", "generating", old), ("fresh", "generating", now), ("done", "upcoming", old)):
+            self.db.collection("itineraries").document(itinerary_id).set({
+                "user_id": "u1", "status": status, "updated_at": updated_at,
+                "generation": {"job_id": f"job_{itinerary_id}", "state": "running"}})
+        self.assertEqual(asyncio.run(sweep_stale_generations(30)), 1)
+        self.assertEqual([self.itinerary(i)["status"] for i in ("stale", "fresh", "done")], ["failed", "generating", "upcoming"])
+        self.assertEqual(self.itinerary("stale")["generation"]["state"], "failed")
+        self.assertEqual(asyncio.run(get_generation_job("job_stale", current_user=USER))["job"]["state"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
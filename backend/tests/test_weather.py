@@ -0,0 +1,29 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from api import trips
+
+
+class WeatherCellCacheTest(unittest.TestCase):
+    def test_cell_centres_map_to_themselves(self):
+        for lat, lng in [(15.4909, 73.8278), (-33.8688, 151.2093), (0.0, -0.05), (64.1466, -21.9426)]:
+            centre = trips.weather_cell(lat, lng)
+            self.assertEqual(trips.weather_cell(*centre), centre)
+
+    def test_points_in_one_cell_share_a_forecast(self):
+        cell = trips.weather_cell(15.42, 73.81)
+        trips._weather_cache.delete(f"{cell[0]},{cell[1]}")
+        payload = {"daily": [{"dt": 1767225600, "temp": {"min": 22, "max": 31}, "pop": 0.2}]}
+        with mock.patch.object(trips, "OPENWEATHER_API_KEY", "test"), \
+                mock.patch.object(trips, "http_get_json", mock.AsyncMock(return_value=payload)) as fetch:
+            first = asyncio.run(trips.fetch_weather_for_latlng(15.42, 73.81))
+            second = asyncio.run(trips.fetch_weather_for_latlng(15.48, 73.89))
+        fetch.assert_awaited_once()
+        params = fetch.call_args.kwargs["params"]
+        self.assertEqual((params["lat"], params["lon"]), cell)
+        self.assertEqual(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import core.firebase
+from core import write_behind
+from core.write_behind import WriteBehindBuffer, DROPPED, COALESCED
+from bench.fake_firestore import FakeFirestore
+
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.db = core.firebase.db = FakeFirestore()
+        for uid in ("u1", "u2", "u3"):
+            self.db.collection("users").document(uid).set({"logins": 0})
+
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_updates_to_one_document_coalesce_into_one_write(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(flush_ms=10_000)
+            coalesced = COALESCED.value()
+            buffer.defer("users", "u1", {"last_login": 1}, {"logins": 1})
+            buffer.defer("users", "u1", {"last_login": 2}, {"logins": 2})
+            with mock.patch.object(write_behind, "_commit", wraps=write_behind._commit) as commit:
+                await buffer.flush()
+            self.assertEqual(commit.call_count, 1)
+            self.assertEqual(len(commit.call_args[0][0]), 1)
+            self.assertEqual(COALESCED.value() - coalesced, 1)
+
+        self.run_async(scenario())
+        self.assertEqual(self.db.peek("users", "u1"), {"logins": 3, "last_login": 2})
+
+    def test_full_buffer_drops_new_documents(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(flush_ms=10_000, max_pending=1)
+            dropped = DROPPED.value(reason="full")
+            self.assertTrue(buffer.defer("users", "u1", {"a": 1}))
+            self.assertTrue(buffer.defer("users", "u1", {"b": 1}))  # same document still coalesces
+            self.assertFalse(buffer.defer("users", "u2", {"a": 1}))
+            self.assertEqual(DROPPED.value(reason="full") - dropped, 1)
+            await buffer.close()
+
+        self.run_async(scenario())
+        self.assertEqual(self.db.peek("users", "u1"), {"logins": 0, "a": 1, "b": 1})
+        self.assertNotIn("a", self.db.peek("users", "u2"))
+
+    def test_failed_update_is_retried_on_a_later_flush(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(flush_ms=20)
+            dropped = DROPPED.value(reason="error")
+            real_commit = write_behind._commit
+            failures = {"left": 2}  # the batch and the individual commit of one flush
+
+            def flaky(entries):
+                if failures["left"]:
+                    failures["left"] -= 1
+                    raise RuntimeError("unavailable")
+                return real_commit(entries)
+
+            with mock.patch.object(write_behind, "_commit", side_effect=flaky) as commit:
+                buffer.defer("users", "u1", {"last_login": 1})
+                await buffer.flush()
+                self.assertEqual(commit.call_count, 2)
+                self.assertEqual(buffer._held(), 1)
+                self.assertEqual(DROPPED.value(reason="error"), dropped)
+
+                await buffer.flush()  # not due yet
+                self.assertEqual(commit.call_count, 2)
+
+                buffer.defer("users", "u1", {"theme": "dark"})  # folds into the held retry
+                await asyncio.sleep(0.1)  # the scheduled retry commits it
+                self.assertEqual(buffer._held(), 0)
+            self.assertEqual(DROPPED.value(reason="error"), dropped)
+
+        self.run_async(scenario())
+        self.assertEqual(self.db.peek("users", "u1"), {"logins": 0, "last_login": 1, "theme": "dark"})
+
+    def test_update_is_dropped_after_max_attempts(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(flush_ms=10)
+            dropped = DROPPED.value(reason="error")
+            with mock.patch.object(write_behind, "_commit", side_effect=RuntimeError("unavailable")) as commit:
+                buffer.defer("users", "u1", {"last_login": 1})
+                await buffer.flush()
+                self.assertEqual(DROPPED.value(reason="error"), dropped)
+                await asyncio.sleep(0.2)
+            # one batch and one individual commit per attempt, each on its own flush
+            self.assertEqual(commit.call_count, 2 * write_behind.WRITE_BEHIND_MAX_ATTEMPTS)
+            self.assertEqual(DROPPED.value(reason="error") - dropped, 1)
+            self.assertEqual(buffer._held(), 0)
+
+        self.run_async(scenario())
+
+    def test_close_flushes_pending_and_held_entries(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(flush_ms=10_000)
+            buffer.defer("users", "u1", {"a": 1})
+            with mock.patch.object(write_behind, "_commit", side_effect=RuntimeError("unavailable")):
+                await buffer.flush()
+            buffer.defer("users", "u2", {"a": 2})
+            await buffer.close()
+            self.assertEqual(buffer._held(), 0)
+            # after close updates go straight through
+            self.assertTrue(buffer.defer("users", "u3", {"a": 3}))
+
+        self.run_async(scenario())
+        self.assertEqual([self.db.peek("users", uid).get("a") for uid in ("u1", "u2", "u3")], [1, 2, 3])
+
+    def test_awaited_writes_are_group_committed(self):
+        async def scenario():
+            buffer = WriteBehindBuffer(linger_ms=5)
+            with mock.patch.object(write_behind, "_commit", wraps=write_behind._commit) as commit:
+                await asyncio.gather(*(buffer.write("votes", f"v{i}", {"n": i}) for i in range(3)))
+            self.assertEqual(commit.call_count, 1)
+
+        self.run_async(scenario())
+        self.assertEqual(self.db.peek("votes", "v2"), {"n": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()